@@ -0,0 +1,117 @@
+"""背景资源索引：启动时预缩放，目录变化时增量刷新。"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import base64
+import hashlib
+import os
+import random
+import time
+
+from astrbot.api import logger
+
+from .imaging import prescale_background
+
+BG_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def seeded_choice(items: List[str], seed: str) -> str:
+    """按 seed 的哈希从 items 中确定性选择一项（与进程无关，不受 PYTHONHASHSEED 影响）。"""
+    idx = int(hashlib.sha1(seed.encode("utf-8")).hexdigest()[:8], 16) % len(items)
+    return items[idx]
+
+
+@dataclass
+class BackgroundAsset:
+    name: str
+    main_url: str
+    blur_url: str
+    nbytes: int
+
+
+class BackgroundIndex:
+    """background_dir 中每张图片预缩放到画布尺寸（contain）并预生成模糊底图，
+    以紧凑 JPEG data-url 常驻内存；渲染时直接取用，无需读盘/编码原图。
+
+    以目录 mtime 判断是否需要刷新；刷新时仅处理新增或变化的文件。
+    """
+
+    def __init__(self, dirp: str, width: int, height: int):
+        self.dirp = dirp
+        self.width = int(width)
+        self.height = int(height)
+        self._assets: Dict[str, Tuple[int, int, BackgroundAsset]] = {}
+        self._dir_mtime: Optional[int] = None
+        # 最近一次重建的耗时（秒），供指标统计
+        self.last_build_s = 0.0
+        self._lock = asyncio.Lock()
+
+    def _dir_changed(self) -> bool:
+        try:
+            return os.stat(self.dirp).st_mtime_ns != self._dir_mtime
+        except OSError:
+            return False
+
+    def _rebuild_sync(self) -> None:
+        t0 = time.perf_counter()
+        dir_mtime = os.stat(self.dirp).st_mtime_ns
+        files = [f for f in os.listdir(self.dirp) if f.lower().endswith(BG_EXTS)]
+        fresh: Dict[str, Tuple[int, int, BackgroundAsset]] = {}
+        for name in files:
+            fp = os.path.join(self.dirp, name)
+            try:
+                st = os.stat(fp)
+                old = self._assets.get(name)
+                if old and old[0] == st.st_mtime_ns and old[1] == st.st_size:
+                    fresh[name] = old
+                    continue
+                with open(fp, "rb") as f:
+                    main, blur = prescale_background(f.read(), self.width, self.height)
+                asset = BackgroundAsset(
+                    name=name,
+                    main_url="data:image/jpeg;base64," + base64.b64encode(main).decode("ascii"),
+                    blur_url="data:image/jpeg;base64," + base64.b64encode(blur).decode("ascii"),
+                    nbytes=len(main) + len(blur),
+                )
+                fresh[name] = (st.st_mtime_ns, st.st_size, asset)
+            except Exception as e:
+                logger.warning("[qqgal] prescale background failed: %s (%s)", name, e)
+        self._assets = fresh
+        self._dir_mtime = dir_mtime
+        self.last_build_s = time.perf_counter() - t0
+        logger.info(
+            "[qqgal] background index ready: %d images, %d KB",
+            len(fresh), sum(a.nbytes for _, _, a in fresh.values()) // 1024,
+        )
+
+    async def refresh(self, force: bool = False) -> None:
+        """目录有变化（或 force）时在线程中增量重建索引。"""
+        if not force and not self._dir_changed():
+            return
+        async with self._lock:
+            if not force and not self._dir_changed():
+                return
+            try:
+                await asyncio.to_thread(self._rebuild_sync)
+            except Exception:
+                logger.error("[qqgal] build background index failed", exc_info=True)
+
+    def total_bytes(self) -> int:
+        return sum(a.nbytes for _, _, a in self._assets.values())
+
+    def names(self) -> List[str]:
+        return sorted(self._assets)
+
+    def get(self, name: str) -> Optional[BackgroundAsset]:
+        ent = self._assets.get(name)
+        return ent[2] if ent else None
+
+    async def pick(self, seed: Optional[str] = None) -> Optional[BackgroundAsset]:
+        """随机选一张背景；给定 seed 时按其哈希确定性选择（相同文本总是同一张）。"""
+        await self.refresh()
+        if not self._assets:
+            return None
+        if seed is not None:
+            return self._assets[seeded_choice(self.names(), seed)][2]
+        return random.choice(list(self._assets.values()))[2]
@@ -0,0 +1,115 @@
+"""头像本地缓存：原图 + 112px 缩略图，按 TTL 与 ETag/Last-Modified 条件请求重新验证。
+
+avatars/ 目录结构：
+    <qq>.img            头像原图（生图参考用，保留原始格式）
+    <qq>-112.jpg        方形缩略图（渲染嵌入用）
+    index.json          qq -> 哈希、mime、校验头、最近验证时间
+
+网络请求由插件负责（共享 HTTP 会话），这里只做存储与新鲜度判断。
+"""
+
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+import json
+import os
+import time
+
+from astrbot.api import logger
+
+from .cache import atomic_write
+
+THUMB_SIZE = 112
+
+
+@dataclass
+class AvatarEntry:
+    qq: str
+    hash: str
+    mime: str
+    etag: str = ""
+    last_modified: str = ""
+    checked: float = 0.0
+
+
+class AvatarCache:
+    def __init__(self, dirp: str, ttl: float):
+        self.dirp = dirp
+        self.ttl = float(ttl)
+        self._index_fp = os.path.join(dirp, "index.json")
+        self._entries: Dict[str, AvatarEntry] = {}
+        try:
+            os.makedirs(dirp, exist_ok=True)
+        except Exception:
+            pass
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self._index_fp, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for qq, v in (data or {}).items():
+                try:
+                    self._entries[str(qq)] = AvatarEntry(**v)
+                except TypeError:
+                    continue
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.warning("[qqgal] avatar index unreadable, starting fresh", exc_info=True)
+
+    def _save(self) -> None:
+        data = json.dumps({k: asdict(v) for k, v in self._entries.items()}, ensure_ascii=False)
+        try:
+            atomic_write(self._index_fp, data.encode("utf-8"))
+        except Exception:
+            logger.error("[qqgal] save avatar index failed", exc_info=True)
+
+    def raw_path(self, qq: str) -> str:
+        return os.path.join(self.dirp, f"{qq}.img")
+
+    def thumb_path(self, qq: str) -> str:
+        return os.path.join(self.dirp, f"{qq}-{THUMB_SIZE}.jpg")
+
+    def entry(self, qq: str) -> Optional[AvatarEntry]:
+        """有记录且原图仍在磁盘上时返回条目。"""
+        ent = self._entries.get(str(qq))
+        if ent is None or not os.path.exists(self.raw_path(ent.qq)):
+            return None
+        return ent
+
+    def is_stale(self, ent: AvatarEntry) -> bool:
+        return time.time() - ent.checked >= self.ttl
+
+    def read(self, qq: str) -> bytes:
+        try:
+            with open(self.raw_path(qq), "rb") as f:
+                return f.read()
+        except OSError:
+            return b""
+
+    def store(self, qq: str, data: bytes, digest: str, mime: str, thumb: bytes, etag: str = "", last_modified: str = "") -> AvatarEntry:
+        qq = str(qq)
+        try:
+            atomic_write(self.raw_path(qq), data)
+            if thumb:
+                atomic_write(self.thumb_path(qq), thumb)
+        except Exception:
+            logger.error("[qqgal] write avatar cache failed, qq=%s", qq, exc_info=True)
+        ent = AvatarEntry(qq, digest, mime, etag, last_modified, time.time())
+        self._entries[qq] = ent
+        self._save()
+        return ent
+
+    def mark_checked(self, qq: str, etag: str = "", last_modified: str = "") -> Optional[AvatarEntry]:
+        """条件请求返回 304（或内容未变）时刷新验证时间与校验头。"""
+        ent = self._entries.get(str(qq))
+        if ent is None:
+            return None
+        ent.checked = time.time()
+        ent.etag = etag or ent.etag
+        ent.last_modified = last_modified or ent.last_modified
+        self._save()
+        return ent
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries)}
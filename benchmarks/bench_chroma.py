@@ -0,0 +1,99 @@
+"""抠色基准：旧版逐像素循环 vs imaging.matte_chroma（NumPy 向量化）。
+
+用法（插件目录下）：
+    python benchmarks/bench_chroma.py [--sizes 1024 2048] [--tol 100]
+
+同时校验两条路径的 alpha 输出差异（允许 ±1 的舍入误差）。
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+from PIL import Image, ImageDraw, ImageFilter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from imaging import matte_chroma, parse_hex_color  # noqa: E402
+
+
+def legacy_matte(img: Image.Image, chroma: str, tol: int) -> Image.Image:
+    """旧版 _matte_chroma_dataurl_sync 的核心循环（原样保留，仅供对照）。"""
+    img = img.convert("RGBA")
+    key = parse_hex_color(chroma)
+    thr2 = tol * tol
+    w, h = img.size
+    mask = Image.new('L', (w, h), 255)
+    px = img.load()
+    mk = mask.load()
+    for y in range(h):
+        for x in range(w):
+            r, g, b, a = px[x, y]
+            dr = r - key[0]
+            dg = g - key[1]
+            db = b - key[2]
+            if (dr*dr + dg*dg + db*db) <= thr2:
+                mk[x, y] = 0
+    mask = mask.filter(ImageFilter.MinFilter(3))
+    mask = mask.filter(ImageFilter.GaussianBlur(1.2))
+    r, g, b, alpha = img.split()
+    alpha = Image.eval(mask, lambda v: min(255, v))
+    return Image.merge('RGBA', (r, g, b, alpha))
+
+
+def make_portrait(size: int, chroma: str = "#00FF00", seed: int = 0) -> Image.Image:
+    """合成一张绿幕“立绘”：纯色背景 + 若干随机色块与噪点边缘。"""
+    rnd = random.Random(seed)
+    img = Image.new("RGBA", (size, size), parse_hex_color(chroma) + (255,))
+    draw = ImageDraw.Draw(img)
+    s = size / 1024
+    draw.ellipse((int(380 * s), int(120 * s), int(644 * s), int(420 * s)), fill=(250, 220, 200, 255))
+    draw.rectangle((int(260 * s), int(400 * s), int(764 * s), size), fill=(60, 70, 140, 255))
+    for _ in range(200):
+        x = rnd.randrange(size)
+        y = rnd.randrange(size)
+        r = rnd.randrange(2, max(3, int(24 * s)))
+        c = (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256), 255)
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=c)
+    return img
+
+
+def bench(fn, img, chroma, tol, repeat):
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(img, chroma, tol)
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1024, 2048])
+    ap.add_argument("--tol", type=int, default=100)
+    ap.add_argument("--chroma", default="#00FF00")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    for size in args.sizes:
+        img = make_portrait(size, args.chroma)
+        t_old, old = bench(legacy_matte, img, args.chroma, args.tol, 1)
+        t_new, new = bench(matte_chroma, img, args.chroma, args.tol, args.repeat)
+        a_old = old.getchannel("A").tobytes()
+        a_new = new.getchannel("A").tobytes()
+        max_diff = max((abs(x - y) for x, y in zip(a_old, a_new)), default=0)
+        rgb_same = old.convert("RGB").tobytes() == new.convert("RGB").tobytes()
+        print(
+            f"{size}x{size}: legacy={t_old * 1000:.1f}ms vectorized={t_new * 1000:.1f}ms "
+            f"speedup={t_old / max(t_new, 1e-9):.1f}x alpha_max_diff={max_diff} rgb_equal={rgb_same}"
+        )
+        if max_diff > 1 or not rgb_same:
+            print("  !! 输出与旧实现不一致")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
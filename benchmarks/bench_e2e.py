@@ -0,0 +1,258 @@
+"""端到端离线压测：无需 QQ、LLM 与 Gemini Key。
+
+用法（插件目录下）：
+    python benchmarks/bench_e2e.py [--requests 50] [--concurrency 8] [--users 10]
+                                   [--llm-delay 0.5] [--gemini-delay 2] [--render-delay 0.3]
+                                   [--backend html|pillow|pool] [--scenario options,storyboard,refresh]
+
+插件源码被复制到临时目录后加载（缓存/渲染产物不落在插件目录），AstrBot API 以桩模块代替，
+LLM 为固定延迟的桩，Gemini 与头像由本地 aiohttp 服务（benchmarks/fakes.StubServer）提供，
+html_render 默认只模拟耗时（--render-delay），安装 playwright 时可用 --playwright 真实截图。
+
+每个场景输出吞吐、端到端延迟分位数、峰值 RSS，以及插件内部各阶段的 p50/p95/p99（/qqgal_stats 同源数据）。
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import (  # noqa: E402
+    FakeApi, FakeContext, FakeEvent, FakeStar, StubProvider, StubServer, install_astrbot_stubs, load_plugin,
+)
+from check_plugin import run_checks  # noqa: E402
+
+
+def _statm_rss(pid: str) -> int:
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _child_pids() -> list:
+    pids = []
+    for tid in os.listdir("/proc/self/task"):
+        try:
+            with open(f"/proc/self/task/{tid}/children") as f:
+                pids.extend(f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def _rss_mb() -> float:
+    """当前进程 + 子进程（图像进程池）的 RSS 之和（MB）；非 Linux 时退化为本进程历史峰值 ru_maxrss。"""
+    try:
+        total = _statm_rss("self")
+        for pid in _child_pids():
+            try:
+                total += _statm_rss(pid)
+            except OSError:
+                pass
+        return total / 1024 / 1024
+    except Exception:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+class RssSampler:
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0.0
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            self.peak = max(self.peak, _rss_mb())
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak = _rss_mb()
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+        self.peak = max(self.peak, _rss_mb())
+
+
+def _pct(samples, q):
+    if not samples:
+        return 0.0
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(round(q * (len(s) - 1))))]
+
+
+async def _drive(make_event, handler, total: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+    latencies, kinds = [], {}
+
+    async def one(i: int):
+        async with sem:
+            ev = make_event(i)
+            t0 = time.perf_counter()
+            out = [r async for r in handler(ev)]
+            latencies.append(time.perf_counter() - t0)
+            kind = out[0][0] if out else "none"
+            kinds[kind] = kinds.get(kind, 0) + 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return time.perf_counter() - t0, latencies, kinds
+
+
+def _report(name: str, wall: float, latencies, kinds, rss_peak: float, rss_base: float, snap: dict) -> None:
+    n = len(latencies)
+    print(f"\n== {name}: {n} requests in {wall:.2f}s, {n / wall if wall else 0:.2f} req/s, results={kinds}")
+    print(
+        f"   latency p50={_pct(latencies, .5) * 1000:.0f}ms p95={_pct(latencies, .95) * 1000:.0f}ms "
+        f"p99={_pct(latencies, .99) * 1000:.0f}ms max={max(latencies) * 1000 if latencies else 0:.0f}ms"
+    )
+    print(f"   peak RSS {rss_peak:.0f} MB incl. workers (+{rss_peak - rss_base:.0f} MB over scenario start)")
+    print(f"   {'stage':<24}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, h in snap["timings"].items():
+        print(
+            f"   {stage:<24}{h['count']:>6}{h['p50'] * 1000:>10.1f}{h['p95'] * 1000:>10.1f}"
+            f"{h['p99'] * 1000:>10.1f}{h['max'] * 1000:>10.1f}"
+        )
+    if snap["counters"]:
+        print("   counters: " + ", ".join(f"{k}={v}" for k, v in snap["counters"].items()))
+
+
+async def main_async(args) -> None:
+    install_astrbot_stubs()
+    workdir = tempfile.mkdtemp(prefix="qqgal-bench-")
+    plugin_main = load_plugin(workdir)
+    problems = await run_checks(plugin_main)
+    if problems:
+        # 指令没注册到正确的处理函数时压测结果没有意义
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise SystemExit("plugin self-check failed:\n  " + "\n  ".join(problems))
+    from qqgal_bench_plugin.metrics import Metrics  # noqa: E402  (load_plugin 之后才可导入)
+
+    server = StubServer(gemini_delay=args.gemini_delay, fail_rate=args.gemini_fail_rate)
+    base = await server.start()
+    FakeStar.render_delay = args.render_delay
+    if args.playwright:
+        FakeStar.render_hook = await _playwright_hook(workdir)
+
+    provider = StubProvider(delay=args.llm_delay, stream=args.llm_stream)
+    api = FakeApi(delay=args.get_msg_delay)
+    cfg = {
+        "render_image": True,
+        "option_count": args.options,
+        "render_backend": args.backend,
+        "enable_character": True,
+        "gemini_api_keys": [f"stub-key-{i}" for i in range(args.keys)],
+        "gemini_base_url": base,
+        "avatar_url_tmpl": base + "/avatar?qq={qq}",
+        "image_executor": args.executor,
+        # 压测时关闭限流，测的是处理能力而非限流策略
+        "rate_user_per_min": 0,
+        "rate_group_per_min": 0,
+        "rate_global_per_min": 0,
+        "max_inflight_requests": max(16, args.concurrency * 2),
+        "storyboard_max_steps": max(5, args.steps),
+    }
+    plugin = plugin_main.QQGalPlugin(FakeContext(provider), cfg)
+    await plugin._bg_index.refresh()
+    print(f"workdir={workdir} backend={args.backend} executor={args.executor} concurrency={args.concurrency}")
+
+    def reset_metrics():
+        plugin._metrics = Metrics()
+        plugin._image_executor.metrics = plugin._metrics
+
+    try:
+        for scenario in args.scenario.split(","):
+            reset_metrics()
+            if scenario == "options":
+                def make_event(i):
+                    # 不同引用 -> 不同台词与目标用户；--users 控制目标用户数（立绘复用程度）
+                    reply = (i % args.users) + 1000 * (i // args.users) if not args.same_quote else 1
+                    return FakeEvent(api, "/选项", str(30000 + i), str(40000 + i % 5), reply)
+                handler = plugin.make_gal_options
+                total = args.requests
+            elif scenario == "storyboard":
+                def make_event(i):
+                    # 一次命令生成 --steps 幕长图；与 options 场景对比单幕摊销成本
+                    reply = (i % args.users) + 1000 * (i // args.users)
+                    return FakeEvent(api, f"/选项 连续 {args.steps}", str(30000 + i), str(40000 + i % 5), reply)
+                handler = plugin.make_gal_options
+                total = max(1, args.requests // args.steps)
+            elif scenario == "refresh":
+                def make_event(i):
+                    return FakeEvent(api, "/刷新立绘", str(20000 + i % args.users), "40000")
+                handler = plugin.refresh_character
+                total = args.users
+            else:
+                print(f"unknown scenario {scenario!r}, skipped")
+                continue
+            base_rss = _rss_mb()
+            with RssSampler() as rss:
+                wall, lat, kinds = await _drive(make_event, handler, total, args.concurrency)
+                # 等后台立绘生成完成，计入本场景
+                if plugin._gen_queue is not None:
+                    await plugin._gen_queue.join()
+            _report(scenario, wall, lat, kinds, rss.peak, base_rss, plugin._stats_snapshot())
+        print(
+            f"\nstub calls: llm={provider.calls} gemini={server.gemini_calls} "
+            f"avatar={server.avatar_calls} (304={server.avatar_304}) get_msg={api.calls.get('get_msg', 0)}"
+        )
+    finally:
+        await plugin.terminate()
+        await server.stop()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def _playwright_hook(workdir: str):
+    from playwright.async_api import async_playwright
+
+    pw = await async_playwright().start()
+    browser = await pw.chromium.launch()
+    counter = {"n": 0}
+
+    async def render(html: str, options: dict) -> str:
+        page = await browser.new_page(viewport={"width": 1280, "height": 720})
+        try:
+            await page.set_content(html)
+            counter["n"] += 1
+            fp = os.path.join(workdir, f"render-{counter['n']}.jpg")
+            await page.screenshot(path=fp, type="jpeg", quality=int(options.get("quality", 85)))
+            return fp
+        finally:
+            await page.close()
+
+    return render
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scenario", default="options,refresh")
+    ap.add_argument("--requests", type=int, default=50)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--users", type=int, default=10, help="目标用户数（立绘/头像的去重程度）")
+    ap.add_argument("--options", type=int, default=3, help="每次请求的选项数")
+    ap.add_argument("--steps", type=int, default=3, help="storyboard 场景每条命令的幕数")
+    ap.add_argument("--same-quote", action="store_true", help="所有请求引用同一条消息（测试请求合并）")
+    ap.add_argument("--llm-delay", type=float, default=0.5)
+    ap.add_argument("--llm-stream", action="store_true", help="桩 LLM 支持逐行流式输出")
+    ap.add_argument("--get-msg-delay", type=float, default=0.01)
+    ap.add_argument("--gemini-delay", type=float, default=2.0)
+    ap.add_argument("--gemini-fail-rate", type=float, default=0.0)
+    ap.add_argument("--keys", type=int, default=2)
+    ap.add_argument("--render-delay", type=float, default=0.3, help="桩 html_render 的模拟耗时")
+    ap.add_argument("--playwright", action="store_true", help="用 Playwright 真实渲染 HTML")
+    ap.add_argument("--backend", default="html", choices=["html", "pillow", "pool"])
+    ap.add_argument("--executor", default="process", choices=["process", "thread"])
+    ap.add_argument("--keep", action="store_true", help="保留临时工作目录（立绘/渲染产物）以便检查")
+    asyncio.run(main_async(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Gemini 响应解析基准：resp.json() + 递归查找 vs gemini_stream.InlineDataExtractor。
+
+用法（插件目录下）：
+    python benchmarks/bench_gemini_parse.py [--mb 4] [--chunk 65536]
+
+用 tracemalloc 统计两种方式解析同一份合成响应（含约 --mb MB 的 base64 图片）
+的峰值内存与耗时，并校验解码出的图片字节一致。
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gemini_stream import InlineDataExtractor  # noqa: E402
+
+
+def make_response(mb: float) -> bytes:
+    payload = os.urandom(int(mb * 1024 * 1024 * 3 / 4))
+    body = {
+        "candidates": [{
+            "content": {
+                "role": "model",
+                "parts": [
+                    {"text": "这是为你生成的立绘。"},
+                    {"inlineData": {"mimeType": "image/png", "data": base64.b64encode(payload).decode("ascii")}},
+                ],
+            },
+            "finishReason": "STOP",
+        }],
+        "usageMetadata": {"promptTokenCount": 1290, "totalTokenCount": 2580},
+    }
+    return json.dumps(body).encode("utf-8")
+
+
+def find_inline(d):
+    if isinstance(d, dict):
+        if (
+            ("inline_data" in d and isinstance(d["inline_data"], dict) and "data" in d["inline_data"]) or
+            ("inlineData" in d and isinstance(d["inlineData"], dict) and "data" in d["inlineData"])
+        ):
+            return d.get("inline_data") or d.get("inlineData")
+        for v in d.values():
+            r = find_inline(v)
+            if r:
+                return r
+    elif isinstance(d, list):
+        for it in d:
+            r = find_inline(it)
+            if r:
+                return r
+    return None
+
+
+def legacy_parse(chunks):
+    # aiohttp resp.json()：先读完整 body，再解码为 str，再 json.loads
+    body = b"".join(chunks)
+    data = json.loads(body.decode("utf-8"))
+    inline = find_inline(data)
+    b64 = inline.get("data")
+    data_url = f"data:image/png;base64,{b64}"
+    return base64.b64decode(data_url.split(",", 1)[1])
+
+
+def stream_parse(chunks):
+    ex = InlineDataExtractor()
+    for c in chunks:
+        if ex.feed(c):
+            break
+    return ex.result()
+
+
+def measure(fn, chunks):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn(iter(chunks))
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, elapsed, peak
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=float, default=4.0)
+    ap.add_argument("--chunk", type=int, default=64 * 1024)
+    args = ap.parse_args()
+
+    body = make_response(args.mb)
+    chunks = [body[i:i + args.chunk] for i in range(0, len(body), args.chunk)]
+    print(f"response body: {len(body) / 1024 / 1024:.2f} MB in {len(chunks)} chunks")
+    old, t_old, p_old = measure(legacy_parse, chunks)
+    new, t_new, p_new = measure(stream_parse, chunks)
+    print(f"  legacy: {t_old * 1000:.1f}ms peak={p_old / 1024 / 1024:.1f} MB")
+    print(f"  stream: {t_new * 1000:.1f}ms peak={p_new / 1024 / 1024:.1f} MB")
+    if bytes(new) != old:
+        print("  !! 解码结果不一致")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""渲染后端对比：render.composite_jpeg（Pillow）vs build_html + 无头浏览器截图。
+
+用法（插件目录下）：
+    python benchmarks/bench_render.py [--repeat 10] [--out /tmp/qqgal-bench]
+
+HTML 路径使用 Playwright(Chromium) 近似 AstrBot 的 html_render 本地渲染；
+未安装 playwright 时仅测 Pillow 路径。两种后端的输出图片写入 --out 以便目测对比。
+"""
+
+import argparse
+import asyncio
+import base64
+import importlib
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_chroma import make_portrait  # noqa: E402
+from imaging import prescale_background, process_portrait_bytes  # noqa: E402
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# render 使用包内相对导入（.layout），需以包的形式加载（无 __init__.py 时按命名空间包处理）
+sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+_render = importlib.import_module(f"{os.path.basename(PLUGIN_DIR)}.render")
+build_html, composite_jpeg = _render.build_html, _render.composite_jpeg
+
+
+def _data_url(mime: str, data: bytes) -> str:
+    return f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def make_scene(width: int = 1280, height: int = 720) -> dict:
+    bg_dir = os.path.join(PLUGIN_DIR, "background")
+    names = sorted(f for f in os.listdir(bg_dir) if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp")))
+    with open(os.path.join(bg_dir, names[0]), "rb") as f:
+        main, blur = prescale_background(f.read(), width, height)
+    buf = BytesIO()
+    make_portrait(1024).save(buf, format="PNG")
+    char_png, _ = process_portrait_bytes(buf.getvalue(), "#00FF00", 100, 1024)
+    buf = BytesIO()
+    make_portrait(112, "#3366CC", seed=1).convert("RGB").save(buf, format="JPEG")
+    return {
+        "width": width,
+        "height": height,
+        "bg_url": _data_url("image/jpeg", main),
+        "bg_blur_url": _data_url("image/jpeg", blur),
+        "bg_blur_filter": "none",
+        "char_url": _data_url("image/png", char_png),
+        "char_is_png": True,
+        "char_x_offset": -300,
+        "char_bottom_offset": 0,
+        "char_scale": 0.6,
+        "avatar": _data_url("image/jpeg", buf.getvalue()),
+        "name": "测试用户 (10001)",
+        "quote": "今天的月色真美啊，要不要一起去天台看看？",
+        "options": ["A. 好啊，我陪你去(微笑)", "B. 才、才不是想和你一起去呢！", "C. (沉默地转身离开)"],
+        "quality": 85,
+        "font_path": "",
+    }
+
+
+def summarize(label: str, samples: list) -> None:
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label:>8}: median={statistics.median(samples) * 1000:.1f}ms p95={p95 * 1000:.1f}ms n={len(samples)}")
+
+
+async def bench_html(scene: dict, repeat: int, out: str) -> None:
+    try:
+        from playwright.async_api import async_playwright
+    except Exception:
+        print("    html: skipped (playwright not installed)")
+        return
+    html = build_html(scene)
+    samples = []
+    async with async_playwright() as p:
+        t_launch = time.perf_counter()
+        browser = await p.chromium.launch()
+        print(f"    html: browser launch {(time.perf_counter() - t_launch) * 1000:.0f}ms")
+        for i in range(repeat):
+            t0 = time.perf_counter()
+            page = await browser.new_page(viewport={"width": scene["width"], "height": scene["height"]})
+            await page.set_content(html)
+            jpeg = await page.screenshot(type="jpeg", quality=scene["quality"])
+            await page.close()
+            samples.append(time.perf_counter() - t0)
+        await browser.close()
+    with open(os.path.join(out, "html.jpg"), "wb") as f:
+        f.write(jpeg)
+    summarize("html", samples)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=10)
+    ap.add_argument("--out", default="/tmp/qqgal-bench")
+    args = ap.parse_args()
+    os.makedirs(args.out, exist_ok=True)
+
+    scene = make_scene()
+    print(f"HTML document: {len(build_html(scene)) // 1024} KB")
+    samples = []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        jpeg = composite_jpeg(scene)
+        samples.append(time.perf_counter() - t0)
+    with open(os.path.join(args.out, "pillow.jpg"), "wb") as f:
+        f.write(jpeg)
+    summarize("pillow", samples)
+    asyncio.run(bench_html(scene, args.repeat, args.out))
+    print(f"outputs written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
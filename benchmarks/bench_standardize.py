@@ -0,0 +1,112 @@
+"""立绘标准化基准与回归校验：旧版逐像素质心 vs imaging.standardize_canvas。
+
+用法（插件目录下）：
+    python benchmarks/bench_standardize.py [--cases 20] [--size 1024] [--tolerance 2]
+
+对每个随机生成的抠图样本，将旧版输出画布与 imaging.standardize_canvas 的实际输出对照：
+非透明区域 bbox 必须一致，逐像素通道差不超过 --tolerance；并比较两种实现的耗时。
+任一样本不一致时以非零状态退出。
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+from PIL import Image, ImageChops, ImageDraw, ImageFilter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from imaging import standardize_canvas  # noqa: E402
+
+
+def legacy_canvas(img: Image.Image, size: int, bottom_pad: int = 0):
+    """旧版 _standardize_character_canvas_sync（原样保留，仅供对照），返回 (画布, 质心, 粘贴偏移)。"""
+    alpha = img.split()[3]
+    bbox = alpha.getbbox()
+    crop = img.crop(bbox)
+    alpha_crop = alpha.crop(bbox)
+    scale = min(size / max(1, crop.width), size / max(1, crop.height))
+    new_w = max(1, int(crop.width * scale))
+    new_h = max(1, int(crop.height * scale))
+    crop = crop.resize((new_w, new_h), Image.LANCZOS)
+    alpha_crop = alpha_crop.resize((new_w, new_h), Image.LANCZOS)
+    sum_w = 0
+    sum_xw = 0
+    px = alpha_crop.load()
+    for y in range(new_h):
+        for x in range(new_w):
+            wv = px[x, y]
+            if wv > 0:
+                sum_w += wv
+                sum_xw += wv * x
+    cx = (sum_xw / sum_w) if sum_w > 0 else (new_w / 2)
+    canvas = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    shift = int(round(size / 2 - cx))
+    x = (size - new_w) // 2 + shift
+    x = min(max(x, 0), size - new_w)
+    y = max(0, size - new_h - int(bottom_pad or 0))
+    canvas.paste(crop, (x, y), crop)
+    return canvas, cx, (x, y)
+
+
+def compare(old: Image.Image, new: Image.Image):
+    """返回 (alpha bbox 是否一致, 最大通道差)。"""
+    same_bbox = old.getchannel("A").getbbox() == new.getchannel("A").getbbox()
+    extrema = ImageChops.difference(old, new).getextrema()
+    return same_bbox, max(hi for _, hi in extrema)
+
+
+def make_matte(size: int, seed: int) -> Image.Image:
+    """随机生成一张带羽化边缘、偏离中心的人物抠图。"""
+    rnd = random.Random(seed)
+    img = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    cx = rnd.randrange(size // 4, size * 3 // 4)
+    hw = rnd.randrange(size // 10, size // 3)
+    top = rnd.randrange(size // 10, size // 2)
+    draw.ellipse((cx - hw // 2, top, cx + hw // 2, top + hw), fill=(240, 210, 190, 255))
+    draw.polygon(
+        [(cx - hw, size), (cx - hw // 3, top + hw), (cx + hw // 2, top + hw), (cx + hw + rnd.randrange(size // 6), size)],
+        fill=(50, 60, 120, 255),
+    )
+    a = img.getchannel("A").filter(ImageFilter.GaussianBlur(1.2))
+    img.putalpha(a)
+    return img
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases", type=int, default=20)
+    ap.add_argument("--size", type=int, default=1024)
+    ap.add_argument("--tolerance", type=int, default=2, help="允许的最大逐像素通道差")
+    args = ap.parse_args()
+
+    t_old = t_new = 0.0
+    failures = 0
+    for seed in range(args.cases):
+        img = make_matte(args.size, seed)
+        t0 = time.perf_counter()
+        old, _, off_old = legacy_canvas(img, args.size)
+        t_old += time.perf_counter() - t0
+        t0 = time.perf_counter()
+        new = standardize_canvas(img, args.size)
+        t_new += time.perf_counter() - t0
+        same_bbox, diff = compare(old, new)
+        if not same_bbox or diff > args.tolerance:
+            failures += 1
+            print(
+                f"  !! seed={seed} bbox {old.getchannel('A').getbbox()} vs {new.getchannel('A').getbbox()}, "
+                f"legacy offset {off_old}, max diff {diff}"
+            )
+    print(
+        f"{args.cases} cases @ {args.size}px: legacy avg={t_old * 1000 / args.cases:.1f}ms "
+        f"standardize_canvas avg={t_new * 1000 / args.cases:.1f}ms mismatches={failures}"
+    )
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""插件自检：指令注册等不经压测也应成立的约束。
+
+用法（插件目录下）：
+    python benchmarks/check_plugin.py
+
+在桩 AstrBot 下加载插件，校验每个指令/别名注册到的处理函数，
+以及各指令写法（含别名、带/不带斜杠）下的“连续 N”剧情模式与参数文本解析。
+任一项不符时打印原因并以非零状态退出；bench_e2e.py 启动时也会先执行这些检查。
+"""
+
+import asyncio
+import inspect
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import (  # noqa: E402
+    FakeApi, FakeContext, FakeEvent, StubProvider, install_astrbot_stubs, load_plugin, registered_commands,
+)
+
+# 指令/别名 -> QQGalPlugin 上应被注册的处理函数名
+EXPECTED_COMMANDS = {
+    "选项": "make_gal_options",
+    "gal": "make_gal_options",
+    "gal选项": "make_gal_options",
+    "刷新立绘": "refresh_character",
+    "预热立绘": "prewarm_characters",
+    "qqgal_keys": "key_stats",
+    "qqgal_stats": "show_stats",
+}
+
+
+def check_commands(plugin_main) -> list:
+    """返回不符合 EXPECTED_COMMANDS 的描述列表；使用真实 AstrBot（无注册表）时不检查。"""
+    commands = registered_commands()
+    if not commands:
+        return []
+    cls = plugin_main.QQGalPlugin
+    problems = []
+    for cmd, name in EXPECTED_COMMANDS.items():
+        fn = commands.get(cmd)
+        if fn is None:
+            problems.append(f"/{cmd} is not registered")
+        elif fn is not getattr(cls, name, None):
+            problems.append(f"/{cmd} is registered to {fn.__name__}, expected {name}")
+        elif not inspect.isasyncgenfunction(fn):
+            problems.append(f"/{cmd} handler {name} is not an async generator")
+    for cmd in sorted(set(commands) - set(EXPECTED_COMMANDS)):
+        problems.append(f"unexpected command /{cmd} -> {commands[cmd].__name__}")
+    return problems
+
+
+# 用户可能输入的指令词（别名 + 是否带斜杠）
+COMMAND_SPELLINGS = ("/选项", "选项", "/gal", "gal", "/gal选项", "gal选项")
+# 参数 -> 期望的 (幕数, 剩余文本)；幕数 0 表示普通选项模式
+STORYBOARD_CASES = {
+    "连续 2 下雨了": (2, "下雨了"),
+    "连续": (3, ""),
+    "连续不断地下雨": (0, ""),
+}
+
+
+async def check_storyboard_args(plugin_main) -> list:
+    """每种指令写法都应进入“连续 N”模式，且参数文本不被指令词残留污染。"""
+    plugin = plugin_main.QQGalPlugin(FakeContext(StubProvider()), {"storyboard_steps": 3})
+    problems = []
+    try:
+        problems.extend(await _storyboard_problems(plugin))
+    finally:
+        await plugin.terminate()
+    return problems
+
+
+async def _storyboard_problems(plugin) -> list:
+    problems = []
+    for cmd in COMMAND_SPELLINGS:
+        for arg, expected in STORYBOARD_CASES.items():
+            event = FakeEvent(FakeApi(), f"{cmd} {arg}", "10001")
+            got = plugin._storyboard_steps(event)
+            if got != expected:
+                problems.append(f"{cmd} {arg!r}: storyboard {got}, expected {expected}")
+        event = FakeEvent(FakeApi(), f"{cmd} 今天也下雨了", "10001")
+        inline = await plugin._extract_quoted_text(event)
+        if inline != "今天也下雨了":
+            problems.append(f"{cmd}: inline text {inline!r}, expected '今天也下雨了'")
+    return problems
+
+
+async def run_checks(plugin_main) -> list:
+    return check_commands(plugin_main) + await check_storyboard_args(plugin_main)
+
+
+def main():
+    install_astrbot_stubs()
+    workdir = tempfile.mkdtemp(prefix="qqgal-check-")
+    try:
+        problems = asyncio.run(run_checks(load_plugin(workdir)))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    for p in problems:
+        print(f"  !! {p}")
+    print(f"check_plugin: {'FAILED' if problems else 'ok'} ({len(problems)} problems)")
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
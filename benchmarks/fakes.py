@@ -0,0 +1,314 @@
+"""离线压测用的替身：AstrBot API 桩模块、假 Context/Event、桩 LLM 与本地 Gemini/头像服务。
+
+仅供 benchmarks/ 下的脚本使用，插件本身不依赖这里的任何东西。
+"""
+
+import asyncio
+import base64
+import importlib
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import time
+import types
+from io import BytesIO
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN_PKG = "qqgal_bench_plugin"
+
+
+# -- AstrBot API 桩 -----------------------------------------------------------
+
+class _Filter:
+    class EventMessageType:
+        ALL = "all"
+
+    class PermissionType:
+        ADMIN = "admin"
+
+    def __init__(self):
+        # 指令名/别名 -> 被注册的函数（供 check_plugin.py 校验装饰器确实落在处理函数上）
+        self.commands: Dict[str, Any] = {}
+
+    def command(self, name, alias=None, **k):
+        def deco(f):
+            for cmd in (name, *sorted(alias or ())):
+                self.commands[cmd] = f
+            return f
+        return deco
+
+    def event_message_type(self, *a, **k):
+        return lambda f: f
+
+    def permission_type(self, *a, **k):
+        return lambda f: f
+
+
+class FakeStar:
+    """astrbot.api.star.Star 的替身；html_render 由 render_hook 决定（默认仅模拟耗时）。"""
+
+    render_delay = 0.0
+    render_hook = None
+
+    def __init__(self, context):
+        self.context = context
+
+    async def html_render(self, html, data=None, options=None):
+        if FakeStar.render_hook is not None:
+            return await FakeStar.render_hook(html, options or {})
+        await asyncio.sleep(FakeStar.render_delay)
+        return "http://render.invalid/stub.jpg"
+
+
+def install_astrbot_stubs(log_level: int = logging.WARNING) -> None:
+    """未安装 AstrBot 时注入最小桩模块；已安装则不做任何事。"""
+    try:
+        import astrbot.api  # noqa: F401
+        return
+    except Exception:
+        pass
+    logging.basicConfig(level=log_level, format="%(levelname)s %(message)s")
+    root = types.ModuleType("astrbot")
+    api = types.ModuleType("astrbot.api")
+    api.logger = logging.getLogger("astrbot")
+    event = types.ModuleType("astrbot.api.event")
+    event.filter = _Filter()
+    event.AstrMessageEvent = object
+    star = types.ModuleType("astrbot.api.star")
+    star.Context = object
+    star.Star = FakeStar
+    star.register = lambda *a, **k: (lambda c: c)
+    comps = types.ModuleType("astrbot.api.message_components")
+    root.api = api
+    api.event, api.star, api.message_components = event, star, comps
+    sys.modules.update({
+        "astrbot": root,
+        "astrbot.api": api,
+        "astrbot.api.event": event,
+        "astrbot.api.star": star,
+        "astrbot.api.message_components": comps,
+    })
+
+
+def registered_commands() -> Dict[str, Any]:
+    """桩 filter.command 记录的指令表；使用真实 AstrBot 时为空。"""
+    flt = getattr(sys.modules.get("astrbot.api.event"), "filter", None)
+    return dict(getattr(flt, "commands", None) or {}) if isinstance(flt, _Filter) else {}
+
+
+def load_plugin(workdir: str):
+    """把插件源码复制到 workdir 后以包的形式导入，缓存/渲染产物都落在 workdir 中，不污染插件目录。"""
+    dst = os.path.join(workdir, PLUGIN_PKG)
+    shutil.copytree(
+        PLUGIN_DIR, dst,
+        ignore=shutil.ignore_patterns(
+            "benchmarks", "charactert", "avatars", "renders", "__pycache__", ".git", "*.jsonl", "*.sqlite3*",
+        ),
+    )
+    # 插件内部使用相对导入，需以包的形式加载（无 __init__.py 时按命名空间包处理）
+    sys.path.insert(0, workdir)
+    return importlib.import_module(f"{PLUGIN_PKG}.main")
+
+
+# -- 假 Context / Event -------------------------------------------------------
+
+class StubProvider:
+    """text_chat 固定延迟后返回 n 个选项（连续剧情提示词则返回多幕 JSON）。"""
+
+    provider_id = "stub"
+
+    def __init__(self, delay: float = 0.5, stream: bool = False):
+        self.delay = delay
+        self.calls = 0
+        if not stream:
+            # 不支持流式的供应商没有 text_chat_stream
+            self.text_chat_stream = None
+
+    async def text_chat(self, prompt: str = "", **kw):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        n = 3
+        for line in prompt.splitlines():
+            if line.startswith("需要的选项代号："):
+                n = line.count(",") + 1
+        m = re.search(r"续写一段 (\d+) 幕.*每幕 (\d+) 个选项", prompt)
+        if m:
+            steps, n = int(m.group(1)), int(m.group(2))
+            scenes = [
+                {"line": f"第 {s + 1} 幕的回应", "options": [f"{chr(65 + i)}. 第 {i + 1} 个选项" for i in range(n)], "choice": "A"}
+                for s in range(steps)
+            ]
+            return types.SimpleNamespace(text=json.dumps({"scenes": scenes}, ensure_ascii=False))
+        text = "\n".join(f"{chr(65 + i)}. 第 {i + 1} 个选项(微笑)" for i in range(n))
+        return types.SimpleNamespace(text=text)
+
+    async def text_chat_stream(self, prompt: str = "", **kw):
+        """逐行流式输出：delay 均摊到 n 个选项与一行多余的结尾说明上（凑齐即停时省掉最后一段）。"""
+        self.calls += 1
+        n = 3
+        for line in prompt.splitlines():
+            if line.startswith("需要的选项代号："):
+                n = line.count(",") + 1
+        lines = [f"{chr(65 + i)}. 第 {i + 1} 个选项(微笑)" for i in range(n)] + ["以上选项仅供参考。"]
+        for line in lines:
+            await asyncio.sleep(self.delay / len(lines))
+            yield types.SimpleNamespace(completion_text=line + "\n", is_chunk=True)
+
+
+class FakeContext:
+    def __init__(self, provider: StubProvider):
+        self.provider = provider
+
+    def get_provider_by_id(self, provider_id):
+        return None
+
+    def get_using_provider(self, umo=None):
+        return self.provider
+
+
+class FakeApi:
+    """OneBot call_action 替身：get_msg 返回被引用消息，get_group_member_list 返回成员列表。"""
+
+    def __init__(self, delay: float = 0.01, members: int = 20):
+        self.delay = delay
+        self.members = members
+        self.calls: Dict[str, int] = {}
+
+    async def call_action(self, action: str, **kw):
+        self.calls[action] = self.calls.get(action, 0) + 1
+        await asyncio.sleep(self.delay)
+        if action == "get_msg":
+            mid = int(kw.get("message_id", 0))
+            return {
+                "message": [{"type": "text", "data": {"text": f"第 {mid} 句台词：今天的月色真美啊"}}],
+                "sender": {"user_id": 20000 + mid % 1000, "nickname": f"用户{mid % 1000}"},
+            }
+        if action == "get_group_member_list":
+            return [
+                {"user_id": 20000 + i, "nickname": f"用户{i}", "last_sent_time": int(time.time()) - i}
+                for i in range(self.members)
+            ]
+        return {}
+
+
+class FakeEvent:
+    """AstrMessageEvent 的替身，覆盖插件用到的方法。"""
+
+    def __init__(self, api: FakeApi, text: str, sender_id: str, group_id: str = "", reply_id: Optional[int] = None):
+        self.message_str = text
+        self.bot = types.SimpleNamespace(api=api)
+        segs: List[Dict[str, Any]] = []
+        if reply_id is not None:
+            segs.append({"type": "reply", "data": {"id": str(reply_id)}})
+        segs.append({"type": "text", "data": {"text": text}})
+        self.message_obj = types.SimpleNamespace(raw_message={"message": segs})
+        self.unified_msg_origin = f"aiocqhttp:GroupMessage:{group_id or sender_id}"
+        self._sender_id = sender_id
+        self._group_id = group_id
+        self._extra: Dict[str, Any] = {}
+        self.stopped = False
+
+    def get_extra(self, key):
+        return self._extra.get(key)
+
+    def set_extra(self, key, value):
+        self._extra[key] = value
+
+    def get_platform_name(self):
+        return "aiocqhttp"
+
+    def get_self_id(self):
+        return "10000"
+
+    def get_sender_id(self):
+        return self._sender_id
+
+    def get_sender_name(self):
+        return f"用户{self._sender_id}"
+
+    def get_group_id(self):
+        return self._group_id
+
+    def plain_result(self, text):
+        return ("text", text)
+
+    def image_result(self, url):
+        return ("image", url)
+
+    def stop_event(self):
+        self.stopped = True
+
+
+# -- 本地 Gemini / 头像服务 ----------------------------------------------------
+
+def _png(img) -> bytes:
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class StubServer:
+    """本地 aiohttp 服务：
+
+    - POST /v1beta/models/{model}:generateContent  返回内嵌绿幕立绘的 Gemini 响应；
+    - GET  /avatar?qq=...                          返回头像 JPEG（带 ETag，支持 304）。
+    """
+
+    def __init__(self, gemini_delay: float = 2.0, portrait_size: int = 1024, fail_rate: float = 0.0):
+        from bench_chroma import make_portrait
+
+        self.gemini_delay = gemini_delay
+        self.fail_rate = fail_rate
+        self.gemini_calls = 0
+        self.avatar_calls = 0
+        self.avatar_304 = 0
+        b64 = base64.b64encode(_png(make_portrait(portrait_size))).decode("ascii")
+        self._gemini_body = json.dumps({
+            "candidates": [{"content": {"role": "model", "parts": [
+                {"text": "好的，这是生成的立绘。"},
+                {"inlineData": {"mimeType": "image/png", "data": b64}},
+            ]}}],
+        }).encode("utf-8")
+        buf = BytesIO()
+        make_portrait(640, "#3366CC", seed=1).convert("RGB").save(buf, format="JPEG", quality=90)
+        self._avatar = buf.getvalue()
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    async def _gemini(self, request: web.Request) -> web.StreamResponse:
+        self.gemini_calls += 1
+        await request.read()
+        await asyncio.sleep(self.gemini_delay)
+        if self.fail_rate and (self.gemini_calls * 7919) % 100 < self.fail_rate * 100:
+            return web.Response(status=429, text='{"error": "rate limited"}')
+        return web.Response(body=self._gemini_body, content_type="application/json")
+
+    async def _avatar_handler(self, request: web.Request) -> web.Response:
+        self.avatar_calls += 1
+        etag = '"stub-avatar-1"'
+        if request.headers.get("If-None-Match") == etag:
+            self.avatar_304 += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(body=self._avatar, content_type="image/jpeg", headers={"ETag": etag})
+
+    async def start(self) -> str:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1beta/models/{model}", self._gemini)
+        app.router.add_get("/avatar", self._avatar_handler)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,203 @@
+"""进程内缓存。"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+import base64
+import os
+import random
+import time
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """先写同目录临时文件再 os.replace，读者不会看到写了一半的文件。
+
+    失败时清理临时文件并抛出异常，由调用方决定记录方式。
+    """
+    tmp = f"{path}.{os.getpid()}.{random.getrandbits(32):08x}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class DataUrlCache:
+    """按字节预算淘汰的 LRU 缓存：文件路径 -> 可直接嵌入的 data-url。
+
+    以 (mtime_ns, size) 校验文件是否变化，文件被重写（如 /刷新立绘）后自动失效。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, int(max_bytes))
+        self._items: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: str, mime: str) -> str:
+        """返回 path 对应的 data-url；文件不存在或读取失败返回空串。"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.invalidate(path)
+            return ""
+        ent = self._items.get(path)
+        if ent is not None and ent[0] == st.st_mtime_ns and ent[1] == st.st_size:
+            self._items.move_to_end(path)
+            self.hits += 1
+            return ent[2]
+        self.misses += 1
+        try:
+            with open(path, "rb") as f:
+                b64 = base64.b64encode(f.read()).decode("ascii")
+        except OSError:
+            self.invalidate(path)
+            return ""
+        url = f"data:{mime};base64,{b64}"
+        self._put(path, st.st_mtime_ns, st.st_size, url)
+        return url
+
+    def _put(self, path: str, mtime_ns: int, size: int, url: str) -> None:
+        self.invalidate(path)
+        if len(url) > self.max_bytes:
+            return
+        self._items[path] = (mtime_ns, size, url)
+        self._bytes += len(url)
+        while self._bytes > self.max_bytes and self._items:
+            _, (_, _, old) = self._items.popitem(last=False)
+            self._bytes -= len(old)
+
+    def invalidate(self, path: str) -> None:
+        ent = self._items.pop(path, None)
+        if ent is not None:
+            self._bytes -= len(ent[2])
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._items),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+class TTLCache:
+    """带过期时间的小型 LRU 缓存。"""
+
+    def __init__(self, maxsize: int = 256, ttl: float = 60.0):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self._items: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        ent = self._items.get(key)
+        if ent is not None:
+            if ent[0] > time.monotonic():
+                self._items.move_to_end(key)
+                self.hits += 1
+                return ent[1]
+            self._items.pop(key, None)
+        self.misses += 1
+        return default
+
+    def set(self, key: Any, value: Any) -> None:
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def pop(self, key: Any) -> None:
+        self._items.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+class RenderCache:
+    """渲染结果缓存：场景哈希 -> 输出（本地文件路径或 URL），按条目数与字节数淘汰。
+
+    本地文件被外部删除（如 renders/ 清理）后自动失效。
+    """
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max(0, int(max_entries))
+        self.max_bytes = max(0, int(max_bytes))
+        self._items: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _local_path(result: str) -> str:
+        if result.startswith("file://"):
+            return result[len("file://"):]
+        return "" if "://" in result else result
+
+    def get(self, key: str) -> str:
+        ent = self._items.get(key)
+        if ent is not None:
+            fp = self._local_path(ent[0])
+            if not fp or os.path.exists(fp):
+                self._items.move_to_end(key)
+                self.hits += 1
+                return ent[0]
+            self._drop(key)
+        self.misses += 1
+        return ""
+
+    def put(self, key: str, result: str) -> None:
+        if not result or self.max_entries <= 0:
+            return
+        fp = self._local_path(result)
+        try:
+            nbytes = os.path.getsize(fp) if fp else 0
+        except OSError:
+            return
+        if nbytes > self.max_bytes:
+            return
+        self._drop(key)
+        self._items[key] = (result, nbytes)
+        self._bytes += nbytes
+        while self._items and (len(self._items) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, old) = self._items.popitem(last=False)
+            self._bytes -= old
+
+    def _drop(self, key: str) -> None:
+        ent = self._items.pop(key, None)
+        if ent is not None:
+            self._bytes -= ent[1]
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._items),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
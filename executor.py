@@ -0,0 +1,115 @@
+"""CPU 密集图像阶段的执行器：优先进程池，失败回退线程。
+
+抠色/标准化为纯像素计算，放在线程里仍会争抢 GIL 拖慢事件循环；
+交给独立进程执行，事件循环只负责收发原始字节。
+"""
+
+from typing import Any, Callable, Dict
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from astrbot.api import logger
+
+
+class ImageQueueFull(RuntimeError):
+    """排队任务数超过上限。"""
+
+
+class ImageExecutor:
+    """有界图像任务执行器。
+
+    - mode="process"：ProcessPoolExecutor（spawn），不可用时自动回退线程；
+    - mode="thread"：asyncio.to_thread；
+    - 同时在途任务数（执行中 + 排队）超过 workers + queue_limit 时拒绝。
+    """
+
+    def __init__(self, mode: str = "process", workers: int = 2, queue_limit: int = 8, metrics: Any = None):
+        self.mode = "process" if str(mode).lower() == "process" else "thread"
+        self.workers = max(1, int(workers))
+        self.queue_limit = max(0, int(queue_limit))
+        self._pool: ProcessPoolExecutor | None = None
+        self._pending = 0
+        self._max_pending = 0
+        self._stage_stats: Dict[str, Dict[str, float]] = {}
+        # 可选的 metrics.Metrics，按 image_<stage> 记录耗时分布
+        self.metrics = metrics
+
+    def _get_pool(self) -> ProcessPoolExecutor | None:
+        if self.mode != "process":
+            return None
+        if self._pool is None:
+            try:
+                ctx = multiprocessing.get_context("spawn")
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+            except Exception as e:
+                logger.warning("[qqgal] process pool unavailable, fallback to threads: %s", e)
+                self.mode = "thread"
+                return None
+        return self._pool
+
+    async def run(self, stage: str, fn: Callable[..., Any], *args: Any) -> Any:
+        """在执行器中运行 fn(*args)，fn 与参数须可 pickle（模块级函数 + 字节）。"""
+        if self._pending >= self.workers + self.queue_limit:
+            if self.metrics is not None:
+                self.metrics.incr("image_queue_full")
+            raise ImageQueueFull(f"image queue full ({self._pending})")
+        self._pending += 1
+        self._max_pending = max(self._max_pending, self._pending)
+        t0 = time.perf_counter()
+        try:
+            pool = self._get_pool()
+            if pool is not None:
+                try:
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(pool, fn, *args)
+                except (BrokenProcessPool, OSError, NotImplementedError) as e:
+                    logger.warning("[qqgal] process pool failed, fallback to threads: %s", e)
+                    self._shutdown_pool()
+                    self.mode = "thread"
+            return await asyncio.to_thread(fn, *args)
+        finally:
+            self._pending -= 1
+            self._record(stage, time.perf_counter() - t0)
+
+    def _record(self, stage: str, elapsed: float) -> None:
+        st = self._stage_stats.setdefault(stage, {"count": 0, "total_s": 0.0, "max_s": 0.0})
+        st["count"] += 1
+        st["total_s"] += elapsed
+        st["max_s"] = max(st["max_s"], elapsed)
+        if self.metrics is not None:
+            self.metrics.observe(f"image_{stage}", elapsed)
+        logger.debug(
+            "[qqgal] image stage=%s wall=%.1fms queue=%d mode=%s",
+            stage, elapsed * 1000, self._pending, self.mode,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        stages = {}
+        for k, v in self._stage_stats.items():
+            cnt = int(v["count"])
+            stages[k] = {
+                "count": cnt,
+                "avg_ms": round(v["total_s"] * 1000 / cnt, 1) if cnt else 0.0,
+                "max_ms": round(v["max_s"] * 1000, 1),
+            }
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "queue_depth": self._pending,
+            "max_queue_depth": self._max_pending,
+            "stages": stages,
+        }
+
+    def _shutdown_pool(self) -> None:
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            try:
+                pool.shutdown(wait=False, cancel_futures=True)
+            except Exception:
+                pass
+
+    def shutdown(self) -> None:
+        self._shutdown_pool()
@@ -0,0 +1,90 @@
+"""Gemini 生图响应的流式解析。
+
+响应体是携带数 MB base64 图片的 JSON。这里不构建完整 JSON 树，
+而是边读边扫描第一个 inlineData/inline_data 对象的 "data" 字段，
+并直接按块 base64 解码进 bytearray。
+"""
+
+from typing import Optional
+import binascii
+import json
+import re
+
+# "inlineData": { ...可能有 mimeType... "data": "
+_HEAD_RE = re.compile(
+    rb'"(?:inlineData|inline_data)"\s*:\s*\{(?P<pre>[^{}]*?)"data"\s*:\s*"',
+)
+_MIME_RE = re.compile(rb'"(?:mimeType|mime_type)"\s*:\s*"(?P<mime>(?:[^"\\]|\\.)+)"')
+# 未命中时仅保留缓冲尾部，避免在长文本段上无限增长
+_SEARCH_KEEP = 4096
+
+
+class InlineDataExtractor:
+    """增量提取器：feed() 返回 True 表示图片数据已完整，可停止读取。"""
+
+    def __init__(self):
+        self._buf = b""
+        self._in_data = False
+        self._done = False
+        self._pending = b""  # 未凑满 4 字节的 base64 余量
+        self._escape = False
+        self.data = bytearray()
+        self.mime = "image/png"
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    def feed(self, chunk: bytes) -> bool:
+        if self._done:
+            return True
+        if not self._in_data:
+            self._buf += chunk
+            m = _HEAD_RE.search(self._buf)
+            if m is None:
+                if len(self._buf) > _SEARCH_KEEP:
+                    self._buf = self._buf[-_SEARCH_KEEP:]
+                return False
+            mm = _MIME_RE.search(m.group("pre"))
+            if mm:
+                # 原样截取的是 JSON 字符串字面量（可能含 "image\/jpeg" 这类转义），按 JSON 反转义
+                try:
+                    self.mime = json.loads(b'"' + mm.group("mime") + b'"') or self.mime
+                except ValueError:
+                    pass
+            chunk = self._buf[m.end():]
+            self._buf = b""
+            self._in_data = True
+        self._consume(chunk)
+        return self._done
+
+    def _consume(self, chunk: bytes) -> None:
+        end = chunk.find(b'"')
+        if end >= 0:
+            self._done = True
+            chunk = chunk[:end]
+        if b"\\" in chunk or self._escape:
+            chunk = self._unescape(chunk)
+        data = self._pending + chunk
+        cut = len(data) - (len(data) % 4) if not self._done else len(data)
+        if cut:
+            self.data += binascii.a2b_base64(data[:cut])
+        self._pending = data[cut:]
+
+    def _unescape(self, chunk: bytes) -> bytes:
+        # base64 在 JSON 中只可能出现 \/ 或换行类转义（\n、\r）
+        out = bytearray()
+        for b in chunk:
+            if self._escape:
+                self._escape = False
+                if b == ord("/"):
+                    out.append(b)
+                continue
+            if b == ord("\\"):
+                self._escape = True
+                continue
+            out.append(b)
+        return bytes(out)
+
+    def result(self) -> Optional[bytearray]:
+        return self.data if self._done and self.data else None
@@ -0,0 +1,234 @@
+"""立绘与背景图像处理：抠色、收边羽化、标准画布与背景预缩放。
+
+纯函数实现，不依赖 AstrBot，便于在线程/进程中执行以及离线基准测试。
+NumPy 为可选依赖：可用时整幅数组向量化计算，否则回退到逐像素实现。
+"""
+
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+import time
+
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter, ImageStat
+
+try:
+    import numpy as np
+except Exception:  # pragma: no cover - 可选依赖
+    np = None
+
+
+def parse_hex_color(chroma: str) -> Tuple[int, int, int]:
+    """解析 #RRGGBB 形式的颜色为 (r, g, b)。"""
+    hx = str(chroma or "").strip().lstrip('#')
+    return tuple(int(hx[i:i+2], 16) for i in (0, 2, 4))
+
+
+def _chroma_mask_numpy(img: Image.Image, key: Tuple[int, int, int], tol: int) -> Image.Image:
+    """向量化计算：与 key 的欧氏距离平方 <= tol² 的像素置 0，其余 255。"""
+    rgb = np.asarray(img.convert("RGB"), dtype=np.int32)
+    d = rgb - np.asarray(key, dtype=np.int32)
+    dist2 = np.einsum("ijk,ijk->ij", d, d)
+    mask = np.where(dist2 <= int(tol) * int(tol), 0, 255).astype(np.uint8)
+    return Image.fromarray(mask, mode="L")
+
+
+def _chroma_mask_py(img: Image.Image, key: Tuple[int, int, int], tol: int) -> Image.Image:
+    """逐像素实现（无 NumPy 时的回退路径）。"""
+    thr2 = tol * tol
+    w, h = img.size
+    mask = Image.new('L', (w, h), 255)
+    px = img.convert("RGB").load()
+    mk = mask.load()
+    for y in range(h):
+        for x in range(w):
+            r, g, b = px[x, y]
+            dr = r - key[0]
+            dg = g - key[1]
+            db = b - key[2]
+            if (dr*dr + dg*dg + db*db) <= thr2:
+                mk[x, y] = 0
+    return mask
+
+
+def chroma_mask(img: Image.Image, key: Tuple[int, int, int], tol: int) -> Image.Image:
+    """生成抠色蒙版（L 模式，背景 0、主体 255）。"""
+    if np is not None:
+        return _chroma_mask_numpy(img, key, tol)
+    return _chroma_mask_py(img, key, tol)
+
+
+def matte_chroma(img: Image.Image, chroma: str, tol: int) -> Image.Image:
+    """对 RGBA 图像抠色：
+    - 采用欧氏距离阈值；
+    - 先腐蚀后高斯模糊，收掉 1~2px 的绿色边缘；
+    - 适度扩大透明区域，减少绿边影响居中与缩放。
+    返回新的 RGBA 图像，alpha 由蒙版替换。
+    """
+    img = img.convert("RGBA")
+    mask = chroma_mask(img, parse_hex_color(chroma), int(tol))
+    # 轻度腐蚀收边，去掉 1~2 像素绿边
+    try:
+        mask = mask.filter(ImageFilter.MinFilter(3))
+    except Exception:
+        pass
+    # 轻度羽化
+    mask = mask.filter(ImageFilter.GaussianBlur(1.2))
+    r, g, b, _ = img.split()
+    return Image.merge('RGBA', (r, g, b, mask))
+
+
+def alpha_centroid_x(alpha: Image.Image) -> Optional[float]:
+    """alpha 平面的加权 x 质心：sum(x*a)/sum(a)，基于列和归约；全透明返回 None。"""
+    w, h = alpha.size
+    if np is not None:
+        cols = np.asarray(alpha, dtype=np.uint8).sum(axis=0, dtype=np.int64)
+        total = int(cols.sum())
+        if total <= 0:
+            return None
+        return float(np.dot(cols, np.arange(w, dtype=np.int64))) / total
+    cols = [ImageStat.Stat(alpha.crop((x, 0, x + 1, h))).sum[0] for x in range(w)]
+    total = sum(cols)
+    if total <= 0:
+        return None
+    return sum(x * c for x, c in enumerate(cols)) / total
+
+
+def standardize_canvas(img: Image.Image, size: int, bottom_pad: int = 0) -> Image.Image:
+    """将抠好的人物立绘标准化到 size×size 透明画布中：
+    - 等比放大到“左右对齐”（宽度=画布宽度），
+    - 基于轮廓质心做水平居中，避免人物偏一侧；
+    - 底部对齐（人物底边贴近画布底边，允许上方溢出被裁切），
+    以确保不同原图比例得到一致的最终合成尺寸。
+    无非透明像素时原样返回。
+    """
+    img = img.convert("RGBA")
+    # 取非透明 bbox
+    alpha = img.split()[3]
+    bbox = alpha.getbbox()
+    if not bbox:
+        return img
+    crop = img.crop(bbox)
+    alpha_crop = alpha.crop(bbox)
+    # 从底部往上等比放大：尽可能大但不裁切（contain），
+    # 当任意边触达画布边框时停止放大。
+    scale = min(size / max(1, crop.width), size / max(1, crop.height))
+    new_w = max(1, int(crop.width * scale))
+    new_h = max(1, int(crop.height * scale))
+    # 轮廓质心在缩放前的裁剪图上计算，再按像素中心映射到缩放后坐标：
+    # LANCZOS 为线性归一化滤波，质心随缩放线性变化，无需再遍历放大后的 alpha。
+    cx_crop = alpha_centroid_x(alpha_crop)
+    if cx_crop is None:
+        cx = new_w / 2
+    else:
+        cx = (cx_crop + 0.5) * (new_w / crop.width) - 0.5
+    crop = crop.resize((new_w, new_h), Image.LANCZOS)
+    # 粘贴到标准画布
+    canvas = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+    desired_cx = size / 2
+    shift = int(round(desired_cx - cx))
+    x = (size - new_w) // 2 + shift
+    # 约束不越界
+    if x < 0:
+        x = 0
+    if x > size - new_w:
+        x = size - new_w
+    # 底部对齐，不裁切
+    y = max(0, size - new_h - int(bottom_pad or 0))
+    canvas.paste(crop, (x, y), crop)
+    return canvas
+
+
+def _decode(raw: bytes) -> Image.Image:
+    return Image.open(BytesIO(raw)).convert("RGBA")
+
+
+def _encode_png(img: Image.Image) -> bytes:
+    buf = BytesIO()
+    img.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def process_portrait_bytes(
+    raw: bytes, chroma: str, tol: int, size: int, bottom_pad: int = 0
+) -> Tuple[bytes, Dict[str, float]]:
+    """进程池入口（融合流水线）：原始生图字节 -> 抠色 -> 标准画布 -> PNG 字节。
+
+    全程只解码一次、编码一次；同时返回各子阶段耗时（秒）。
+    """
+    timings: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    img = _decode(raw)
+    t1 = time.perf_counter()
+    timings["decode"] = t1 - t0
+    img = matte_chroma(img, chroma, tol)
+    t2 = time.perf_counter()
+    timings["matte"] = t2 - t1
+    img = standardize_canvas(img, size, bottom_pad)
+    t3 = time.perf_counter()
+    timings["standardize"] = t3 - t2
+    png = _encode_png(img)
+    timings["encode"] = time.perf_counter() - t3
+    return png, timings
+
+
+def prescale_background(raw: bytes, width: int, height: int, quality: int = 85) -> Tuple[bytes, bytes]:
+    """背景预处理：返回 (主图 JPEG, 模糊底图 JPEG)。
+
+    - 主图：等比缩小至不超过 width×height（渲染端 background-size:contain 负责放大）；
+    - 底图：cover 裁切铺满后模糊并压暗（对应 .bg-blur 的 blur(18px) brightness(0.7)），
+      在 1/4 分辨率上完成模糊，渲染端按 cover 放大即可。
+    """
+    img = Image.open(BytesIO(raw)).convert("RGB")
+    main = img.copy()
+    main.thumbnail((width, height), Image.LANCZOS)
+
+    bw, bh = max(1, width // 4), max(1, height // 4)
+    scale = max(bw / img.width, bh / img.height)
+    cover = img.resize((max(bw, round(img.width * scale)), max(bh, round(img.height * scale))), Image.BILINEAR)
+    left = (cover.width - bw) // 2
+    top = (cover.height - bh) // 2
+    blur = cover.crop((left, top, left + bw, top + bh)).filter(ImageFilter.GaussianBlur(18 / 4))
+    blur = ImageEnhance.Brightness(blur).enhance(0.7)
+
+    def _jpeg(im: Image.Image, q: int) -> bytes:
+        buf = BytesIO()
+        im.save(buf, format="JPEG", quality=q, optimize=True)
+        return buf.getvalue()
+
+    return _jpeg(main, quality), _jpeg(blur, 70)
+
+
+def avatar_thumbnail(raw: bytes, size: int = 112, quality: int = 90) -> bytes:
+    """头像缩略图：居中裁成正方形后缩小到 size×size 的 JPEG（圆形由渲染端裁切）。
+
+    .q-avatar 显示尺寸为 56px，112px 覆盖 2x 缩放。
+    """
+    img = Image.open(BytesIO(raw))
+    if img.mode in ("RGBA", "LA", "P"):
+        # 透明头像铺白底，避免 JPEG 编码后变黑
+        rgba = img.convert("RGBA")
+        img = Image.new("RGB", rgba.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.getchannel("A"))
+    else:
+        img = img.convert("RGB")
+    side = min(img.width, img.height)
+    left = (img.width - side) // 2
+    top = (img.height - side) // 2
+    img = img.crop((left, top, left + side, top + side))
+    if side != size:
+        img = img.resize((size, size), Image.LANCZOS)
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def placeholder_silhouette_png(size: int = 1024) -> bytes:
+    """立绘生成中的占位剪影：半透明灰色头肩轮廓，布局与标准画布一致（底部对齐）。"""
+    s = size / 1024
+    img = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    fill = (40, 40, 48, 150)
+    draw.ellipse((int(382 * s), int(250 * s), int(642 * s), int(540 * s)), fill=fill)
+    draw.rounded_rectangle((int(212 * s), int(600 * s), int(812 * s), int(1100 * s)), radius=int(220 * s), fill=fill)
+    draw.rectangle((int(462 * s), int(520 * s), int(562 * s), int(640 * s)), fill=fill)
+    img.putalpha(img.getchannel("A").filter(ImageFilter.GaussianBlur(3 * s)))
+    return _encode_png(img)
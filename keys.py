@@ -0,0 +1,107 @@
+"""Gemini API Key 调度：健康度跟踪、冷却与轮转。"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List
+import time
+
+
+@dataclass
+class KeyState:
+    ok: int = 0
+    fail: int = 0
+    consecutive_fail: int = 0
+    last_status: int = 0
+    last_429_at: float = 0.0
+    last_403_at: float = 0.0
+    latency_ewma: float = 0.0
+    cooldown_until: float = 0.0
+
+
+class KeyScheduler:
+    """按 Key 记录成功率、最近 429/403、延迟 EWMA 与冷却窗口。
+
+    order() 给出本次尝试顺序：不在冷却中的 Key 轮转起点后按得分排序，
+    冷却中的 Key 垫底（全部冷却时仍会被尝试，作为最后手段）。
+    """
+
+    RATE_LIMIT_BASE = 60.0
+    RATE_LIMIT_MAX = 900.0
+    AUTH_COOLDOWN = 1800.0
+    ERROR_COOLDOWN = 10.0
+    EWMA_ALPHA = 0.3
+
+    def __init__(self):
+        self._states: Dict[str, KeyState] = {}
+        self._cursor = 0
+
+    def _state(self, key: str) -> KeyState:
+        st = self._states.get(key)
+        if st is None:
+            st = self._states[key] = KeyState()
+        return st
+
+    def _score(self, st: KeyState) -> float:
+        total = st.ok + st.fail
+        # 未使用过的 Key 视为健康，便于参与轮转
+        success = (st.ok + 1) / (total + 1)
+        latency = st.latency_ewma or 0.0
+        return success - min(latency, 120.0) / 240.0
+
+    def order(self, keys: List[str]) -> List[str]:
+        if not keys:
+            return []
+        now = time.monotonic()
+        n = len(keys)
+        start = self._cursor % n
+        self._cursor = (self._cursor + 1) % n
+        rotated = keys[start:] + keys[:start]
+        healthy = [k for k in rotated if self._state(k).cooldown_until <= now]
+        cooling = [k for k in rotated if self._state(k).cooldown_until > now]
+        # 稳定排序：同分时保留轮转顺序，实现负载分摊
+        healthy.sort(key=lambda k: -round(self._score(self._state(k)), 2))
+        cooling.sort(key=lambda k: self._state(k).cooldown_until)
+        return healthy + cooling
+
+    def report(self, key: str, ok: bool, status: int = 0, latency: float = 0.0) -> None:
+        st = self._state(key)
+        now = time.monotonic()
+        st.last_status = status
+        if latency > 0:
+            st.latency_ewma = latency if not st.latency_ewma else (
+                self.EWMA_ALPHA * latency + (1 - self.EWMA_ALPHA) * st.latency_ewma
+            )
+        if ok:
+            st.ok += 1
+            st.consecutive_fail = 0
+            st.cooldown_until = 0.0
+            return
+        st.fail += 1
+        st.consecutive_fail += 1
+        if status == 429:
+            st.last_429_at = now
+            cd = min(self.RATE_LIMIT_MAX, self.RATE_LIMIT_BASE * (2 ** (st.consecutive_fail - 1)))
+        elif status in (401, 403):
+            st.last_403_at = now
+            cd = self.AUTH_COOLDOWN
+        else:
+            cd = min(self.RATE_LIMIT_BASE, self.ERROR_COOLDOWN * st.consecutive_fail)
+        st.cooldown_until = max(st.cooldown_until, now + cd)
+
+    def stats(self, keys: List[str]) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        rows = []
+        for k in keys:
+            st = self._state(k)
+            total = st.ok + st.fail
+            rows.append({
+                "key": (k[:4] + "…" + k[-4:]) if len(k) > 10 else "…",
+                "ok": st.ok,
+                "fail": st.fail,
+                "success_rate": round(st.ok / total, 3) if total else None,
+                "last_status": st.last_status,
+                "latency_ewma_s": round(st.latency_ewma, 2),
+                "cooldown_s": max(0, int(st.cooldown_until - now)),
+                "last_429_ago_s": int(now - st.last_429_at) if st.last_429_at else None,
+                "last_403_ago_s": int(now - st.last_403_at) if st.last_403_at else None,
+            })
+        return rows
@@ -0,0 +1,257 @@
+"""版式计算：字体、文字测量与引用块/选项的自适应布局（两种渲染后端共用）。
+
+- 逐字宽度按 (字体, 字号, 字符) 缓存，折行与整幅布局再按输入缓存，重复布局只需微秒级；
+- 引用块按文字量在 32→20px 间选字号，仍放不下时截断并以“…”结尾，块顶随高度上移；
+- 选项按 1→4 列、26→16px 依次尝试，取第一个放得下的组合（少量选项保持原有单列位置）；
+  最密的组合仍放不下时分页，每页一幅画面，纵向拼接输出。
+
+无 CJK 字体时 Pillow 内置字体量不出中文宽度，全角字符按 1em 计，
+保证 html_render（浏览器字体）与 Pillow 两端都不会溢出。
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+import math
+import os
+import unicodedata
+
+from PIL import ImageFont
+
+# 常见平台上的中文字体（按顺序探测），可通过 font_path 配置覆盖
+FONT_CANDIDATES = (
+    "C:/Windows/Fonts/msyhbd.ttc",
+    "C:/Windows/Fonts/msyh.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Bold.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Bold.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/wqy-microhei/wqy-microhei.ttc",
+)
+
+QUOTE_SIZES = (32, 28, 24, 20)
+OPTION_SIZES = (26, 24, 22, 20, 18, 16)
+MAX_OPTION_COLS = 4
+MAX_OPTION_LINES = 3
+# 引用块：头像/昵称行高度与上下内边距
+QUOTE_HEAD = 88
+QUOTE_PAD_TOP = 18
+QUOTE_PAD_BOTTOM = 22
+# 选项胶囊左右内边距、列间距、字间距（与 CSS letter-spacing:1px 一致）
+OPTION_PAD_X = 18
+OPTION_GAP_X = 16
+OPTION_SPACING = 1
+
+
+def _resolve_font_path(font_path: str = "") -> str:
+    if font_path and os.path.exists(font_path):
+        return font_path
+    for fp in FONT_CANDIDATES:
+        if os.path.exists(fp):
+            return fp
+    return ""
+
+
+@lru_cache(maxsize=32)
+def load_font(font_path: str, size: int) -> ImageFont.ImageFont:
+    """按 (路径, 字号) 缓存字体对象；无可用字体时使用 Pillow 内置字体。"""
+    fp = _resolve_font_path(font_path)
+    if fp:
+        try:
+            return ImageFont.truetype(fp, size)
+        except Exception:
+            pass
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:  # Pillow < 10.1
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=16384)
+def char_width(font_path: str, size: int, ch: str) -> float:
+    w = float(load_font(font_path, size).getlength(ch))
+    if unicodedata.east_asian_width(ch) in ("W", "F"):
+        w = max(w, float(size))
+    return w
+
+
+def text_width(font_path: str, size: int, text: str, spacing: float = 0.0) -> float:
+    return sum(char_width(font_path, size, ch) for ch in text) + spacing * max(0, len(text) - 1)
+
+
+@lru_cache(maxsize=4096)
+def wrap_measured(text: str, font_path: str, size: int, max_w: int, spacing: float = 0.0) -> Tuple[str, ...]:
+    """按像素宽度逐字折行（中文无空格分词），保留原有换行；逐字宽度取缓存累加。"""
+    lines: List[str] = []
+    for para in (text or "").splitlines() or [""]:
+        cur, cur_w = "", 0.0
+        for ch in para:
+            cw = char_width(font_path, size, ch) + spacing
+            if cur and cur_w + cw > max_w:
+                lines.append(cur)
+                cur, cur_w = ch, cw
+            else:
+                cur += ch
+                cur_w += cw
+        lines.append(cur)
+    return tuple(lines)
+
+
+def _clamp(lines: Tuple[str, ...], max_lines: int, font_path: str, size: int, max_w: int, spacing: float = 0.0) -> Tuple[str, ...]:
+    """只保留 max_lines 行，末行以“…”结尾。"""
+    if len(lines) <= max_lines:
+        return lines
+    last = lines[max_lines - 1]
+    while last and text_width(font_path, size, last + "…", spacing) > max_w:
+        last = last[:-1]
+    return lines[: max_lines - 1] + (last + "…",)
+
+
+def scene_layout(width: int, height: int) -> Dict[str, int]:
+    """基础几何：少量选项时的原有位置、引用块默认位置与毛玻璃范围。"""
+    # 选项纵向位置（保持既有结构）
+    opt_tops = [int(height * r) for r in (0.20, 0.34, 0.48, 0.62)]
+    # 引用框宽度（用于与头像/名字关联），以及引用块顶端位置
+    quote_w = int(width * 0.86)
+    quote_top = max(opt_tops[2] + 110, int(height * 0.68))
+    # 仅用于引用区域的延伸毛玻璃（从引用块顶端到底部），覆盖整幅画面的下半部分
+    glass_top = quote_top
+    return {
+        "opt1_top": opt_tops[0],
+        "opt2_top": opt_tops[1],
+        "opt3_top": opt_tops[2],
+        "opt4_top": opt_tops[3],
+        "opt_step": opt_tops[1] - opt_tops[0],
+        "quote_w": quote_w,
+        "quote_top": quote_top,
+        "glass_left": 24,
+        "glass_w": max(0, width - 48),
+        "glass_top": glass_top,
+        "glass_h": max(120, height - glass_top),
+        "option_w": int(width * 0.7),
+    }
+
+
+def _quote_block(width: int, height: int, font_path: str, quote: str) -> Dict[str, Any]:
+    base = scene_layout(width, height)
+    max_w = base["quote_w"]
+    max_h = int(height * 0.45)
+    fixed = QUOTE_PAD_TOP + QUOTE_HEAD + QUOTE_PAD_BOTTOM
+    for size in QUOTE_SIZES:
+        line_h = int(size * 1.6)
+        lines = wrap_measured(quote, font_path, size, max_w)
+        if fixed + len(lines) * line_h <= max_h:
+            break
+    else:
+        lines = _clamp(lines, max(1, (max_h - fixed) // line_h), font_path, size, max_w)
+    block_h = fixed + len(lines) * line_h
+    # 短引用保持原位置；长引用整体上移，毛玻璃始终从引用块顶端延伸到底部
+    top = max(0, min(base["quote_top"], height - block_h))
+    return {
+        "quote_top": top,
+        "quote_w": max_w,
+        "quote_size": size,
+        "quote_line_h": line_h,
+        "quote_lines": lines,
+        "glass_left": base["glass_left"],
+        "glass_w": base["glass_w"],
+        "glass_top": top,
+        "glass_h": max(120, height - top),
+    }
+
+
+def _option_grid(
+    width: int, height: int, font_path: str, options: Tuple[str, ...], area_bottom: int, force: bool = False
+) -> Optional[Dict[str, Any]]:
+    """为 options 选列数/字号并排布；放不下返回 None（force=True 时单列最小字号并截断，保证有结果）。"""
+    base = scene_layout(width, height)
+    n = len(options)
+    if n == 0:
+        return {"options": [], "option_size": OPTION_SIZES[0], "option_cols": 1}
+    tops = (base["opt1_top"], int(height * 0.08))
+    col_plan = (1,) if force else tuple(c for c in range(1, MAX_OPTION_COLS + 1) if c <= n)
+    sizes = OPTION_SIZES[-1:] if force else OPTION_SIZES
+    for cols in col_plan:
+        rows = math.ceil(n / cols)
+        total_w = base["option_w"] + 2 * OPTION_PAD_X if cols == 1 else int(width * 0.92)
+        pill_w = (total_w - (cols - 1) * OPTION_GAP_X) // cols
+        text_w = pill_w - 2 * OPTION_PAD_X
+        if text_w < 80:
+            continue
+        for size in sizes:
+            pad_y = round(size * 0.54)
+            line_h = int(size * 1.25)
+            wrapped = []
+            for opt in options:
+                lines = wrap_measured(opt, font_path, size, text_w, OPTION_SPACING)
+                if len(lines) > MAX_OPTION_LINES:
+                    if not (force or size == OPTION_SIZES[-1]):
+                        break
+                    lines = _clamp(lines, MAX_OPTION_LINES, font_path, size, text_w, OPTION_SPACING)
+                wrapped.append(lines)
+            if len(wrapped) < n:
+                continue
+            heights = [2 * pad_y + line_h * len(lines) for lines in wrapped]
+            row_h = [max(heights[r * cols:(r + 1) * cols]) for r in range(rows)]
+            gap_min = max(6, size // 3)
+            for top0 in tops:
+                avail = area_bottom - top0
+                need = sum(row_h) + gap_min * (rows - 1)
+                if need > avail and not (force and top0 == tops[-1]):
+                    continue
+                # 行距：不超过原有步长，也不挤出可用区域
+                gap = gap_min
+                if rows > 1:
+                    ideal = max(gap_min, base["opt_step"] - max(row_h))
+                    gap = max(gap_min, min(ideal, (avail - sum(row_h)) // (rows - 1)))
+                left0 = (width - (cols * pill_w + (cols - 1) * OPTION_GAP_X)) // 2
+                placed = []
+                y = top0
+                for r in range(rows):
+                    for c in range(cols):
+                        i = r * cols + c
+                        if i >= n:
+                            break
+                        placed.append({
+                            "x": left0 + c * (pill_w + OPTION_GAP_X),
+                            "y": y,
+                            "w": pill_w,
+                            "h": heights[i],
+                            "lines": wrapped[i],
+                        })
+                    y += row_h[r] + gap
+                return {
+                    "options": placed,
+                    "option_size": size,
+                    "option_line_h": line_h,
+                    "option_pad_y": pad_y,
+                    "option_cols": cols,
+                }
+    return None
+
+
+@lru_cache(maxsize=512)
+def layout_step(width: int, height: int, font_path: str, quote: str, options: Tuple[str, ...]) -> Tuple[Dict[str, Any], ...]:
+    """一幅画面（引用 + 选项）的完整布局；选项放不下时分页，返回每页的布局。
+
+    结果被缓存共享，调用方只读不改。
+    """
+    q = _quote_block(width, height, font_path, quote)
+    area_bottom = q["quote_top"] - 10
+    pages: List[Dict[str, Any]] = []
+    rest = list(options)
+    while True:
+        k = len(rest)
+        grid = _option_grid(width, height, font_path, tuple(rest), area_bottom)
+        # 最密的组合也放不下：取能放下的最长前缀作为一页，其余留到下一页
+        while grid is None and k > 1:
+            k -= 1
+            grid = _option_grid(width, height, font_path, tuple(rest[:k]), area_bottom)
+        if grid is None:
+            grid = _option_grid(width, height, font_path, tuple(rest[:1]), area_bottom, force=True)
+            k = 1
+        pages.append(dict(q, **grid, option_offset=len(options) - len(rest)))
+        rest = rest[k:]
+        if not rest:
+            return tuple(pages)
@@ -0,0 +1,87 @@
+"""请求限流：按用户 / 群 / 全局的令牌桶。"""
+
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import time
+
+
+class TokenBucket:
+    """每分钟补充 rate 个令牌，最多积攒 burst 个。"""
+
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate_per_min: float, burst: float):
+        self.rate = max(0.0, float(rate_per_min)) / 60.0
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def available(self, now: float, cost: float = 1.0) -> bool:
+        self._refill(now)
+        return self.tokens >= cost
+
+    def retry_after(self, cost: float = 1.0) -> float:
+        if self.tokens >= cost or self.rate <= 0:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """用户、群、全局三级令牌桶。三级都有余量时才扣减，被任一级拒绝不消耗其它级的令牌。
+
+    rate_per_min<=0 表示该级不限流；按 key 的桶数量有上限，最久未用的先丢弃（等价于桶已回满）。
+    """
+
+    def __init__(
+        self,
+        user: Tuple[float, float],
+        group: Tuple[float, float],
+        global_: Tuple[float, float],
+        max_keys: int = 4096,
+    ):
+        self._conf = {"user": user, "group": group, "global": global_}
+        self._buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+        self.max_keys = max(1, int(max_keys))
+        self.allowed = 0
+        self.rejected: Dict[str, int] = {"user": 0, "group": 0, "global": 0}
+
+    def _bucket(self, scope: str, key: str) -> Optional[TokenBucket]:
+        rate, burst = self._conf[scope]
+        if rate <= 0:
+            return None
+        k = (scope, key)
+        b = self._buckets.get(k)
+        if b is None:
+            b = self._buckets[k] = TokenBucket(rate, burst)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(k)
+        return b
+
+    def acquire(self, user_id: str, group_id: str = "", cost: float = 1.0) -> Tuple[str, float]:
+        """尝试放行一次请求。放行返回 ("", 0)；拒绝返回 (被拒的级别, 建议等待秒数)。"""
+        now = time.monotonic()
+        scopes = [("global", ""), ("group", group_id), ("user", user_id)]
+        buckets = []
+        for scope, key in scopes:
+            if scope != "global" and not key:
+                continue
+            b = self._bucket(scope, key)
+            if b is None:
+                continue
+            if not b.available(now, cost):
+                self.rejected[scope] += 1
+                return scope, b.retry_after(cost)
+            buckets.append(b)
+        for b in buckets:
+            b.tokens -= cost
+        self.allowed += 1
+        return "", 0.0
+
+    def stats(self) -> Dict[str, object]:
+        return {"allowed": self.allowed, "rejected": dict(self.rejected), "buckets": len(self._buckets)}
@@ -6,12 +6,43 @@ import astrbot.api.message_components as Comp
 from typing import Dict, Any, List
 import asyncio
 import base64
+import json
 import mimetypes
-import html as html_lib
 import os
 import random
+import re
+import time
+import uuid
 import aiohttp
-from io import BytesIO
+
+from .assets import BackgroundIndex, seeded_choice
+from .avatars import THUMB_SIZE, AvatarCache, AvatarEntry
+from .cache import DataUrlCache, RenderCache, TTLCache, atomic_write
+from .executor import ImageExecutor
+from .gemini_stream import InlineDataExtractor
+from .imaging import avatar_thumbnail, placeholder_silhouette_png, process_portrait_bytes
+from .keys import KeyScheduler
+from .limits import RateLimiter
+from .metrics import Metrics, dump as dump_metrics
+from .option_cache import OptionCache
+from .options import OptionCollector
+from .portrait_cache import PortraitStore, bytes_digest, digest
+from .page_pool import PagePool, available as page_pool_available
+from .render import build_html, build_storyboard_html, composite_jpeg, composite_storyboard_jpeg, pool_payload, scene_digest
+
+# 内置系统与风格提示
+SYSTEM_PROMPT = "你是一个擅长生成互动小说选项的编剧，输出必须简洁、中文、具代入感。"
+STYLE_HINT = "中文表达；强情感；生动但简洁；不含命令/系统语。"
+# 长的在前：否则 “gal选项 …” 会先被 “gal” 截掉，剩下 “选项 …”
+COMMAND_PREFIXES = tuple(sorted(("/选项", "选项", "/gal", "gal", "/gal选项", "gal选项"), key=len, reverse=True))
+
+
+def _strip_command(text: str) -> str:
+    """去掉开头的指令词（/选项、gal选项 等），返回其后的参数文本。"""
+    for p in COMMAND_PREFIXES:
+        if text.startswith(p):
+            return text[len(p):].strip()
+    return text
 
 
 @register("astrbot_plugin_qqgal", "bvzrays", "引用文本生成 GalGame 风格选项", "2.0.0")
@@ -26,6 +57,90 @@ class QQGalPlugin(Star):
             os.makedirs(bg_dir, exist_ok=True)
         except Exception as e:
             logger.error("[qqgal] init background dir failed: %s", e)
+        cfg = self.cfg()
+        # 背景资源索引：预缩放到画布尺寸并预生成模糊底图，首次渲染前在后台构建
+        self._bg_index = BackgroundIndex(
+            os.path.join(os.path.dirname(__file__), str(cfg.get("background_dir", "background"))),
+            int(cfg.get("canvas_width", 1280)),
+            int(cfg.get("canvas_height", 720)),
+        )
+        self._bg_task: asyncio.Task | None = None
+        try:
+            self._bg_task = asyncio.get_running_loop().create_task(self._bg_index.refresh())
+        except RuntimeError:
+            pass
+        # OneBot get_msg 结果的短时缓存（按 bot + 消息 ID）
+        self._msg_cache = TTLCache(maxsize=256, ttl=float(cfg.get("get_msg_cache_ttl", 120)))
+        # 立绘生成 single-flight：qq -> (在途任务, 是否为强制刷新)
+        self._char_inflight: Dict[str, tuple[asyncio.Task, bool]] = {}
+        # 后台立绘生成队列（首次使用时创建 worker）
+        self._gen_queue: asyncio.Queue | None = None
+        self._gen_workers: List[asyncio.Task] = []
+        self._gen_queued: set[str] = set()
+        self._placeholder = ""
+        # 立绘内容寻址缓存（manifest + 原图保留 + 体积淘汰）
+        self._portraits = PortraitStore(
+            self._get_char_dir(), int(float(cfg.get("character_cache_mb", 512)) * 1024 * 1024)
+        )
+        # 头像本地缓存（原图 + 缩略图），超过 avatar_revalidate_hours 后条件请求重新验证
+        revalidate_h = float(cfg.get("avatar_revalidate_hours", 24))
+        self._avatars = AvatarCache(
+            os.path.join(os.path.dirname(__file__), "avatars"),
+            revalidate_h * 3600 if revalidate_h > 0 else float("inf"),
+        )
+        # 进行中的头像刷新：qq -> 任务
+        self._avatar_tasks: Dict[str, asyncio.Task] = {}
+        # Gemini Key 健康度调度
+        self._key_sched = KeyScheduler()
+        # 共享 HTTP 会话（头像下载/Gemini），首次使用时创建
+        self._http: aiohttp.ClientSession | None = None
+        # 已编码 data-url 的内存缓存（立绘抠图/背景），按 mtime/size 自动失效
+        self._asset_cache = DataUrlCache(int(float(cfg.get("asset_cache_mb", 64)) * 1024 * 1024))
+        # 渲染结果缓存：相同场景直接返回上次的图片
+        self._render_cache = RenderCache(
+            int(cfg.get("render_cache_size", 64)), int(float(cfg.get("render_cache_mb", 64)) * 1024 * 1024)
+        )
+        # LLM 选项结果的持久缓存（SQLite），每个 key 轮换 variety 组答案
+        self._option_cache: OptionCache | None = None
+        if bool(cfg.get("option_cache", False)):
+            self._option_cache = OptionCache(
+                os.path.join(os.path.dirname(__file__), "option_cache.sqlite3"),
+                float(cfg.get("option_cache_ttl_hours", 24)) * 3600,
+                int(cfg.get("option_cache_size", 2000)),
+                int(cfg.get("option_cache_variety", 3)),
+            )
+        # 常驻无头浏览器页面池（render_backend=pool，首次渲染时启动）
+        self._page_pool: PagePool | None = None
+        # 分阶段耗时/计数/字节指标（/qqgal_stats 查看，可定期导出到文件）
+        self._metrics = Metrics()
+        self._metrics_task: asyncio.Task | None = None
+        # 限流：用户/群/全局令牌桶 + 各阶段并发上限 + 相同请求合并
+        self._limiter = RateLimiter(
+            user=(float(cfg.get("rate_user_per_min", 6)), float(cfg.get("rate_user_burst", 3))),
+            group=(float(cfg.get("rate_group_per_min", 20)), float(cfg.get("rate_group_burst", 6))),
+            global_=(float(cfg.get("rate_global_per_min", 60)), float(cfg.get("rate_global_burst", 15))),
+        )
+        self._llm_sem = asyncio.Semaphore(max(1, int(cfg.get("llm_concurrency", 4))))
+        self._render_sem = asyncio.Semaphore(max(1, int(cfg.get("render_concurrency", 2))))
+        self._gemini_sem = asyncio.Semaphore(max(1, int(cfg.get("gemini_concurrency", 2))))
+        # 进行中的选项请求：_coalesce_key（会话, 目标, 引用文本, 数量, 是否渲染, 连续幕数）-> 任务，相同请求共享结果
+        self._options_inflight: Dict[tuple, asyncio.Task] = {}
+        # 不支持流式输出的 LLM 供应商（见 _provider_key），之后直接一次性调用
+        self._no_stream: set[tuple] = set()
+        # 已发送过限流提示的对象，短时间内不重复提示
+        self._reject_notified = TTLCache(maxsize=1024, ttl=10)
+        # CPU 密集图像阶段（抠色/标准化）执行器
+        self._image_executor = ImageExecutor(
+            mode=str(cfg.get("image_executor", "process")),
+            workers=int(cfg.get("image_workers", 2)),
+            queue_limit=int(cfg.get("image_queue_limit", 8)),
+            metrics=self._metrics,
+        )
+        if str(cfg.get("metrics_dump_path", "") or "").strip():
+            try:
+                self._metrics_task = asyncio.get_running_loop().create_task(self._metrics_dump_loop())
+            except RuntimeError:
+                pass
 
     def cfg(self) -> Dict[str, Any]:
         try:
@@ -34,20 +149,17 @@ class QQGalPlugin(Star):
             logger.error("[qqgal] read config failed: %s", e)
             return {}
 
-    async def _extract_quoted_text(self, event: AstrMessageEvent) -> str:
+    async def _extract_quoted_text(self, event: AstrMessageEvent, inline: str | None = None) -> str:
         """获取作为选项依据的原文：
-        1) 若消息携带文本参数，优先使用参数文本（指令词后内容）。
+        1) 若消息携带文本参数，优先使用参数文本（指令词后内容；inline 非 None 时以其为准）。
         2) 若为引用消息（OneBot v11/Napcat），尝试通过 get_msg 拉取被回复消息的纯文本。
         3) 否则返回空串。
         """
         # 1) 文本参数
         try:
-            text = (event.message_str or "").strip()
-            prefixes = ("/选项", "选项", "/gal", "gal", "/gal选项", "gal选项")
-            for p in prefixes:
-                if text.startswith(p):
-                    text = text[len(p):].strip()
-                    break
+            text = (event.message_str or "").strip() if inline is None else inline
+            if inline is None:
+                text = _strip_command(text)
             if text:
                 logger.debug(f"[qqgal] using inline text as base_text, len={len(text)}")
                 return text
@@ -55,59 +167,175 @@ class QQGalPlugin(Star):
             logger.debug("[qqgal] parse inline text failed", exc_info=True)
 
         # 2) 引用消息（OneBot v11）
+        try:
+            ret = await self._get_reply_msg(event)
+            # ret 结构兼容 OneBot：{"message": [ {type,text...} ] } 或 "message": "..."
+            msg = ret.get("message") if isinstance(ret, dict) else None
+            if isinstance(msg, list):
+                # 拼接纯文本
+                parts = []
+                for seg in msg:
+                    if seg.get("type") == "text":
+                        parts.append(seg.get("data", {}).get("text", ""))
+                txt = "".join(parts).strip()
+                if txt:
+                    logger.debug(f"[qqgal] got quoted text from get_msg, len={len(txt)}")
+                    return txt
+            elif isinstance(msg, str):
+                txt = msg.strip()
+                if txt:
+                    logger.debug(f"[qqgal] got quoted string from get_msg, len={len(txt)}")
+                    return txt
+        except Exception:
+            logger.debug("[qqgal] parse reply text failed", exc_info=True)
+        return ""
+
+    def _find_reply_id(self, event: AstrMessageEvent) -> str:
+        """从 raw_message 中找 reply 组件的消息 ID（每个事件只解析一次）。"""
+        try:
+            cached = event.get_extra("qqgal_reply_id")
+            if cached is not None:
+                return cached
+        except Exception:
+            pass
+        reply_id = ""
         try:
             raw = event.message_obj.raw_message
             if isinstance(raw, dict):
-                # 从消息链中找 reply 组件
-                reply_id = None
                 for seg in raw.get("message", []) or []:
                     if isinstance(seg, dict) and seg.get("type") == "reply":
                         data = seg.get("data", {}) or {}
-                        reply_id = data.get("id") or data.get("message_id")
+                        reply_id = str(data.get("id") or data.get("message_id") or "")
                         break
-                if reply_id and event.get_platform_name() == "aiocqhttp":
-                    logger.debug(f"[qqgal] detected reply id={reply_id}, try get_msg")
-                    # 调 OneBot get_msg
-                    try:
-                        client = getattr(event, "bot", None)
-                        if client is not None:
-                            ret = await client.api.call_action("get_msg", message_id=int(reply_id))
-                            # ret 结构兼容 OneBot：{"message": [ {type,text...} ] } 或 "message": "..."
-                            msg = ret.get("message") if isinstance(ret, dict) else None
-                            if isinstance(msg, list):
-                                # 拼接纯文本
-                                parts = []
-                                for seg in msg:
-                                    if seg.get("type") == "text":
-                                        parts.append(seg.get("data", {}).get("text", ""))
-                                txt = "".join(parts).strip()
-                                if txt:
-                                    logger.debug(f"[qqgal] got quoted text from get_msg, len={len(txt)}")
-                                    return txt
-                            elif isinstance(msg, str):
-                                txt = msg.strip()
-                                if txt:
-                                    logger.debug(f"[qqgal] got quoted string from get_msg, len={len(txt)}")
-                                    return txt
-                    except Exception:
-                        logger.debug("[qqgal] get_msg failed", exc_info=True)
-                        pass
         except Exception:
-            logger.debug("[qqgal] parse reply text failed", exc_info=True)
+            logger.debug("[qqgal] parse reply segment failed", exc_info=True)
+        try:
+            event.set_extra("qqgal_reply_id", reply_id)
+        except Exception:
+            pass
+        return reply_id
+
+    def _first_at_id(self, event: AstrMessageEvent) -> str:
+        """消息中第一个 @ 的 QQ（忽略 @全体），没有则返回空串。"""
+        try:
+            raw = event.message_obj.raw_message
+            if isinstance(raw, dict):
+                for seg in raw.get("message", []) or []:
+                    if isinstance(seg, dict) and seg.get("type") == "at":
+                        qq = (seg.get("data", {}) or {}).get("qq")
+                        if qq and qq != "all":
+                            return str(qq)
+        except Exception:
+            logger.debug("[qqgal] parse at segment failed", exc_info=True)
         return ""
 
+    async def _get_reply_msg(self, event: AstrMessageEvent) -> Dict[str, Any] | None:
+        """被回复消息的 OneBot get_msg 结果。
+
+        同一事件内多次调用共享同一次请求（事件级 memo），
+        不同事件按消息 ID 命中短时 TTL 缓存（多人连续引用同一条消息时免请求）。
+        """
+        reply_id = self._find_reply_id(event)
+        if not reply_id or event.get_platform_name() != "aiocqhttp":
+            return None
+        try:
+            task = event.get_extra("qqgal_reply_msg")
+        except Exception:
+            task = None
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_msg(event, reply_id))
+            try:
+                event.set_extra("qqgal_reply_msg", task)
+            except Exception:
+                pass
+        return await asyncio.shield(task)
+
+    async def _fetch_msg(self, event: AstrMessageEvent, message_id: str) -> Dict[str, Any] | None:
+        key = (event.get_self_id(), message_id)
+        ret = self._msg_cache.get(key)
+        if ret is not None:
+            logger.debug(f"[qqgal] get_msg cache hit id={message_id}")
+            self._metrics.incr("get_msg_cache_hit")
+            return ret
+        client = getattr(event, "bot", None)
+        if client is None:
+            return None
+        logger.debug(f"[qqgal] detected reply id={message_id}, try get_msg")
+        try:
+            with self._metrics.timer("get_msg"):
+                ret = await client.api.call_action("get_msg", message_id=int(message_id))
+        except Exception:
+            logger.debug("[qqgal] get_msg failed", exc_info=True)
+            self._metrics.incr("get_msg_fail")
+            return None
+        if isinstance(ret, dict):
+            self._msg_cache.set(key, ret)
+            return ret
+        return None
+
     def _letters(self, n: int) -> List[str]:
         base = ord('A')
         return [chr(base + i) for i in range(max(0, n))][:26]
 
-    async def _gen_options(self, event: AstrMessageEvent, base_text: str, option_count: int) -> str:
-        cfg = self.cfg()
-        provider_id = cfg.get("provider_id", "")
-        # 内置系统与风格提示
-        system_prompt = "你是一个擅长生成互动小说选项的编剧，输出必须简洁、中文、具代入感。"
-        style_hint = "中文表达；强情感；生动但简洁；不含命令/系统语。"
+    def _prompt_head(self, first_line: str, base_text: str) -> str:
+        tmpl = self.cfg().get("prompt_template", "")
+        return (
+            first_line + "\n" + (tmpl.rstrip() + "\n\n" if tmpl else "\n")
+            + f"触发选项的对方所说的话：【{base_text if base_text else '（无原文，生成一个遇到重要角色的通用浪漫场景）'}】\n"
+            + f"你必须遵循的风格/提示：【{STYLE_HINT}】\n"
+        )
 
+    async def _gen_options(self, event: AstrMessageEvent, base_text: str, option_count: int) -> List[str]:
+        """严格逐行格式生成选项：流式读取时凑齐即停；缺的代号只定向补问一次。"""
+        letters = self._letters(option_count)
+        first_line = f"请基于这段原文所描述的情境，生成 {option_count} 个极具 GalGame 风格 的下一步选项。"
+        head = self._prompt_head(first_line, base_text)
+        prompt = (
+            head + f"需要的选项代号：{', '.join(letters)}。\n"
+            + "严格每行一个选项，格式为“代号. 选项内容”，不要输出任何其它内容。\n"
+        )
+        cache_key = ""
+        if self._option_cache is not None:
+            cfg = self.cfg()
+            cache_key = digest(
+                base_text, option_count, cfg.get("prompt_template", ""),
+                self._provider_label(self._get_provider(event)), cfg.get("model", None),
+            )
+            cached = self._option_cache.get(cache_key)
+            if cached is not None and len(cached) == option_count:
+                logger.info("[qqgal] 命中选项缓存，n=%d", option_count)
+                self._metrics.incr("option_cache_hit")
+                return cached
+        logger.info(f"[qqgal] generating {option_count} options")
+        col = OptionCollector(letters)
+        raw, ok = await self._llm_lines(event, prompt, col)
+        if not ok:
+            # 供应商不可用/调用失败：沿用原有的文本规范化（提示语作为选项展示）
+            return self._normalize_options(raw, option_count).splitlines()
+        missing = col.missing()
+        if missing and bool(self.cfg().get("options_reask", True)):
+            logger.info("[qqgal] 选项缺少 %s（无效 %d 行），定向补问", ",".join(missing), col.rejected + len(col.extra))
+            self._metrics.incr("options_reask")
+            have = "\n".join(f"{c}. {col.get(c)}" for c in letters if col.get(c))
+            reask = (
+                head + (f"已有选项：\n{have}\n" if have else "")
+                + f"请只补充代号 {', '.join(missing)} 的选项，不要重复已有选项；"
+                + "严格每行一个，格式为“代号. 选项内容”，不要输出任何其它内容。\n"
+            )
+            extra = OptionCollector(missing)
+            _, ok = await self._llm_lines(event, reask, extra)
+            if ok:
+                col.merge(extra)
+        if col.missing():
+            self._metrics.incr("options_padded", len(col.missing()))
+        elif cache_key:
+            # 只缓存完整有效的结果（不含占位）
+            self._option_cache.put(cache_key, col.options())
+        return col.options()
+
+    def _get_provider(self, event: AstrMessageEvent) -> Any:
         # 选择供应商：优先ID，否则使用当前会话绑定的供应商
+        provider_id = self.cfg().get("provider_id", "")
         provider = None
         try:
             if provider_id:
@@ -116,54 +344,131 @@ class QQGalPlugin(Star):
             provider = None
         if provider is None:
             provider = self.context.get_using_provider(umo=event.unified_msg_origin)
-        if provider is None:
-            return "未找到可用的 LLM 供应商，请在 WebUI 选择或在配置中指定 provider_id。"
+        if provider is not None:
+            logger.debug(f"[qqgal] llm provider={self._provider_label(provider)}")
+        return provider
+
+    def _provider_label(self, provider: Any) -> str:
         try:
-            pid = getattr(provider, "provider_id", None) or getattr(provider, "id", None) or "unknown"
-            logger.info(f"[qqgal] generating {option_count} options via provider={pid}")
+            return str(getattr(provider, "provider_id", None) or getattr(provider, "id", None) or "unknown")
         except Exception:
-            logger.info(f"[qqgal] generating {option_count} options via provider=<unknown>")
+            return "unknown"
 
-        letters = ", ".join(self._letters(option_count))
-        first_line = f"请基于这段原文所描述的情境，生成 {option_count} 个极具 GalGame 风格 的下一步选项。"
-        tmpl = cfg.get("prompt_template", "")
-        prompt = (
-            first_line + "\n" + (tmpl.rstrip() + "\n\n" if tmpl else "\n")
-            + f"触发选项的对方所说的话：【{base_text if base_text else '（无原文，生成一个遇到重要角色的通用浪漫场景）'}】\n"
-            + f"你必须遵循的风格/提示：【{style_hint}】\n"
-            + f"需要的选项代号：{letters}。\n"
+    def _provider_key(self, provider: Any) -> tuple:
+        """供应商的稳定标识（类型 + provider_id），不用 id()：对象被替换后地址可能复用。"""
+        return (type(provider).__module__, type(provider).__qualname__, self._provider_label(provider))
+
+    def _resp_text(self, resp: Any) -> str:
+        """统一抽取 LLM 响应文本（text/content/completion_text/result_chain）。"""
+        content = (
+            getattr(resp, "text", None) or getattr(resp, "content", None)
+            or getattr(resp, "completion_text", None)
         )
+        if not content:
+            rc = getattr(resp, "result_chain", None)
+            if rc and getattr(rc, "chain", None):
+                parts = []
+                for seg in rc.chain:
+                    if hasattr(seg, "text"):
+                        parts.append(str(seg.text))
+                content = "\n".join(parts)
+        return str(content) if content else ""
 
+    async def _llm_text(self, event: AstrMessageEvent, prompt: str) -> str:
+        """调用 LLM 并统一抽取文本；失败时返回给用户看的提示文本。"""
+        provider = self._get_provider(event)
+        if provider is None:
+            return "未找到可用的 LLM 供应商，请在 WebUI 选择或在配置中指定 provider_id。"
         try:
-            resp = await provider.text_chat(
-                prompt=prompt,
-                context=[],
-                system_prompt=system_prompt,
-                model=cfg.get("model", None)
-            )
-            # 统一抽取文本
-            content = getattr(resp, "text", None) or getattr(resp, "content", None)
-            if not content:
-                rc = getattr(resp, "result_chain", None)
-                if rc and getattr(rc, "chain", None):
-                    try:
-                        from astrbot.api.message_components import Plain
-                    except Exception:
-                        Plain = None
-                    parts = []
-                    for seg in rc.chain:
-                        if hasattr(seg, "text"):
-                            parts.append(str(seg.text))
-                    content = "\n".join(parts)
-            if not content:
-                content = str(resp)
-            content = str(content).strip()
+            async with self._llm_sem:
+                with self._metrics.timer("llm"):
+                    resp = await provider.text_chat(
+                        prompt=prompt,
+                        context=[],
+                        system_prompt=SYSTEM_PROMPT,
+                        model=self.cfg().get("model", None)
+                    )
+            content = (self._resp_text(resp) or str(resp)).strip()
             logger.debug(f"[qqgal] raw llm content len={len(content)}")
             return content
         except Exception as e:
             logger.error(f"调用 LLM 失败: {e}")
+            self._metrics.incr("llm_fail")
             return "LLM 调用失败，请稍后重试。"
 
+    async def _llm_lines(self, event: AstrMessageEvent, prompt: str, col: OptionCollector) -> tuple[str, bool]:
+        """调用 LLM 并把输出喂给 col，返回 (原文, 是否调用成功)。
+
+        供应商支持 text_chat_stream 且开启 llm_stream 时流式读取，col 凑齐后立即停止
+        （关闭流，不再等待剩余 token）；否则退化为一次性 text_chat。
+        """
+        cfg = self.cfg()
+        provider = self._get_provider(event)
+        if provider is None:
+            return "未找到可用的 LLM 供应商，请在 WebUI 选择或在配置中指定 provider_id。", False
+        stream_fn = None
+        if bool(cfg.get("llm_stream", True)) and self._provider_key(provider) not in self._no_stream:
+            stream_fn = getattr(provider, "text_chat_stream", None)
+        kwargs = {"prompt": prompt, "context": [], "system_prompt": SYSTEM_PROMPT, "model": cfg.get("model", None)}
+        t0 = time.perf_counter()
+        streamed = ""
+        try:
+            async with self._llm_sem:
+                with self._metrics.timer("llm"):
+                    if callable(stream_fn):
+                        try:
+                            agen = stream_fn(**kwargs)
+                            try:
+                                async for chunk in agen:
+                                    piece = self._resp_text(chunk)
+                                    if not getattr(chunk, "is_chunk", True):
+                                        # 结束时的完整响应：已流式收到内容则忽略
+                                        if streamed:
+                                            continue
+                                    had = len(col.letters) - len(col.missing())
+                                    streamed += piece
+                                    col.feed(piece)
+                                    if not had and len(col.letters) > len(col.missing()):
+                                        self._metrics.observe("llm_first_option", time.perf_counter() - t0)
+                                    if col.done:
+                                        self._metrics.incr("llm_early_stop")
+                                        break
+                            finally:
+                                aclose = getattr(agen, "aclose", None)
+                                if aclose is not None:
+                                    await aclose()
+                            self._metrics.incr("llm_stream")
+                            col.finish()
+                            logger.debug(f"[qqgal] streamed llm content len={len(streamed)}")
+                            return streamed, True
+                        except (NotImplementedError, AttributeError, TypeError) as e:
+                            if streamed:
+                                raise
+                            # 流式不受支持（未实现/签名不符）：记住该供应商，之后直接一次性调用
+                            logger.debug(f"[qqgal] llm stream unsupported, fallback to text_chat: {e}")
+                            self._no_stream.add(self._provider_key(provider))
+                        except Exception as e:
+                            if streamed:
+                                raise
+                            # 超时/网络等临时错误：仅本次改用一次性调用，下次仍尝试流式
+                            logger.warning(f"[qqgal] llm stream failed before first chunk, retry with text_chat: {e}")
+                            self._metrics.incr("llm_stream_fallback")
+                    resp = await provider.text_chat(**kwargs)
+            content = (self._resp_text(resp) or str(resp)).strip()
+            col.feed(content)
+            col.finish()
+            logger.debug(f"[qqgal] raw llm content len={len(content)}")
+            return content, True
+        except Exception as e:
+            if streamed:
+                # 流读到一半中断：已到达的有效选项照常使用，缺的交给补问
+                logger.warning(f"[qqgal] llm stream interrupted: {e}")
+                col.finish()
+                return streamed, True
+            logger.error(f"调用 LLM 失败: {e}")
+            self._metrics.incr("llm_fail")
+            return "LLM 调用失败，请稍后重试。", False
+
     def _normalize_options(self, raw: str, n: int) -> str:
         """规范化 LLM 输出：
         - 优先提取以 大写字母. 开头的行（A./B./C.）。
@@ -199,6 +504,65 @@ class QQGalPlugin(Star):
         # 只保留 n 行
         return "\n".join(result[:n])
 
+    def _storyboard_steps(self, event: AstrMessageEvent) -> tuple[int, str]:
+        """解析“/选项 连续 [幕数] [文本]”，返回 (幕数, 剩余文本)；非连续模式返回 (0, "")。"""
+        text = _strip_command((event.message_str or "").strip())
+        # “连续”后须紧跟空白、幕数或结尾，避免“连续不断地……”这类普通引用被误判
+        m = re.match(r"^连续(?:\s*(\d+))?(?:\s+|$)(.*)$", text, re.S)
+        if not m:
+            return 0, ""
+        max_steps = max(1, int(self.cfg().get("storyboard_max_steps", 5)))
+        steps = int(m.group(1)) if m.group(1) else int(self.cfg().get("storyboard_steps", 3))
+        return max(1, min(max_steps, steps)), m.group(2).strip()
+
+    async def _gen_storyboard(self, event: AstrMessageEvent, base_text: str, steps: int, n: int) -> str:
+        """一次 LLM 调用生成多幕分支剧情（JSON）。"""
+        letters = self._letters(n)
+        first_line = f"请基于这段原文所描述的情境，续写一段 {steps} 幕的 GalGame 分支剧情，每幕 {n} 个选项。"
+        prompt = (
+            self._prompt_head(first_line, base_text)
+            + f"第 1 幕的台词就是上面的原文；每一幕给出 {n} 个选项（代号 {', '.join(letters)}）以及主角所选的代号，"
+            + "下一幕的台词是对方对所选选项的回应，最后一幕不必选择。\n"
+            + "只输出 JSON，不要任何解释，格式：\n"
+            + '{"scenes": [{"line": "对方的台词", "options": ["A. 选项", "B. 选项"], "choice": "A"}]}\n'
+        )
+        logger.info(f"[qqgal] generating storyboard steps={steps} n={n}")
+        return await self._llm_text(event, prompt)
+
+    def _parse_storyboard(self, raw: str, base_text: str, steps: int, n: int) -> List[Dict[str, Any]]:
+        """解析剧情 JSON 为各幕 {quote, options, chosen, chapter}；无法解析时按普通选项退化为单幕。"""
+        scenes: List[Any] = []
+        text = (raw or "").strip()
+        start, end = text.find("{"), text.rfind("}")
+        if start >= 0 and end > start:
+            try:
+                data = json.loads(text[start:end + 1])
+                scenes = (data.get("scenes") or []) if isinstance(data, dict) else []
+            except ValueError:
+                logger.debug("[qqgal] storyboard json parse failed", exc_info=True)
+        if not isinstance(scenes, list) or not scenes:
+            scenes = [{"line": base_text, "options": text.splitlines()}]
+        letters = self._letters(n)
+        out: List[Dict[str, Any]] = []
+        for i, sc in enumerate(scenes[:steps]):
+            if not isinstance(sc, dict):
+                continue
+            opts = sc.get("options") or []
+            if isinstance(opts, str):
+                opts = opts.splitlines()
+            # 按列表顺序重新编号（模型给的代号可能重复/缺失），不足 n 个用占位补齐
+            texts = [re.sub(r"^[A-Za-z][.．、:：]\s*", "", str(o).strip()) for o in opts if str(o).strip()]
+            texts = (texts + ["……"] * n)[:n]
+            options = [f"{letters[j]}. {t}" for j, t in enumerate(texts)]
+            choice = str(sc.get("choice") or "").strip().upper()[:1]
+            chosen = letters.index(choice) if choice in letters else None
+            quote = base_text if i == 0 and base_text else str(sc.get("line") or "").strip()
+            out.append({"quote": quote or "……", "options": options, "chosen": chosen, "chapter": f"CHAPTER {i + 1}"})
+        if out:
+            # 最后一幕留给玩家选择
+            out[-1]["chosen"] = None
+        return out
+
     async def _get_display_and_avatar(self, event: AstrMessageEvent) -> tuple[str, str, str]:
         """优先返回被回复对象（或第一个@对象）的昵称/ID 与头像。
 
@@ -212,45 +576,32 @@ class QQGalPlugin(Star):
             raw = event.message_obj.raw_message
             if isinstance(raw, dict):
                 # 1) 被回复对象
-                reply_id = None
-                for seg in raw.get("message", []) or []:
-                    if isinstance(seg, dict) and seg.get("type") == "reply":
-                        data = seg.get("data", {}) or {}
-                        reply_id = data.get("id") or data.get("message_id")
-                        break
-                if reply_id and event.get_platform_name() == "aiocqhttp":
-                    try:
-                        client = getattr(event, "bot", None)
-                        if client is not None:
-                            ret = await client.api.call_action("get_msg", message_id=int(reply_id))
-                            snd = (ret or {}).get("sender", {}) if isinstance(ret, dict) else {}
-                            uid = snd.get("user_id") or snd.get("uid") or snd.get("uin")
-                            nick = snd.get("card") or snd.get("nickname") or snd.get("nick")
-                            # 如果引用的是机器人的消息，则尝试从消息链里找第一个@的人
-                            if uid and str(uid) == event.get_self_id():
-                                msglist = (ret or {}).get("message") if isinstance(ret, dict) else None
-                                if isinstance(msglist, list):
-                                    for seg in msglist:
-                                        if isinstance(seg, dict) and seg.get("type") == "at":
-                                            qq = (seg.get("data", {}) or {}).get("qq")
-                                            if qq and qq != "all":
-                                                uid = qq
-                                                nick = None
-                                                break
-                            if uid:
-                                target_id = str(uid)
-                                target_name = str(nick or uid)
-                    except Exception:
-                        logger.debug("[qqgal] get_msg for avatar failed", exc_info=True)
+                try:
+                    ret = await self._get_reply_msg(event)
+                    if isinstance(ret, dict):
+                        snd = ret.get("sender", {}) or {}
+                        uid = snd.get("user_id") or snd.get("uid") or snd.get("uin")
+                        nick = snd.get("card") or snd.get("nickname") or snd.get("nick")
+                        # 如果引用的是机器人的消息，则尝试从消息链里找第一个@的人
+                        if uid and str(uid) == event.get_self_id():
+                            msglist = ret.get("message")
+                            if isinstance(msglist, list):
+                                for seg in msglist:
+                                    if isinstance(seg, dict) and seg.get("type") == "at":
+                                        qq = (seg.get("data", {}) or {}).get("qq")
+                                        if qq and qq != "all":
+                                            uid = qq
+                                            nick = None
+                                            break
+                        if uid:
+                            target_id = str(uid)
+                            target_name = str(nick or uid)
+                except Exception:
+                    logger.debug("[qqgal] get_msg for avatar failed", exc_info=True)
 
                 # 2) 第一个 @ 对象
                 if not target_id:
-                    for seg in raw.get("message", []) or []:
-                        if isinstance(seg, dict) and seg.get("type") == "at":
-                            qq = (seg.get("data", {}) or {}).get("qq")
-                            if qq and qq != "all":
-                                target_id = str(qq)
-                                break
+                    target_id = self._first_at_id(event) or None
 
         except Exception:
             logger.debug("[qqgal] parse target for avatar failed", exc_info=True)
@@ -266,7 +617,7 @@ class QQGalPlugin(Star):
         display = f"{target_name} ({target_id})"
         return display, avatar, target_id
 
-    def _pick_background(self) -> str:
+    def _pick_background(self, seed: str | None = None) -> str:
         base_dir = os.path.dirname(__file__)
         rel = str(self.cfg().get("background_dir", "background"))
         dirp = os.path.join(base_dir, rel)
@@ -274,19 +625,28 @@ class QQGalPlugin(Star):
             files = [f for f in os.listdir(dirp) if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))]
             if not files:
                 return ""
-            choice = random.choice(files)
+            choice = seeded_choice(sorted(files), seed) if seed is not None else random.choice(files)
             return os.path.join(dirp, choice)
         except Exception as e:
             logger.debug("[qqgal] pick background failed: %s", e)
             return ""
 
+    async def _background_urls(self, seed: str | None = None) -> tuple[str, str, str]:
+        """返回 (背景, 模糊底图, 底图 CSS 滤镜)；seed 非空时按其确定性选择背景。"""
+        asset = await self._bg_index.pick(seed)
+        # 嵌入为 data URL，避免 file:// 在某些环境不可读/中文路径问题
+        if asset is not None:
+            # 预缩放 + 预模糊的底图，渲染端无需再做 blur 滤镜
+            return asset.main_url, asset.blur_url, "none"
+        bg = self._pick_background(seed)
+        bg_url = self._data_url(bg) if bg else ""
+        return bg_url, bg_url, "blur(18px) brightness(0.7)"
+
     def _data_url(self, path: str) -> str:
         try:
             mime, _ = mimetypes.guess_type(path)
             mime = mime or "image/jpeg"
-            with open(path, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode("ascii")
-            return f"data:{mime};base64,{b64}"
+            return self._asset_cache.get(path, mime)
         except Exception as e:
             logger.debug("[qqgal] data_url encode failed: %s", e)
             return ""
@@ -313,185 +673,208 @@ class QQGalPlugin(Star):
         dirp = self._get_char_dir()
         return os.path.join(dirp, f"{qq}-matte.png")
 
-    def _load_character_from_disk(self, qq: str) -> tuple[str, bool]:
-        fp = self._char_file_for(qq)
-        if not os.path.exists(fp):
-            return "", False
+    def _file_to_data_url(self, fp: str) -> str:
         try:
-            mime, _ = mimetypes.guess_type(fp)
-            mime = mime or "image/png"
-            with open(fp, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode("ascii")
-            return f"data:{mime};base64,{b64}", ("png" in (mime or ""))
+            return self._asset_cache.get(fp, "image/png")
         except Exception:
-            return "", False
+            return ""
 
-    def _save_data_url_to_disk(self, data_url: str, qq: str, *, save_as_matte: bool = False) -> str:
+    def _atomic_write(self, fp: str, data: bytes) -> bool:
+        """原子写入（见 cache.atomic_write），失败记录日志并返回 False。"""
         try:
-            if not data_url.startswith("data:"):
-                return ""
-            head, b64 = data_url.split(",", 1)
-            # 统一转为 PNG 落盘便于后续处理
-            raw = base64.b64decode(b64)
-            from PIL import Image
-            img = Image.open(BytesIO(raw)).convert("RGBA")
-            fp = self._char_matte_file_for(qq) if save_as_matte else self._char_file_for(qq)
-            with open(fp, "wb") as f:
-                buf = BytesIO()
-                img.save(buf, format='PNG')
-                f.write(buf.getvalue())
-            return fp
+            atomic_write(fp, data)
+            return True
         except Exception:
-            return ""
+            logger.error("[qqgal] atomic write failed: %s", fp, exc_info=True)
+            return False
 
-    def _file_to_data_url(self, fp: str) -> str:
+    async def _process_portrait(self, raw: bytes, qq: str) -> str:
+        """融合流水线：一次解码 → 抠色 → 收边羽化 → 裁剪居中 → 一次 PNG 编码 → 一次原子写入 qq-matte.png。
+        在图像执行器中运行，返回 PNG data-url；失败返回空串。"""
+        cfg = self.cfg()
+        tol = int(cfg.get("chroma_tolerance", 80))
+        chroma = str(cfg.get("chroma_bg_color", "#00FF00"))
+        std_size = int(cfg.get('character_canvas_size', 1024))
         try:
-            with open(fp, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode("ascii")
-            return f"data:image/png;base64,{b64}"
+            png, timings = await self._image_executor.run(
+                "portrait", process_portrait_bytes, raw, chroma, tol, std_size, 0
+            )
         except Exception:
+            logger.error("[qqgal-生图] 立绘处理失败（抠色/标准化）", exc_info=True)
             return ""
+        for k, v in timings.items():
+            self._metrics.observe(f"portrait_{k}", v)
+        self._metrics.size("portrait_png", len(png))
+        logger.info(
+            "[qqgal-生图] 立绘处理完成，%s，输出=%d 字节",
+            "，".join(f"{k}={v * 1000:.0f}ms" for k, v in timings.items()), len(png),
+        )
+        matte_fp = self._char_matte_file_for(qq)
+        self._atomic_write(matte_fp, png)
+        self._asset_cache.invalidate(matte_fp)
+        return f"data:image/png;base64,{base64.b64encode(png).decode('ascii')}"
 
-    def _matte_chroma_dataurl_sync(self, data_url: str, chroma: str, tol: int, qq: str) -> tuple[str, bool]:
-        """同步抠色实现：CPU 密集，供 to_thread 调用。
-        增强项：
-        - 采用欧氏距离阈值；
-        - 先腐蚀后高斯模糊，收掉 1~2px 的绿色边缘；
-        - 适度扩大透明区域，减少绿边影响居中与缩放。
-        """
-        from PIL import Image, ImageFilter, ImageChops
-        if not data_url.startswith("data:"):
-            return data_url, data_url.startswith("data:image/png")
-        head, b64 = data_url.split(",", 1)
-        base64_bytes = base64.b64decode(b64)
-        img = Image.open(BytesIO(base64_bytes)).convert("RGBA")
-        hx = chroma.lstrip('#')
-        key = tuple(int(hx[i:i+2], 16) for i in (0,2,4))
-
-        thr2 = tol * tol
-        w, h = img.size
-        # 初始为全不透明
-        mask = Image.new('L', (w, h), 255)
-        px = img.load()
-        mk = mask.load()
-        for y in range(h):
-            for x in range(w):
-                r, g, b, a = px[x, y]
-                dr = r - key[0]
-                dg = g - key[1]
-                db = b - key[2]
-                if (dr*dr + dg*dg + db*db) <= thr2:
-                    mk[x, y] = 0
-        # 轻度腐蚀收边，去掉 1~2 像素绿边
-        try:
-            mask = mask.filter(ImageFilter.MinFilter(3))
-        except Exception:
-            pass
-        # 轻度羽化
-        mask = mask.filter(ImageFilter.GaussianBlur(1.2))
-        r, g, b, alpha = img.split()
-        alpha = Image.eval(mask, lambda v: min(255, v))
-        img = Image.merge('RGBA', (r, g, b, alpha))
-
-        buf = BytesIO()
-        img.save(buf, format='PNG')
-        b64png = base64.b64encode(buf.getvalue()).decode('ascii')
-        final_url = f"data:image/png;base64,{b64png}"
-        try:
-            self._save_data_url_to_disk(final_url, qq, save_as_matte=True)
-        except Exception:
-            pass
-        return final_url, True
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """插件生命周期内共享的 HTTP 会话（长连接 + DNS 缓存），terminate() 时关闭。"""
+        if self._http is None or self._http.closed:
+            cfg = self.cfg()
+            connector = aiohttp.TCPConnector(
+                limit=int(cfg.get("http_pool_size", 32)),
+                limit_per_host=int(cfg.get("http_pool_per_host", 8)),
+                keepalive_timeout=30,
+                ttl_dns_cache=300,
+            )
+            self._http = aiohttp.ClientSession(connector=connector)
+        return self._http
 
-    async def _matte_chroma_dataurl(self, data_url: str, chroma: str, tol: int, qq: str) -> tuple[str, bool]:
-        """异步封装：在独立线程执行抠色，避免阻塞事件循环。"""
-        try:
-            return await asyncio.to_thread(self._matte_chroma_dataurl_sync, data_url, chroma, tol, qq)
-        except Exception:
-            logger.error("[qqgal-生图] 抠色处理失败(缓存/回退路径)", exc_info=True)
-            return data_url, ("data:image/png" in data_url)
-
-    def _standardize_character_canvas_sync(self, data_url: str, size: int, width_ratio: float, bottom_pad: int, qq: str) -> str:
-        """将抠好的人物立绘标准化到 size×size 透明画布中：
-        - 等比放大到“左右对齐”（宽度=画布宽度），
-        - 基于轮廓质心做水平居中，避免人物偏一侧；
-        - 底部对齐（人物底边贴近画布底边，允许上方溢出被裁切），
-        以确保不同原图比例得到一致的最终合成尺寸。
-        返回 data-url，并覆盖到 qq-matte.png。
+    def _http_timeout(self, read_key: str, read_default: float) -> aiohttp.ClientTimeout:
+        cfg = self.cfg()
+        return aiohttp.ClientTimeout(
+            total=None,
+            connect=float(cfg.get("http_connect_timeout", 10)),
+            sock_read=float(cfg.get(read_key, read_default)),
+        )
+
+    async def _fetch_image(self, url: str, etag: str = "", last_modified: str = "") -> tuple[int, bytes, str, Dict[str, str]]:
+        """下载图片，返回 (状态码, 字节, mime, 校验头 {"etag", "last_modified"})。
+
+        传入 etag/last_modified 时发送 If-None-Match/If-Modified-Since 条件请求，未变化返回 304 与空字节；
+        失败状态码为 0 或非 200。
         """
-        from PIL import Image
-        if not data_url.startswith("data:"):
-            return data_url
-        head, b64 = data_url.split(",", 1)
-        img = Image.open(BytesIO(base64.b64decode(b64))).convert("RGBA")
-        # 取非透明 bbox
-        alpha = img.split()[3]
-        bbox = alpha.getbbox()
-        if not bbox:
-            return data_url
-        crop = img.crop(bbox)
-        alpha_crop = alpha.crop(bbox)
-        # 从底部往上等比放大：尽可能大但不裁切（contain），
-        # 当任意边触达画布边框时停止放大。
-        scale = min(size / max(1, crop.width), size / max(1, crop.height))
-        new_w = max(1, int(crop.width * scale))
-        new_h = max(1, int(crop.height * scale))
-        crop = crop.resize((new_w, new_h), Image.LANCZOS)
-        alpha_crop = alpha_crop.resize((new_w, new_h), Image.LANCZOS)
-        # 计算轮廓质心，按质心居中
-        try:
-            # 质心 x：sum(x*mask)/sum(mask)
-            sum_w = 0
-            sum_xw = 0
-            px = alpha_crop.load()
-            for y in range(new_h):
-                row_sum = 0
-                row_xw = 0
-                for x in range(new_w):
-                    wv = px[x, y]
-                    if wv > 0:
-                        sum_w += wv
-                        sum_xw += wv * x
-            cx = (sum_xw / sum_w) if sum_w > 0 else (new_w / 2)
-        except Exception:
-            cx = new_w / 2
-        # 粘贴到标准画布
-        canvas = Image.new('RGBA', (size, size), (0,0,0,0))
-        desired_cx = size / 2
-        shift = int(round(desired_cx - cx))
-        x = (size - new_w) // 2 + shift
-        # 约束不越界
-        if x < 0:
-            x = 0
-        if x > size - new_w:
-            x = size - new_w
-        # 底部对齐，不裁切
-        y = max(0, size - new_h - int(bottom_pad or 0))
-        canvas.paste(crop, (x, y), crop)
-        buf = BytesIO()
-        canvas.save(buf, format='PNG')
-        url = f"data:image/png;base64,{base64.b64encode(buf.getvalue()).decode('ascii')}"
-        try:
-            self._save_data_url_to_disk(url, qq, save_as_matte=True)
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        try:
+            sess = await self._get_session()
+            async with sess.get(url, headers=headers or None, timeout=self._http_timeout("avatar_read_timeout", 20)) as resp:
+                validators = {"etag": resp.headers.get("ETag", ""), "last_modified": resp.headers.get("Last-Modified", "")}
+                if resp.status == 304:
+                    return 304, b"", "", validators
+                if resp.status != 200:
+                    return resp.status, b"", "", validators
+                data = await resp.read()
+                return 200, data, resp.headers.get("Content-Type", "image/jpeg"), validators
         except Exception:
-            pass
-        return url
+            return 0, b"", "", {}
 
     async def _download_to_b64(self, url: str) -> tuple[str, str]:
         """下载图片为 base64 与 mime。"""
+        _, data, ctype, _ = await self._fetch_image(url)
+        if not data:
+            return "", ""
+        return base64.b64encode(data).decode("ascii"), ctype
+
+    def _character_prompt_tmpl(self) -> str:
+        return str(self.cfg().get("character_prompt", "以 {name} 的头像为参考，生成一位二次元风格的完整半身像角色，面向正前方，透明背景，立绘适合 Galgame 对话立绘使用。"))
+
+    def _portrait_keys(self, avatar_hash: str) -> tuple[str, str]:
+        """按头像哈希与当前配置计算 (gen_key, matte_key)。
+
+        gen_key 覆盖生图输入（头像、提示词模板、端点/模型、背景色），matte_key 额外覆盖抠图参数。
+        """
+        cfg = self.cfg()
+        chroma = str(cfg.get("chroma_bg_color", "#00FF00"))
+        if bool(cfg.get("use_legacy_image_endpoint", True)):
+            model = str(cfg.get("legacy_image_endpoint", "gemini-2.0-flash-preview-image-generation:generateContent"))
+        else:
+            model = str(cfg.get("gemini_model", "gemini-2.0-flash-exp"))
+        gen_key = digest(avatar_hash, self._character_prompt_tmpl(), model, chroma)
+        matte_key = digest(
+            gen_key, chroma, int(cfg.get("chroma_tolerance", 80)), int(cfg.get("character_canvas_size", 1024))
+        )
+        return gen_key, matte_key
+
+    def _record_portrait(self, qq: str, avatar_hash: str, gen_key: str, matte_key: str) -> None:
+        self._portraits.update(qq, avatar_hash=avatar_hash, gen_key=gen_key, matte_key=matte_key)
+        self._portraits.evict(keep=[self._char_matte_file_for(qq), self._portraits.raw_path(gen_key)])
+
+    def _portrait_hit(self, name: str, avatar_url: str, qq: str) -> bool:
+        """已有抠图时判断能否直接使用。
+
+        仅抠图参数变化且保留了原图时返回 False，交由生成流程用原图重抠；
+        头像/提示词/模型变化时继续使用旧立绘，同时排入后台重新生成。
+        头像是否变化以本地头像缓存为准（其过期后的条件请求在后台进行）。
+        """
+        ent = self._portraits.entry(qq)
+        avatar = self._avatars.entry(qq)
+        if avatar is None or self._avatars.is_stale(avatar):
+            self._avatar_task(qq, avatar_url)
+        avatar_hash = ent.get("avatar_hash")
+        if not avatar_hash:
+            if avatar is not None:
+                # 无 manifest 记录的旧立绘：视为由当前头像生成，纳入缓存管理
+                gen_key, matte_key = self._portrait_keys(avatar.hash)
+                self._record_portrait(qq, avatar.hash, gen_key, matte_key)
+            return True
+        if avatar is not None and avatar.hash != avatar_hash:
+            logger.info("[qqgal-生图] 头像已变化，后台重新生成立绘，qq=%s", qq)
+            self._enqueue_character(name, avatar_url, qq, force=True)
+            return True
+        gen_key, matte_key = self._portrait_keys(avatar_hash)
+        if ent.get("gen_key") != gen_key:
+            logger.info("[qqgal-生图] 提示词/模型已变化，后台重新生成立绘，qq=%s", qq)
+            self._enqueue_character(name, avatar_url, qq, force=True)
+        elif ent.get("matte_key") != matte_key and os.path.exists(self._portraits.raw_path(gen_key)):
+            logger.info("[qqgal-生图] 抠图参数已变化，使用保留原图重抠，qq=%s", qq)
+            return False
+        return True
+
+    def _avatar_task(self, qq: str, avatar_url: str) -> asyncio.Task:
+        """刷新头像缓存的在途任务（同一 QQ 共享一次请求）。"""
+        task = self._avatar_tasks.get(qq)
+        if task is None:
+            task = asyncio.create_task(self._refresh_avatar(qq, avatar_url))
+            self._avatar_tasks[qq] = task
+            task.add_done_callback(lambda _t, qq=qq: self._avatar_tasks.pop(qq, None))
+        return task
+
+    async def _refresh_avatar(self, qq: str, avatar_url: str) -> AvatarEntry | None:
+        """条件请求重新验证头像；变化时重写原图与缩略图。网络失败时返回旧缓存（可能为 None）。"""
+        ent = self._avatars.entry(qq)
+        with self._metrics.timer("avatar_fetch"):
+            status, data, mime, validators = await self._fetch_image(
+                avatar_url, ent.etag if ent else "", ent.last_modified if ent else ""
+            )
+        self._metrics.incr(f"avatar_fetch_{status or 'error'}")
+        if status == 304 and ent is not None:
+            return self._avatars.mark_checked(qq, **validators)
+        if status != 200 or not data:
+            logger.warning("[qqgal] 头像下载失败（%s），qq=%s", status, qq)
+            return ent
+        avatar_hash = bytes_digest(data)
+        if ent is not None and ent.hash == avatar_hash:
+            return self._avatars.mark_checked(qq, **validators)
         try:
-            async with aiohttp.ClientSession() as sess:
-                async with sess.get(url, timeout=20) as resp:
-                    if resp.status != 200:
-                        return "", ""
-                    data = await resp.read()
-                    ctype = resp.headers.get("Content-Type", "image/jpeg")
-                    return base64.b64encode(data).decode("ascii"), ctype
+            thumb = await self._image_executor.run("avatar", avatar_thumbnail, data, THUMB_SIZE)
         except Exception:
-            return "", ""
+            logger.warning("[qqgal] 头像缩略图生成失败，qq=%s", qq, exc_info=True)
+            thumb = b""
+        self._asset_cache.invalidate(self._avatars.thumb_path(qq))
+        return self._avatars.store(qq, data, avatar_hash, mime, thumb, **validators)
+
+    async def _get_avatar(self, qq: str, avatar_url: str, revalidate: bool = False, force: bool = False) -> AvatarEntry | None:
+        """读取本地头像缓存。
+
+        无缓存或 force 时等待下载；缓存过期时 revalidate=True 等待条件请求，否则先返回旧缓存并在后台重新验证。
+        """
+        ent = self._avatars.entry(qq)
+        if ent is None or force or (revalidate and self._avatars.is_stale(ent)):
+            return await asyncio.shield(self._avatar_task(qq, avatar_url))
+        if self._avatars.is_stale(ent):
+            self._avatar_task(qq, avatar_url)
+        return ent
+
+    def _avatar_thumb_url(self, qq: str) -> str:
+        return self._asset_cache.get(self._avatars.thumb_path(qq), "image/jpeg")
 
     async def _generate_character_image(self, name: str, avatar_url: str, qq: str, force_refresh: bool = False) -> tuple[str, bool]:
-        """调用 Gemini 生成半身像，返回 data-url 与是否透明 PNG。失败返回("", False)。"""
+        """调用 Gemini 生成半身像，返回 data-url 与是否透明 PNG。失败返回("", False)。
+
+        同一 QQ 的并发请求共享一次在途生成（single-flight）；
+        force_refresh（/刷新立绘）会取代进行中的普通生成，等待者自动转而等待新的生成。
+        """
         cfg = self.cfg()
         if not bool(cfg.get("enable_character", False)):
             logger.info("[qqgal-生图] 未启用人物生图，跳过。")
@@ -499,37 +882,89 @@ class QQGalPlugin(Star):
         if not force_refresh:
             # 优先读取 matte 文件
             matte_fp = self._char_matte_file_for(qq)
-            if os.path.exists(matte_fp):
+            if os.path.exists(matte_fp) and self._portrait_hit(name, avatar_url, qq):
                 logger.info("[qqgal-生图] 命中抠图缓存，直接使用: %s", matte_fp)
+                self._metrics.incr("portrait_cache_hit")
+                self._portraits.touch(matte_fp)
                 return self._file_to_data_url(matte_fp), True
-            cached, is_png = self._load_character_from_disk(qq)
-            if cached:
-                logger.info("[qqgal-生图] 读取本地缓存立绘成功(未抠)，qq=%s，透明PNG=%s，开始补抠。", qq, str(is_png))
-                tol = int(cfg.get("chroma_tolerance", 80))
-                chroma = str(cfg.get("chroma_bg_color", "#00FF00"))
-                processed, is_png2 = await self._matte_chroma_dataurl(cached, chroma, tol, qq)
-                return processed, is_png2
-        keys_val = cfg.get("gemini_api_keys", [])
-        api_keys = []
-        if isinstance(keys_val, list):
-            api_keys = [str(k).strip() for k in keys_val if isinstance(k, (str,)) and str(k).strip()]
-        elif isinstance(keys_val, str):
-            api_keys = [k.strip() for k in keys_val.split(",") if k.strip()]
+
+        ent = self._char_inflight.get(qq)
+        if ent is not None and force_refresh and not ent[1]:
+            # 刷新请求取代进行中的普通生成
+            logger.info("[qqgal-生图] 刷新立绘，取消进行中的生成，qq=%s", qq)
+            ent[0].cancel()
+            ent = None
+        if ent is None:
+            task = asyncio.create_task(self._generate_character_image_once(name, avatar_url, qq, force_refresh))
+            ent = (task, force_refresh)
+            self._char_inflight[qq] = ent
+
+            def _done(t: asyncio.Task, qq=qq, ent=ent):
+                if self._char_inflight.get(qq) is ent:
+                    self._char_inflight.pop(qq, None)
+            task.add_done_callback(_done)
+        else:
+            logger.info("[qqgal-生图] 复用进行中的生成，qq=%s", qq)
+
+        while True:
+            task = ent[0]
+            try:
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    # 调用方自身被取消
+                    raise
+                # 在途生成被刷新请求取代：转而等待新的生成（若已完成则直接读结果文件）
+                nxt = self._char_inflight.get(qq)
+                if nxt is not None and nxt is not ent:
+                    ent = nxt
+                    continue
+                matte_fp = self._char_matte_file_for(qq)
+                if os.path.exists(matte_fp):
+                    return self._file_to_data_url(matte_fp), True
+                return "", False
+
+    async def _generate_character_image_once(self, name: str, avatar_url: str, qq: str, force_refresh: bool) -> tuple[str, bool]:
+        cfg = self.cfg()
+        logger.info("[qqgal-生图] 读取头像用于参考，qq=%s，url=%s", qq, avatar_url)
+        avatar = await self._get_avatar(qq, avatar_url, revalidate=True, force=force_refresh)
+        avatar_bytes = self._avatars.read(qq) if avatar is not None else b""
+        if not avatar_bytes:
+            logger.error("[qqgal-生图] 下载头像失败，放弃此次生图。")
+            return "", False
+        avatar_hash, mime_avatar = avatar.hash, avatar.mime
+        gen_key, matte_key = self._portrait_keys(avatar_hash)
+        raw_fp = self._portraits.raw_path(gen_key)
+        # 强制刷新只针对当前立绘；头像/提示词变化触发的重新生成仍可复用此前保留的原图（如换回旧头像）
+        if not force_refresh or self._portraits.entry(qq).get("gen_key") != gen_key:
+            legacy_fp = self._char_file_for(qq)
+            if os.path.exists(legacy_fp):
+                # 旧版本遗留的未抠原图 qq.png：归入原图缓存，按当前头像寻址
+                try:
+                    if os.path.exists(raw_fp):
+                        os.remove(legacy_fp)
+                    else:
+                        os.replace(legacy_fp, raw_fp)
+                except OSError:
+                    pass
+            raw = self._portraits.read_raw(gen_key)
+            if raw:
+                logger.info("[qqgal-生图] 命中原图缓存，qq=%s，重新抠图（不调用 Gemini）。", qq)
+                processed = await self._process_portrait(raw, qq)
+                if processed:
+                    self._record_portrait(qq, avatar_hash, gen_key, matte_key)
+                    return processed, True
+        api_keys = self._api_keys()
         if not api_keys:
             logger.error("[qqgal-生图] 未配置 Gemini API Key，无法生成人物。")
             return "", False
         base_url = str(cfg.get("gemini_base_url", "")).strip() or "https://generativelanguage.googleapis.com"
         model = str(cfg.get("gemini_model", "gemini-2.0-flash-exp"))
-        prompt_tmpl = str(cfg.get("character_prompt", "以 {name} 的头像为参考，生成一位二次元风格的完整半身像角色，面向正前方，透明背景，立绘适合 Galgame 对话立绘使用。"))
+        prompt_tmpl = self._character_prompt_tmpl()
         # 为不透明背景做准备：强制一个易抠图的纯色底
         chroma = str(cfg.get("chroma_bg_color", "#00FF00"))
         prompt = (prompt_tmpl.replace("{name}", name) + f"\n背景：{chroma} 纯色背景，人物完整半身像，无遮挡。")
-
-        logger.info("[qqgal-生图] 开始下载头像用于参考，qq=%s，url=%s", qq, avatar_url)
-        b64_avatar, mime_avatar = await self._download_to_b64(avatar_url)
-        if not b64_avatar:
-            logger.error("[qqgal-生图] 下载头像失败，放弃此次生图。")
-            return "", False
+        b64_avatar = base64.b64encode(avatar_bytes).decode("ascii")
 
         use_legacy = bool(cfg.get("use_legacy_image_endpoint", True))
         if use_legacy:
@@ -585,164 +1020,376 @@ class QQGalPlugin(Star):
                 }
             }
 
-        for idx, key in enumerate(api_keys):
-            try:
-                logger.info("[qqgal-生图] 调用 Gemini，尝试第 %d 个 Key，endpoint=%s，期望输出=PNG", idx + 1, endpoint)
-                async with aiohttp.ClientSession() as sess:
-                    async with sess.post(f"{endpoint}?key={key}", json=req, timeout=60) as resp:
-                        if resp.status != 200:
-                            try:
-                                err_text = await resp.text()
-                            except Exception:
-                                err_text = "<无返回文本>"
-                            logger.error("[qqgal-生图] 接口返回非 200（%d）：%s", resp.status, err_text[:300])
-                            continue
-                        data = await resp.json()
-                        logger.info("[qqgal-生图] 接口请求成功，开始解析返回数据。")
-                        # 兼容多种返回结构，尽力找到内联图片数据（inline_data 或 inlineData）
-                        def find_inline(d: Any):
-                            if isinstance(d, dict):
-                                # both snake_case and camelCase
-                                if (
-                                    ("inline_data" in d and isinstance(d["inline_data"], dict) and "data" in d["inline_data"]) or
-                                    ("inlineData" in d and isinstance(d["inlineData"], dict) and "data" in d["inlineData"])  
-                                ):
-                                    return d.get("inline_data") or d.get("inlineData")
-                                for v in d.values():
-                                    r = find_inline(v)
-                                    if r:
-                                        return r
-                            elif isinstance(d, list):
-                                for it in d:
-                                    r = find_inline(it)
-                                    if r:
-                                        return r
-                            return None
-                        inline = find_inline(data)
-                        if inline and inline.get("data"):
-                            mime = inline.get("mime_type", "image/png")
-                            b64 = inline.get("data")
-                            data_url = f"data:{mime};base64,{b64}"
-                            logger.info("[qqgal-生图] 解析图片成功，mime=%s，长度=%d 字符，准备抠色并写入缓存。", mime, len(b64))
-                            # 1) 先保存原始到 qq.png
-                            raw_fp = self._save_data_url_to_disk(data_url, qq, save_as_matte=False)
-                            # 2) 抠色到 qq-matte.png 并删除 qq.png
-                            tol = int(cfg.get("chroma_tolerance", 80))
-                            chroma = str(cfg.get("chroma_bg_color", "#00FF00"))
-                            matte_url, _ = await self._matte_chroma_dataurl(self._file_to_data_url(raw_fp), chroma, tol, qq)
-                            # 立绘标准化：固定到方形画布，确保位置与大小一致
-                            std_size = int(cfg.get('character_canvas_size', 1024))
-                            target_ratio = float(cfg.get('character_target_width_ratio', 0.55))
-                            matte_url = await asyncio.to_thread(
-                                self._standardize_character_canvas_sync,
-                                matte_url,
-                                std_size,
-                                target_ratio,
-                                0,
-                                qq,
-                            )
-                            try:
-                                os.remove(raw_fp)
-                            except Exception:
-                                pass
-                            return matte_url, True
-            except Exception:
-                logger.error("[qqgal-生图] 调用 Gemini 发生异常，尝试下一个 Key。", exc_info=True)
-                continue
+        async with self._gemini_sem:
+            with self._metrics.timer("gemini"):
+                raw = await self._gemini_generate(endpoint, req, api_keys)
+        if raw:
+            # 先保留原图：抠图失败或日后抠图参数变化时可直接重抠，无需再调 Gemini
+            self._atomic_write(raw_fp, raw)
+            matte_url = await self._process_portrait(raw, qq)
+            if not matte_url:
+                return "", False
+            self._record_portrait(qq, avatar_hash, gen_key, matte_key)
+            return matte_url, True
         logger.error("[qqgal-生图] 所有 Key 均尝试失败，放弃此次生图。")
         return "", False
 
-    async def _render_image(self, event: AstrMessageEvent, quote: str, options: List[str]) -> str:
+    def _character_pending(self, qq: str) -> bool:
+        """是否需要走后台生成：已启用立绘与后台模式，且本地既无抠图也无待补抠的原图。"""
         cfg = self.cfg()
-        width = int(cfg.get("canvas_width", 1280))
-        height = int(cfg.get("canvas_height", 720))
-        bg = self._pick_background()
-        name, avatar, target_id = await self._get_display_and_avatar(event)
-        # 嵌入为 data URL，避免 file:// 在某些环境不可读/中文路径问题
-        bg_url = self._data_url(bg) if bg else ""
+        if not bool(cfg.get("enable_character", False)) or not bool(cfg.get("character_background_gen", True)):
+            return False
+        if os.path.exists(self._char_matte_file_for(qq)):
+            return False
+        if qq in self._char_inflight:
+            return True
+        gen_key = self._portraits.entry(qq).get("gen_key")
+        has_raw = os.path.exists(self._char_file_for(qq)) or bool(gen_key and os.path.exists(self._portraits.raw_path(gen_key)))
+        return not has_raw
+
+    def _placeholder_url(self) -> str:
+        if not self._placeholder:
+            size = int(self.cfg().get("character_canvas_size", 1024))
+            png = placeholder_silhouette_png(size)
+            self._placeholder = f"data:image/png;base64,{base64.b64encode(png).decode('ascii')}"
+        return self._placeholder
+
+    def _enqueue_character(self, name: str, avatar_url: str, qq: str, force: bool = False) -> bool:
+        """将立绘生成排入后台队列；已在队列/生成中则跳过。返回是否新入队。
+        force=True 表示缓存已过期（头像/提示词/模型变化），忽略现有立绘重新生成。"""
+        if qq in self._gen_queued or qq in self._char_inflight:
+            return False
+        self._ensure_gen_workers()
+        try:
+            self._gen_queue.put_nowait((name, avatar_url, qq, force))
+        except asyncio.QueueFull:
+            logger.warning("[qqgal-生图] 后台生成队列已满，丢弃 qq=%s", qq)
+            return False
+        self._gen_queued.add(qq)
+        logger.info("[qqgal-生图] 立绘排入后台生成，qq=%s，队列长度=%d", qq, self._gen_queue.qsize())
+        return True
+
+    def _ensure_gen_workers(self) -> None:
+        if self._gen_queue is None:
+            self._gen_queue = asyncio.Queue(maxsize=max(1, int(self.cfg().get("pregen_queue_size", 64))))
+        self._gen_workers = [t for t in self._gen_workers if not t.done()]
+        want = max(1, int(self.cfg().get("pregen_workers", 2)))
+        while len(self._gen_workers) < want:
+            self._gen_workers.append(asyncio.create_task(self._gen_worker()))
+
+    async def _gen_worker(self) -> None:
+        while True:
+            name, avatar_url, qq, force = await self._gen_queue.get()
+            try:
+                url, _ = await self._generate_character_image(name, avatar_url, qq=qq, force_refresh=force)
+                logger.info("[qqgal-生图] 后台生成%s，qq=%s", "完成" if url else "失败", qq)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.error("[qqgal-生图] 后台生成异常，qq=%s", qq, exc_info=True)
+            finally:
+                self._gen_queued.discard(qq)
+                self._gen_queue.task_done()
+
+    async def _prepare_assets(self, event: AstrMessageEvent, with_character: bool = True) -> Dict[str, Any]:
+        """与 LLM 无关的渲染素材：目标对象/头像、背景、立绘。
+
+        可与 _gen_options 并发执行；立绘失败只影响立绘本身，不影响选项与背景。
+        """
+        (bg_url, bg_blur_url, bg_blur_filter), (name, avatar, target_id) = await asyncio.gather(
+            self._background_urls(), self._get_display_and_avatar(event)
+        )
+        # 头像：本地缩略图嵌入，渲染时不再访问 qlogo.cn（首次无缓存时下载一次）
+        avatar_img = ""
+        try:
+            if await self._get_avatar(target_id, avatar) is not None:
+                avatar_img = self._avatar_thumb_url(target_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.debug("[qqgal] avatar cache failed", exc_info=True)
         # 生成半身像（可选）
-        char_url, char_is_png = await self._generate_character_image(name, avatar, qq=target_id, force_refresh=False)
+        char_url, char_is_png = "", False
+        if with_character and self._character_pending(target_id):
+            # 首次生成不阻塞本次渲染：排入后台队列，本次用占位剪影（或不叠加立绘）
+            self._enqueue_character(name, avatar, target_id)
+            if bool(self.cfg().get("character_placeholder", True)):
+                char_url, char_is_png = self._placeholder_url(), True
+            with_character = False
+        if with_character:
+            try:
+                char_url, char_is_png = await self._generate_character_image(name, avatar, qq=target_id, force_refresh=False)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.error("[qqgal-生图] 立绘准备失败，本次不叠加立绘。", exc_info=True)
         if char_url:
             logger.info("[qqgal-生图] 立绘生成/读取成功，准备合成，PNG=%s", str(char_is_png))
         else:
             logger.info("[qqgal-生图] 未添加立绘（未启用/失败/无Key/缓存缺失）。")
+        return {
+            "name": name,
+            "avatar": avatar,
+            "avatar_img": avatar_img,
+            "target_id": target_id,
+            "bg_url": bg_url,
+            "bg_blur_url": bg_blur_url,
+            "bg_blur_filter": bg_blur_filter,
+            "char_url": char_url,
+            "char_is_png": char_is_png,
+        }
+
+    def _api_keys(self) -> List[str]:
+        keys_val = self.cfg().get("gemini_api_keys", [])
+        if isinstance(keys_val, list):
+            return [str(k).strip() for k in keys_val if isinstance(k, (str,)) and str(k).strip()]
+        if isinstance(keys_val, str):
+            return [k.strip() for k in keys_val.split(",") if k.strip()]
+        return []
+
+    def _report_key(self, key: str, ok: bool, status: int, latency: float) -> None:
+        self._key_sched.report(key, ok, status, latency)
+        if ok:
+            self._metrics.observe("gemini_attempt", latency)
+        else:
+            self._metrics.incr(f"gemini_key_fail_{status or 'error'}")
+
+    async def _gemini_attempt(self, endpoint: str, key: str, req: Dict[str, Any], label: str) -> bytes:
+        """单个 Key 的一次生图请求，返回解码后的图片字节（失败返回 b""），结果计入 Key 调度器。"""
+        t0 = time.monotonic()
+        status = 0
+        try:
+            logger.info("[qqgal-生图] 调用 Gemini，使用 Key %s，endpoint=%s，期望输出=PNG", label, endpoint)
+            sess = await self._get_session()
+            async with sess.post(f"{endpoint}?key={key}", json=req, timeout=self._http_timeout("gemini_read_timeout", 60)) as resp:
+                status = resp.status
+                if resp.status != 200:
+                    try:
+                        err_text = await resp.text()
+                    except Exception:
+                        err_text = "<无返回文本>"
+                    logger.error("[qqgal-生图] 接口返回非 200（%d）：%s", resp.status, err_text[:300])
+                    self._report_key(key, False, status, time.monotonic() - t0)
+                    return b""
+                logger.info("[qqgal-生图] 接口请求成功，开始流式解析返回数据。")
+                # 边读边定位 inlineData.data 并直接 base64 解码，不构建完整 JSON
+                extractor = InlineDataExtractor()
+                async for chunk in resp.content.iter_chunked(64 * 1024):
+                    if extractor.feed(chunk):
+                        break
+                # 图片之后只剩少量尾部 JSON，读完以便连接回到连接池复用
+                await resp.content.read()
+            raw = extractor.result()
+            if not raw:
+                logger.error("[qqgal-生图] 返回中未找到图片数据。")
+                self._report_key(key, False, status, time.monotonic() - t0)
+                return b""
+            logger.info("[qqgal-生图] 解析图片成功，mime=%s，大小=%d 字节，准备抠色并写入缓存。", extractor.mime, len(raw))
+            self._report_key(key, True, status, time.monotonic() - t0)
+            return raw
+        except asyncio.CancelledError:
+            # 被对冲请求抢先完成而取消，不计入失败
+            raise
+        except Exception:
+            logger.error("[qqgal-生图] 调用 Gemini 发生异常，尝试下一个 Key。", exc_info=True)
+            self._report_key(key, False, status, time.monotonic() - t0)
+            return b""
+
+    async def _gemini_generate(self, endpoint: str, req: Dict[str, Any], api_keys: List[str]) -> bytes:
+        """按调度器给出的顺序逐个尝试 Key；gemini_hedge_after>0 时，
+        当前请求超过该秒数仍未返回则并行对冲下一个 Key，先成功者胜出。"""
+        keys = self._key_sched.order(api_keys)
+        hedge_after = float(self.cfg().get("gemini_hedge_after", 0) or 0)
+        idx = 0
+        pending: set = set()
+
+        def _start() -> None:
+            nonlocal idx
+            key = keys[idx]
+            label = f"#{api_keys.index(key) + 1}"
+            idx += 1
+            pending.add(asyncio.create_task(self._gemini_attempt(endpoint, key, req, label)))
+
+        try:
+            while idx < len(keys) or pending:
+                if not pending:
+                    _start()
+                can_hedge = hedge_after > 0 and idx < len(keys) and len(pending) < 2
+                done, pending = await asyncio.wait(
+                    pending, timeout=hedge_after if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    logger.info("[qqgal-生图] 请求超过 %.1fs 未返回，对冲下一个 Key。", hedge_after)
+                    _start()
+                    continue
+                for t in done:
+                    raw = t.result()
+                    if raw:
+                        return raw
+            return b""
+        finally:
+            for t in pending:
+                t.cancel()
+
+    async def _scene(self, quote: str, options: List[str], assets: Dict[str, Any]) -> Dict[str, Any]:
+        """由素材与台词/选项组装合成输入（build_html / composite_jpeg 共用）。"""
+        cfg = self.cfg()
+        width = int(cfg.get("canvas_width", 1280))
+        height = int(cfg.get("canvas_height", 720))
+        bg_url, bg_blur_url, bg_blur_filter = assets["bg_url"], assets["bg_blur_url"], assets["bg_blur_filter"]
+        if bool(cfg.get("background_by_quote", False)):
+            # 按引用文本确定背景：同一段话的重试/重复请求得到相同场景，可命中渲染缓存
+            bg_url, bg_blur_url, bg_blur_filter = await self._background_urls(quote)
+        char_url, char_is_png = assets["char_url"], assets["char_is_png"]
+        name, avatar = assets["name"], assets["avatar"]
 
-        # 选项纵向位置（保持既有结构）
-        opt1_top = int(height * 0.20)
-        opt2_top = int(height * 0.34)
-        opt3_top = int(height * 0.48)
-        opt4_top = int(height * 0.62)
-
-        # 引用框宽度（用于与头像/名字关联），以及引用块顶端位置
-        quote_w = int(width * 0.86)
-        quote_top = max(opt3_top + 110, int(height * 0.68))
-        # 仅用于引用区域的延伸毛玻璃（从引用块顶端到底部），覆盖整幅画面的下半部分
-        glass_left = 24
-        glass_w = max(0, width - 48)
-        glass_top = quote_top
-        glass_h = max(120, height - glass_top)
-
-        # 对外部/用户内容进行 HTML 转义，避免注入
-        safe_name = html_lib.escape(name)
-        safe_quote = html_lib.escape(quote)
-        safe_options = [html_lib.escape(opt) for opt in options]
-
-        # 构建 HTML 模板
-        html_doc = f"""
-<html>
-<head>
-<meta charset='utf-8'/>
-<style>
-  body {{ margin:0; width:{width}px; height:{height}px; font-family: 'Microsoft Yahei', sans-serif; }}
-  .root {{ position:relative; width:{width}px; height:{height}px; background:#000; overflow:hidden; }}
-  /* 两层背景：底层模糊铺满，顶层等比完整展示，保证任意比例都好看 */
-  .bg-blur {{ position:absolute; inset:0; background-image:url('{bg_url}'); background-size:cover; background-position:center; filter:blur(18px) brightness(0.7); transform:scale(1.06); z-index:0; }}
-  .bg-main {{ position:absolute; inset:0; background-image:url('{bg_url}'); background-repeat:no-repeat; background-size:contain; background-position:center; z-index:0; }}
-  .topbar {{ position:absolute; left:24px; top:18px; color:#fff; font-weight:700; letter-spacing:1px; text-shadow:0 2px 6px rgba(0,0,0,.6); }}
-  :root {{ --quote-width: {quote_w}px; }}
-  /* 人物立绘：底部居中，宽度按比例缩放 */
-  .char {{ position:absolute; left:calc(50% + {int(cfg.get('character_x_offset', 0))}px); transform:translateX(-50%); bottom:{int(cfg.get('character_bottom_offset', 0))}px; width:{int(width*float(cfg.get('character_scale', 0.42)))}px; height:auto; object-fit:contain; {'' if char_is_png else 'mix-blend-mode: multiply;'} filter: drop-shadow(0 8px 24px rgba(0,0,0,.45)); opacity:{1.0 if char_url else 0}; z-index: 1; pointer-events:none; }}
-  /* 引用内容容器：自身不加毛玻璃，由下方 .glass 提供延伸到底部的模糊背景 */
-  .quote {{ position:absolute; left:50%; transform:translateX(-50%); top:{quote_top}px; width:var(--quote-width); padding:18px 22px 22px 22px; color:#fff; font-size:28px; font-weight:800; line-height:1.5; border-radius:16px; background:transparent; text-align:center; z-index:3; }}
-  .glass {{ position:absolute; left:{glass_left}px; top:{glass_top}px; width:{glass_w}px; height:{glass_h}px; background:rgba(0,0,0,.25); backdrop-filter: blur(10px); border-radius:18px; box-shadow:0 10px 30px rgba(0,0,0,.35); z-index:2; }}
-  .q-avatar {{ position:absolute; left:16px; top:16px; width:56px; height:56px; border-radius:50%; border:2px solid rgba(255,255,255,.8); background-image:url('{avatar}'); background-size:cover; background-position:center; box-shadow:0 4px 12px rgba(0,0,0,.4); z-index:3; }}
-  .q-user {{ position:absolute; left:88px; top:22px; font-size:22px; font-weight:800; color:#fff; text-shadow:0 2px 6px rgba(0,0,0,.6); z-index:3; }}
-  .q-text {{ margin-top:88px; font-size:32px; font-weight:900; color:#fff; text-align:center; line-height:1.6; z-index:3; position:relative; }}
-  .option {{ position:absolute; left:50%; transform:translateX(-50%); width:{int(width*0.7)}px; padding:14px 18px; background:rgba(0,0,0,.55); color:#f0f0f0; border-radius:28px; text-align:center; font-size:26px; font-weight:800; letter-spacing:1px; box-shadow:0 8px 20px rgba(0,0,0,.35); border:1px solid rgba(255,255,255,.15); z-index:3; }}
-  /* 将选项整体上移，集中在画面上 2/5 区域附近 */
-  .opt1 {{ top:{opt1_top}px; }}
-  .opt2 {{ top:{opt2_top}px; }}
-  .opt3 {{ top:{opt3_top}px; }}
-  .opt4 {{ top:{opt4_top}px; }}
-</style>
-</head>
-<body>
-  <div class='root'>
-    <div class='bg-blur'></div>
-    <div class='bg-main'></div>
-    <div class='topbar'>CHAPTER</div>
-    <img class='char' src='{char_url}' />
-    <div class='glass'></div>
-    <div class='quote'>
-      <div class='q-avatar'></div>
-      <div class='q-user'>{safe_name}</div>
-      <div class='q-text'>{safe_quote}</div>
-    </div>
-    {''.join([f"<div class='option opt{i+1}'>"+opt+"</div>" for i,opt in enumerate(safe_options)])}
-  </div>
-</body>
-</html>
-"""
         # 输出图片质量（仅 jpeg 生效）
         quality = int(cfg.get("image_quality", 85))
         if quality < 10:
             quality = 10
         if quality > 100:
             quality = 100
-        options_dict = {"type": "jpeg", "quality": quality}
-        url = await self.html_render(html_doc, data={}, options=options_dict)
+        scene = {
+            "width": width,
+            "height": height,
+            "bg_url": bg_url,
+            "bg_blur_url": bg_blur_url,
+            "bg_blur_filter": bg_blur_filter,
+            "char_url": char_url,
+            "char_is_png": char_is_png,
+            "char_x_offset": int(cfg.get('character_x_offset', 0)),
+            "char_bottom_offset": int(cfg.get('character_bottom_offset', 0)),
+            "char_scale": float(cfg.get('character_scale', 0.42)),
+            "avatar": assets.get("avatar_img") or avatar,
+            "name": name,
+            "quote": quote,
+            "options": list(options),
+            "quality": quality,
+            "font_path": str(cfg.get("font_path", "") or ""),
+        }
+        return scene
+
+    async def _render_image(self, event: AstrMessageEvent, quote: str, options: List[str], assets: Dict[str, Any] | None = None) -> str:
+        if assets is None:
+            assets = await self._prepare_assets(event)
+        return await self._render_scene(await self._scene(quote, options, assets))
+
+    async def _render_storyboard(self, event: AstrMessageEvent, steps: List[Dict[str, Any]], assets: Dict[str, Any] | None = None) -> str:
+        """连续剧情：各幕共用同一套素材，一次渲染为纵向长图。"""
+        if assets is None:
+            assets = await self._prepare_assets(event)
+        # 背景按第一幕的台词确定（background_by_quote），整段剧情同一场景
+        scene = await self._scene(steps[0]["quote"], steps[0]["options"], assets)
+        return await self._render_scene(scene, steps)
+
+    async def _render_scene(self, scene: Dict[str, Any], steps: List[Dict[str, Any]] | None = None) -> str:
+        """渲染单幅场景，或 steps 非空时渲染多幕长图；结果按场景哈希缓存。"""
+        cfg = self.cfg()
+        backend = str(cfg.get("render_backend", "html")).lower()
+        key = scene_digest(dict(scene, storyboard=steps) if steps else scene, backend)
+        cached = self._render_cache.get(key)
+        if cached:
+            logger.info("[qqgal] 命中渲染缓存: %s", cached)
+            self._metrics.incr("render_cache_hit")
+            return cached
+        url = ""
+        if backend == "pool":
+            # 页面池的空闲页面队列本身就是并发上限（render_pool_size），不再受 _render_sem 限制
+            try:
+                url = await self._render_pool(scene, steps)
+            except Exception as e:
+                logger.warning("[qqgal] 常驻页面池渲染失败，回退 html_render: %s", e)
+                self._metrics.incr("render_fallback_html")
+        if not url:
+            async with self._render_sem:
+                if backend == "pillow":
+                    try:
+                        url = await self._render_pillow(scene, steps) or ""
+                    except Exception:
+                        logger.error("[qqgal] Pillow 渲染失败，回退 html_render", exc_info=True)
+                    if not url:
+                        self._metrics.incr("render_fallback_html")
+                if not url:
+                    options_dict = {"type": "jpeg", "quality": scene["quality"]}
+                    html = build_storyboard_html(scene, steps) if steps else build_html(scene)
+                    self._metrics.size("html", len(html))
+                    with self._metrics.timer("render_storyboard_html" if steps else "render_html"):
+                        url = await self.html_render(html, data={}, options=options_dict)
+        self._render_cache.put(key, url)
+        local = url[len("file://"):] if url.startswith("file://") else ("" if "://" in url else url)
+        if local:
+            try:
+                self._metrics.size("image", os.path.getsize(local))
+            except OSError:
+                pass
         return url
 
+    def _get_render_dir(self) -> str:
+        dirp = os.path.join(os.path.dirname(__file__), "renders")
+        try:
+            os.makedirs(dirp, exist_ok=True)
+        except Exception:
+            pass
+        return dirp
+
+    async def _inline_avatar(self, scene: Dict[str, Any]) -> None:
+        """头像不是 data-url（本地缩略图缺失）时下载并内联。"""
+        avatar = scene.get("avatar") or ""
+        if avatar and not avatar.startswith("data:"):
+            b64, mime = await self._download_to_b64(avatar)
+            scene["avatar"] = f"data:{mime or 'image/jpeg'};base64,{b64}" if b64 else ""
+
+    async def _render_pool(self, scene: Dict[str, Any], steps: List[Dict[str, Any]] | None = None) -> str:
+        """常驻页面池渲染（见 page_pool.PagePool）：只推送动态内容，素材每页注册一次。结果落盘并返回文件路径。"""
+        if not page_pool_available():
+            raise RuntimeError("playwright 未安装")
+        if self._page_pool is None:
+            cfg = self.cfg()
+            self._page_pool = PagePool(
+                size=int(cfg.get("render_pool_size", 2)),
+                recycle_after=int(cfg.get("render_pool_recycle", 200)),
+                width=int(scene["width"]),
+                height=int(scene["height"]),
+            )
+        await self._inline_avatar(scene)
+        payload = pool_payload(scene, steps or [scene])
+        self._metrics.size("html", len(payload["roots"]))
+        fp = os.path.join(self._get_render_dir(), f"{uuid.uuid4().hex}.jpg")
+        with self._metrics.timer("render_pool"):
+            await self._page_pool.render(payload, fp, int(scene["quality"]))
+        self._prune_render_dir()
+        return fp
+
+    async def _render_pillow(self, scene: Dict[str, Any], steps: List[Dict[str, Any]] | None = None) -> str | None:
+        """进程内 Pillow 合成（见 render.composite_jpeg / composite_storyboard_jpeg），结果落盘并返回文件路径。
+
+        写盘失败返回 None，由调用方回退 html_render。
+        """
+        await self._inline_avatar(scene)
+        if steps:
+            jpeg = await self._image_executor.run("storyboard", composite_storyboard_jpeg, scene, steps)
+        else:
+            jpeg = await self._image_executor.run("render", composite_jpeg, scene)
+        fp = os.path.join(self._get_render_dir(), f"{uuid.uuid4().hex}.jpg")
+        if not self._atomic_write(fp, jpeg):
+            return None
+        self._prune_render_dir()
+        return fp
+
+    def _prune_render_dir(self, keep: int = 64) -> None:
+        """仅保留最近 keep 张渲染结果，避免 renders/ 无限增长（不少于渲染缓存条目数）。"""
+        keep = max(keep, self._render_cache.max_entries)
+        try:
+            dirp = self._get_render_dir()
+            files = [os.path.join(dirp, f) for f in os.listdir(dirp) if f.endswith(".jpg")]
+            if len(files) <= keep:
+                return
+            files.sort(key=lambda fp: os.path.getmtime(fp))
+            for fp in files[:-keep]:
+                os.remove(fp)
+        except Exception:
+            logger.debug("[qqgal] prune render dir failed", exc_info=True)
+
     def _parse_count_from_text(self, text: str, default_n: int, min_n: int, max_n: int) -> int:
         try:
             nums = []
@@ -763,41 +1410,156 @@ class QQGalPlugin(Star):
             pass
         return max(min_n, min(max_n, default_n))
 
+    async def _timed(self, stage: str, fn: Any, *args: Any) -> Any:
+        with self._metrics.timer(stage):
+            return await fn(*args)
+
+    def _admit(self, event: AstrMessageEvent) -> tuple[bool, str]:
+        """限流检查，返回 (是否放行, 拒绝提示)。同一对象短时间内只提示一次，之后静默丢弃。"""
+        user_id = str(event.get_sender_id() or "")
+        try:
+            group_id = str(event.get_group_id() or "")
+        except Exception:
+            group_id = ""
+        scope, wait = self._limiter.acquire(user_id, group_id)
+        if not scope:
+            return True, ""
+        logger.info("[qqgal] 请求被限流（%s），user=%s group=%s", scope, user_id, group_id)
+        self._metrics.incr(f"rate_limited_{scope}")
+        notify_key = (scope, user_id if scope == "user" else group_id)
+        if self._reject_notified.get(notify_key):
+            return False, ""
+        self._reject_notified.set(notify_key, True)
+        who = {"user": "你的请求", "group": "本群请求"}.get(scope, "当前请求")
+        return False, f"{who}太频繁啦，请 {max(1, int(wait + 0.999))} 秒后再试~"
+
+    async def _build_options(self, event: AstrMessageEvent, base_text: str, n: int, prep_task: asyncio.Task | None) -> tuple[str, str]:
+        """生成选项并（可选）渲染，返回 ("image", 图片) 或 ("text", 文本)。"""
+        cfg = self.cfg()
+        sep = cfg.get("message_separator", "-------------------------")
+        title = cfg.get("title", "🎮 GalGame 选项")
+        show_quote = bool(cfg.get("show_quote", True))
+
+        options_list = await self._gen_options(event, base_text, n)
+        self._metrics.incr("options_generated", n)
+        options_text = "\n".join(options_list)
+        logger.debug(f"[qqgal] normalized options:\n{options_text}")
+
+        if prep_task is not None:
+            assets = await self._await_assets(event, prep_task)
+            return "image", await self._render_image(event, base_text or "（无原文）", options_list, assets)
+        lines = [title, sep]
+        if show_quote and base_text:
+            lines.append(f"📝 原文：{base_text}")
+            lines.append(sep)
+        lines.append(options_text)
+        return "text", "\n".join(lines)
+
+    async def _await_assets(self, event: AstrMessageEvent, prep_task: asyncio.Task) -> Dict[str, Any]:
+        try:
+            return await prep_task
+        except Exception:
+            logger.error("[qqgal] 素材准备失败，改用无立绘素材。", exc_info=True)
+            self._metrics.incr("assets_fallback")
+            return await self._prepare_assets(event, with_character=False)
+
+    async def _build_storyboard(self, event: AstrMessageEvent, base_text: str, steps: int, n: int, prep_task: asyncio.Task | None) -> tuple[str, str]:
+        """连续剧情：一次 LLM 调用生成多幕，素材只准备一次，全部画面一次渲染为长图。"""
+        cfg = self.cfg()
+        sep = cfg.get("message_separator", "-------------------------")
+        title = cfg.get("title", "🎮 GalGame 选项")
+
+        raw = await self._gen_storyboard(event, base_text, steps, n)
+        scenes = self._parse_storyboard(raw, base_text or "（无原文）", steps, n)
+        self._metrics.incr("storyboard_generated")
+        self._metrics.incr("options_generated", n * len(scenes))
+        logger.info("[qqgal] storyboard parsed %d/%d scenes", len(scenes), steps)
+
+        if prep_task is not None:
+            assets = await self._await_assets(event, prep_task)
+            return "image", await self._render_storyboard(event, scenes, assets)
+        lines = [title]
+        for i, sc in enumerate(scenes):
+            lines.append(sep)
+            lines.append(f"【第 {i + 1} 幕】{sc['quote']}")
+            lines.extend(sc["options"])
+            if sc["chosen"] is not None:
+                lines.append(f"→ 选择 {self._letters(n)[sc['chosen']]}")
+        return "text", "\n".join(lines)
+
+    def _coalesce_key(self, event: AstrMessageEvent, base_text: str, n: int, render: bool, steps: int) -> tuple:
+        """请求合并键：画面输入完全相同才合并。
+
+        会话（unified_msg_origin，决定群/供应商）与目标对象都计入：有引用时目标由被引用消息决定，
+        否则取决于第一个 @ 对象与触发者（名字取触发者昵称）。
+        """
+        origin = str(getattr(event, "unified_msg_origin", "") or "")
+        reply_id = self._find_reply_id(event)
+        if reply_id:
+            target = ("reply", reply_id)
+        else:
+            target = ("sender", str(event.get_sender_id() or ""), self._first_at_id(event))
+        return (origin, target, base_text, n, render, steps)
+
     @filter.command("选项", alias={"gal", "gal选项"})
     async def make_gal_options(self, event: AstrMessageEvent):
-        """引用或跟随文本，生成 GalGame 风格选项。数量可选，默认 3。"""
+        """引用或跟随文本，生成 GalGame 风格选项。数量可选，默认 3；“连续 N” 生成 N 幕连续剧情长图。"""
         try:
             # 标记本事件已由主指令处理，供 fallback 去重
             try:
                 event.set_extra("qqgal_handled", True)
             except Exception:
                 pass
+            allowed, reject_msg = self._admit(event)
+            if not allowed:
+                if reject_msg:
+                    yield event.plain_result(reject_msg)
+                return
             cfg = self.cfg()
             default_n = int(cfg.get("option_count", 3))
+            # “/选项 连续 3”：多幕连续剧情，数字为幕数，选项数取默认值
+            steps, inline = self._storyboard_steps(event)
             # 从文本中解析数量（最后一个整数）；无则用默认；限制 1~26
-            n = self._parse_count_from_text(event.message_str or "", default_n, 1, 26)
-            logger.debug(f"[qqgal] parsed option count n={n}")
-
-            base_text = await self._extract_quoted_text(event)
-            sep = cfg.get("message_separator", "-------------------------")
-            title = cfg.get("title", "🎮 GalGame 选项")
-            show_quote = bool(cfg.get("show_quote", True))
-
-            options_raw = await self._gen_options(event, base_text, n)
-            options_text = self._normalize_options(options_raw, n)
-            logger.debug(f"[qqgal] normalized options:\n{options_text}")
-
-            if bool(cfg.get("render_image", False)):
-                options_list = [ln.strip() for ln in options_text.splitlines() if ln.strip()]
-                img_url = await self._render_image(event, base_text or "（无原文）", options_list)
-                yield event.image_result(img_url)
-            else:
-                lines = [title, sep]
-                if show_quote and base_text:
-                    lines.append(f"📝 原文：{base_text}")
-                    lines.append(sep)
-                lines.append(options_text)
-                yield event.plain_result("\n".join(lines))
+            n = max(1, min(26, default_n)) if steps else self._parse_count_from_text(event.message_str or "", default_n, 1, 26)
+            logger.debug(f"[qqgal] parsed option count n={n} steps={steps}")
+
+            render = bool(cfg.get("render_image", False))
+            # 素材准备（目标/背景/立绘）不依赖 LLM 输出，与选项生成并发
+            prep_task = asyncio.create_task(self._timed("assets", self._prepare_assets, event)) if render else None
+            handed_off = False
+            t0 = time.perf_counter()
+            try:
+                with self._metrics.timer("quote"):
+                    base_text = await self._extract_quoted_text(event, inline if steps else None)
+                key = self._coalesce_key(event, base_text, n, render, steps)
+                task = self._options_inflight.get(key)
+                if task is not None:
+                    # 同一会话、同一目标、相同引用与数量的请求正在处理：直接复用其结果
+                    logger.info("[qqgal] 合并到进行中的相同请求，n=%d", n)
+                    self._metrics.incr("request_coalesced")
+                    if prep_task is not None:
+                        prep_task.cancel()
+                else:
+                    if len(self._options_inflight) >= max(1, int(cfg.get("max_inflight_requests", 16))):
+                        yield event.plain_result("当前请求较多，请稍后再试~")
+                        return
+                    if steps:
+                        task = asyncio.create_task(self._build_storyboard(event, base_text, steps, n, prep_task))
+                    else:
+                        task = asyncio.create_task(self._build_options(event, base_text, n, prep_task))
+                    handed_off = True
+                    self._options_inflight[key] = task
+                    task.add_done_callback(lambda _t, key=key: self._options_inflight.pop(key, None))
+                kind, payload = await asyncio.shield(task)
+                self._metrics.observe("request", time.perf_counter() - t0)
+                if kind == "image":
+                    yield event.image_result(payload)
+                else:
+                    yield event.plain_result(payload)
+            finally:
+                # 交给合并任务的素材准备由该任务负责（其它等待者仍需要结果）
+                if prep_task is not None and not prep_task.done() and not handed_off:
+                    prep_task.cancel()
         except Exception as e:
             logger.error(f"生成选项失败: {e}")
             yield event.plain_result("生成选项失败，请稍后重试。")
@@ -822,6 +1584,170 @@ class QQGalPlugin(Star):
             logger.error(f"刷新立绘失败: {e}")
             yield event.plain_result("刷新失败，请稍后重试。")
 
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("预热立绘")
+    async def prewarm_characters(self, event: AstrMessageEvent):
+        """管理员：后台预生成立绘。
+        /预热立绘 QQ1 QQ2 ...   指定 QQ；
+        /预热立绘 群 [N]        本群最近发言最活跃的 N 人（默认 10）。
+        """
+        try:
+            text = (event.message_str or "").strip()
+            for p in ("/预热立绘", "预热立绘"):
+                if text.startswith(p):
+                    text = text[len(p):].strip()
+                    break
+            args = text.split()
+            targets: List[tuple[str, str]] = []
+            if args and args[0] in ("群", "group"):
+                limit = int(args[1]) if len(args) > 1 and args[1].isdigit() else 10
+                targets = await self._active_group_members(event, limit)
+                if not targets:
+                    yield event.plain_result("获取群成员失败（仅支持 aiocqhttp 群聊）")
+                    return
+            else:
+                targets = [(qq, qq) for qq in args if qq.isdigit()]
+            if not targets:
+                yield event.plain_result("用法：/预热立绘 QQ1 QQ2 … 或 /预热立绘 群 [人数]")
+                return
+            avatar_tmpl = str(self.cfg().get("avatar_url_tmpl", "https://q1.qlogo.cn/g?b=qq&nk={qq}&s=640"))
+            queued = skipped = 0
+            for qq, nick in targets:
+                if os.path.exists(self._char_matte_file_for(qq)):
+                    skipped += 1
+                    continue
+                if self._enqueue_character(f"{nick} ({qq})", avatar_tmpl.replace("{qq}", qq), qq):
+                    queued += 1
+                else:
+                    skipped += 1
+            yield event.plain_result(f"已排入后台生成 {queued} 人，跳过 {skipped} 人（已有立绘/已在队列）")
+        except Exception as e:
+            logger.error(f"预热立绘失败: {e}")
+            yield event.plain_result("预热失败，请稍后重试。")
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("qqgal_keys")
+    async def key_stats(self, event: AstrMessageEvent):
+        """管理员：查看各 Gemini Key 的成功率、延迟与冷却状态。"""
+        api_keys = self._api_keys()
+        if not api_keys:
+            yield event.plain_result("未配置 Gemini API Key")
+            return
+        lines = ["Gemini Key 状态："]
+        for i, row in enumerate(self._key_sched.stats(api_keys)):
+            rate = "-" if row["success_rate"] is None else f"{row['success_rate'] * 100:.0f}%"
+            cd = f"，冷却 {row['cooldown_s']}s" if row["cooldown_s"] else ""
+            lines.append(
+                f"#{i + 1} {row['key']}：成功 {row['ok']} / 失败 {row['fail']}（{rate}），"
+                f"延迟 {row['latency_ewma_s']}s，最近状态 {row['last_status'] or '-'}{cd}"
+            )
+        yield event.plain_result("\n".join(lines))
+
+    def _stats_snapshot(self) -> Dict[str, Any]:
+        """指标快照：分阶段耗时/计数/字节 + 各缓存、执行器、限流器的当前状态。"""
+        snap = self._metrics.snapshot()
+        snap["caches"] = {
+            "asset": self._asset_cache.stats(),
+            "get_msg": self._msg_cache.stats(),
+            "render": self._render_cache.stats(),
+            "portrait": self._portraits.stats(),
+            "avatar": self._avatars.stats(),
+        }
+        if self._option_cache is not None:
+            snap["caches"]["option"] = self._option_cache.stats()
+        snap["executor"] = self._image_executor.stats()
+        if self._page_pool is not None:
+            snap["renderer_pool"] = self._page_pool.stats()
+        snap["limiter"] = self._limiter.stats()
+        snap["gauges"] = {
+            "inflight_requests": len(self._options_inflight),
+            "gen_queue_depth": self._gen_queue.qsize() if self._gen_queue is not None else 0,
+            "background_bytes": self._bg_index.total_bytes(),
+            "background_build_seconds": self._bg_index.last_build_s,
+            "render_cache_hit_rate": snap["caches"]["render"]["hit_rate"],
+            "asset_cache_hit_rate": snap["caches"]["asset"]["hit_rate"],
+            "get_msg_cache_hit_rate": snap["caches"]["get_msg"]["hit_rate"],
+        }
+        return snap
+
+    def _dump_metrics(self) -> str:
+        """按配置导出指标到文件，返回写入路径（未配置返回空串）。"""
+        cfg = self.cfg()
+        path = str(cfg.get("metrics_dump_path", "") or "").strip()
+        if not path:
+            return ""
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(__file__), path)
+        fmt = str(cfg.get("metrics_dump_format", "json")).lower()
+        dump_metrics(self._stats_snapshot(), path, fmt)
+        return path
+
+    async def _metrics_dump_loop(self) -> None:
+        while True:
+            await asyncio.sleep(max(5.0, float(self.cfg().get("metrics_dump_interval", 60))))
+            try:
+                self._dump_metrics()
+            except Exception:
+                logger.warning("[qqgal] dump metrics failed", exc_info=True)
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("qqgal_stats")
+    async def show_stats(self, event: AstrMessageEvent):
+        """管理员：查看各阶段耗时分位数、计数器与缓存命中率。/qqgal_stats dump 立即导出到 metrics_dump_path。"""
+        snap = self._stats_snapshot()
+        lines = [f"qqgal 指标（运行 {int(snap['uptime_s'])}s）", "阶段耗时（ms）："]
+        for name, h in snap["timings"].items():
+            lines.append(
+                f"  {name}: n={h['count']} p50={h['p50'] * 1000:.0f} p95={h['p95'] * 1000:.0f} "
+                f"p99={h['p99'] * 1000:.0f} max={h['max'] * 1000:.0f}"
+            )
+        if snap["sizes"]:
+            lines.append("大小（KB）：")
+            for name, h in snap["sizes"].items():
+                lines.append(f"  {name}: n={h['count']} p50={h['p50'] / 1024:.0f} p95={h['p95'] / 1024:.0f} max={h['max'] / 1024:.0f}")
+        if snap["counters"]:
+            lines.append("计数：" + "，".join(f"{k}={v}" for k, v in snap["counters"].items()))
+        lines.append("缓存命中率：" + "，".join(
+            f"{k}={v['hit_rate'] * 100:.0f}%" for k, v in snap["caches"].items() if "hit_rate" in v
+        ))
+        ex = snap["executor"]
+        lines.append(f"图像执行器：{ex['mode']} x{ex['workers']}，队列 {ex['queue_depth']}（峰值 {ex['max_queue_depth']}）")
+        lim = snap["limiter"]
+        lines.append(f"限流：放行 {lim['allowed']}，拒绝 " + "，".join(f"{k}={v}" for k, v in lim["rejected"].items()))
+        if "dump" in (event.message_str or ""):
+            try:
+                path = self._dump_metrics()
+                lines.append(f"已导出到 {path}" if path else "未配置 metrics_dump_path，未导出")
+            except Exception as e:
+                lines.append(f"导出失败：{e}")
+        yield event.plain_result("\n".join(lines))
+
+    async def _active_group_members(self, event: AstrMessageEvent, limit: int) -> List[tuple[str, str]]:
+        """OneBot get_group_member_list，按最后发言时间倒序取前 limit 人（排除机器人自身）。"""
+        group_id = event.get_group_id() if hasattr(event, "get_group_id") else ""
+        client = getattr(event, "bot", None)
+        if not group_id or client is None or event.get_platform_name() != "aiocqhttp":
+            return []
+        try:
+            members = await client.api.call_action("get_group_member_list", group_id=int(group_id))
+        except Exception:
+            logger.debug("[qqgal] get_group_member_list failed", exc_info=True)
+            return []
+        if isinstance(members, dict):
+            members = members.get("data") or []
+        self_id = str(event.get_self_id())
+        rows = []
+        for m in members or []:
+            if not isinstance(m, dict):
+                continue
+            uid = str(m.get("user_id") or "")
+            if not uid or uid == self_id:
+                continue
+            nick = m.get("card") or m.get("nickname") or uid
+            rows.append((int(m.get("last_sent_time") or 0), uid, str(nick)))
+        rows.sort(reverse=True)
+        return [(uid, nick) for _, uid, nick in rows[:max(1, limit)]]
+
     @filter.event_message_type(filter.EventMessageType.ALL)
     async def _fallback_any(self, event: AstrMessageEvent):
         """兼容某些平台在消息前插入 reply 等组件导致命令未命中的情况。
@@ -849,4 +1775,25 @@ class QQGalPlugin(Star):
             logger.error("[qqgal] fallback handler failed", exc_info=True)
 
     async def terminate(self):
-        pass
+        if self._bg_task is not None:
+            self._bg_task.cancel()
+        for t in self._gen_workers:
+            t.cancel()
+        for t in list(self._avatar_tasks.values()):
+            t.cancel()
+        if self._metrics_task is not None:
+            self._metrics_task.cancel()
+            try:
+                self._dump_metrics()
+            except Exception:
+                pass
+        self._image_executor.shutdown()
+        if self._option_cache is not None:
+            self._option_cache.close()
+        if self._page_pool is not None:
+            try:
+                await self._page_pool.close()
+            except Exception:
+                pass
+        if self._http is not None and not self._http.closed:
+            await self._http.close()
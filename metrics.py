@@ -0,0 +1,121 @@
+"""进程内指标：分阶段耗时直方图、计数器与字节大小，可导出 JSON / Prometheus 文本。"""
+
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List
+import json
+import re
+import time
+
+from .cache import atomic_write
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _quantile(sorted_vals: List[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    idx = min(len(sorted_vals) - 1, max(0, int(round(q * (len(sorted_vals) - 1)))))
+    return sorted_vals[idx]
+
+
+class Histogram:
+    """保留最近 window 个样本计算分位数，count/sum/max 为全量累计。"""
+
+    __slots__ = ("count", "total", "max", "_window")
+
+    def __init__(self, window: int = 1024):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._window: Deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self._window.append(value)
+
+    def summary(self) -> Dict[str, float]:
+        vals = sorted(self._window)
+        out = {"count": self.count, "sum": self.total, "max": self.max}
+        for q in QUANTILES:
+            out[f"p{int(q * 100)}"] = _quantile(vals, q)
+        return out
+
+
+class Metrics:
+    """阶段耗时（秒）、字节大小与计数器。单事件循环内使用，无需加锁。"""
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self.started = time.time()
+        self._timings: Dict[str, Histogram] = {}
+        self._sizes: Dict[str, Histogram] = {}
+        self._counters: Dict[str, int] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        h = self._timings.get(stage)
+        if h is None:
+            h = self._timings[stage] = Histogram(self.window)
+        h.observe(seconds)
+
+    def size(self, name: str, nbytes: int) -> None:
+        h = self._sizes.get(name)
+        if h is None:
+            h = self._sizes[name] = Histogram(self.window)
+        h.observe(float(nbytes))
+
+    def incr(self, name: str, n: int = 1) -> None:
+        self._counters[name] = self._counters.get(name, 0) + n
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """计时代码块（可包住 await）；异常同样计入。"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - t0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "timings": {k: v.summary() for k, v in sorted(self._timings.items())},
+            "sizes": {k: v.summary() for k, v in sorted(self._sizes.items())},
+            "counters": dict(sorted(self._counters.items())),
+        }
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def to_prometheus(snap: Dict[str, Any], prefix: str = "qqgal") -> str:
+    """按 Prometheus 文本格式导出：耗时与大小为 summary，计数器为 counter，gauges 为 gauge。"""
+    lines: List[str] = []
+    for kind, unit in (("timings", "seconds"), ("sizes", "bytes")):
+        metric = f"{prefix}_stage_{unit}" if kind == "timings" else f"{prefix}_size_{unit}"
+        lines.append(f"# TYPE {metric} summary")
+        for name, s in snap.get(kind, {}).items():
+            label = f'stage="{name}"' if kind == "timings" else f'name="{name}"'
+            for q in QUANTILES:
+                lines.append(f'{metric}{{{label},quantile="{q}"}} {s[f"p{int(q * 100)}"]:.6g}')
+            lines.append(f"{metric}_sum{{{label}}} {s['sum']:.6g}")
+            lines.append(f"{metric}_count{{{label}}} {s['count']}")
+    for name, v in snap.get("counters", {}).items():
+        metric = f"{prefix}_{_metric_name(name)}_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {v}")
+    for name, v in snap.get("gauges", {}).items():
+        if isinstance(v, (int, float)):
+            metric = f"{prefix}_{_metric_name(name)}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {v:.6g}")
+    return "\n".join(lines) + "\n"
+
+
+def dump(snap: Dict[str, Any], path: str, fmt: str = "json") -> None:
+    """原子写入指标快照（json 或 prometheus）。"""
+    text = to_prometheus(snap) if fmt == "prometheus" else json.dumps(snap, ensure_ascii=False, indent=2)
+    atomic_write(path, text.encode("utf-8"))
@@ -0,0 +1,133 @@
+"""LLM 选项结果的持久缓存（SQLite）。
+
+同一条引用/梗图在群里反复 /选项 时，直接返回缓存的选项，省掉 LLM 往返。
+key = H(引用文本, 选项数, 提示词模板, 供应商, 模型)，每个 key 最多保留 variety 组结果：
+不足 variety 组时照常调用 LLM 并追加一组，凑满后按最久未用轮换返回，
+既避免延迟/费用，又不至于每次答案都一样。
+
+条目超过 ttl 过期；总行数超过 max_rows 时按最近使用淘汰。
+每次操作都是毫秒级的单条语句，直接在事件循环线程内执行。
+"""
+
+from typing import Any, Dict, List, Optional
+import json
+import os
+import sqlite3
+import time
+
+from astrbot.api import logger
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS options (
+    key     TEXT    NOT NULL,
+    variant INTEGER NOT NULL,
+    options TEXT    NOT NULL,
+    created REAL    NOT NULL,
+    used    REAL    NOT NULL,
+    PRIMARY KEY (key, variant)
+);
+CREATE INDEX IF NOT EXISTS options_used ON options (used);
+"""
+
+
+class OptionCache:
+    def __init__(self, path: str, ttl: float, max_rows: int = 2000, variety: int = 3):
+        self.path = path
+        self.ttl = max(0.0, float(ttl))
+        self.max_rows = max(1, int(max_rows))
+        self.variety = max(1, int(variety))
+        self.hits = 0
+        self.misses = 0
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        if self._db is None:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                db = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.executescript(_SCHEMA)
+                self._db = db
+            except Exception:
+                logger.error("[qqgal] open option cache failed: %s", self.path, exc_info=True)
+                return None
+        return self._db
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """variety 组已凑满时返回最久未用的一组并标记使用；否则返回 None（应调用 LLM 再 put）。"""
+        db = self._conn()
+        if db is None:
+            return None
+        now = time.time()
+        try:
+            rows = db.execute(
+                "SELECT variant, options FROM options WHERE key = ? AND created >= ? ORDER BY used ASC",
+                (key, now - self.ttl),
+            ).fetchall()
+            if len(rows) < self.variety:
+                self.misses += 1
+                return None
+            variant, payload = rows[0]
+            db.execute("UPDATE options SET used = ? WHERE key = ? AND variant = ?", (now, key, variant))
+            self.hits += 1
+            return list(json.loads(payload))
+        except Exception:
+            logger.warning("[qqgal] option cache read failed", exc_info=True)
+            return None
+
+    def put(self, key: str, options: List[str]) -> None:
+        """追加一组结果：替换已过期或最久未用的槽位，保持每个 key 至多 variety 组。"""
+        db = self._conn()
+        if db is None:
+            return
+        now = time.time()
+        try:
+            rows = db.execute(
+                "SELECT variant, created FROM options WHERE key = ? ORDER BY used ASC", (key,)
+            ).fetchall()
+            taken = {v for v, _ in rows}
+            expired = [v for v, created in rows if created < now - self.ttl]
+            free = [v for v in range(self.variety) if v not in taken]
+            slot = expired[0] if expired else (free[0] if free else rows[0][0])
+            db.execute(
+                "INSERT OR REPLACE INTO options (key, variant, options, created, used) VALUES (?, ?, ?, ?, ?)",
+                (key, slot, json.dumps(list(options), ensure_ascii=False), now, now),
+            )
+            self._evict(db, now)
+        except Exception:
+            logger.warning("[qqgal] option cache write failed", exc_info=True)
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        db.execute("DELETE FROM options WHERE created < ?", (now - self.ttl,))
+        (count,) = db.execute("SELECT COUNT(*) FROM options").fetchone()
+        if count > self.max_rows:
+            db.execute(
+                "DELETE FROM options WHERE rowid IN (SELECT rowid FROM options ORDER BY used ASC LIMIT ?)",
+                (count - self.max_rows,),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        rows = 0
+        db = self._db
+        if db is not None:
+            try:
+                (rows,) = db.execute("SELECT COUNT(*) FROM options").fetchone()
+            except Exception:
+                pass
+        total = self.hits + self.misses
+        return {
+            "rows": rows,
+            "max_rows": self.max_rows,
+            "variety": self.variety,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+    def close(self) -> None:
+        db, self._db = self._db, None
+        if db is not None:
+            try:
+                db.close()
+            except Exception:
+                pass
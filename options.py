@@ -0,0 +1,93 @@
+"""LLM 选项输出的增量解析。
+
+要求模型严格按“A. 选项内容”逐行输出；流式响应边到边按行校验，
+凑齐所需代号即可提前结束读取并开始渲染。格式不对的行不计入，
+缺少的代号由调用方定向补问。
+"""
+
+from typing import Dict, List, Optional
+import re
+
+# 代号 + 分隔符 + 内容；兼容 1./1、/(A) 等常见变体
+_LINE_RE = re.compile(r"^\(?(?P<label>[A-Za-z]|\d{1,2})\s*[.．、:：)）]\s*(?P<text>.+)$")
+# 行首的列表/强调/引号标记（模型偶尔包进 markdown 或 JSON 数组）
+_LEAD_RE = re.compile(r"^(?:[-*•>#\s]+|\*\*|[\"'“「\[])+")
+_TRAIL_RE = re.compile(r"(?:\*\*|[\"'”」\],，]|\s)+$")
+
+
+class OptionCollector:
+    """按代号收集选项：feed() 返回 True 表示所需代号已全部有效到达。"""
+
+    def __init__(self, letters: List[str], max_len: int = 80):
+        self.letters = list(letters)
+        self.max_len = max(1, int(max_len))
+        self._got: Dict[str, str] = {}
+        self._buf = ""
+        # 未能识别代号的非空行（补问仍失败时作为兜底）
+        self.extra: List[str] = []
+        self.rejected = 0
+
+    @property
+    def done(self) -> bool:
+        return len(self._got) >= len(self.letters)
+
+    def feed(self, chunk: str) -> bool:
+        if self.done:
+            return True
+        self._buf += chunk or ""
+        *lines, self._buf = self._buf.split("\n")
+        for ln in lines:
+            self._line(ln)
+            if self.done:
+                break
+        return self.done
+
+    def finish(self) -> bool:
+        """流结束：处理最后一行（可能没有换行符）。"""
+        if self._buf and not self.done:
+            self._line(self._buf)
+        self._buf = ""
+        return self.done
+
+    def _line(self, raw: str) -> None:
+        ln = _TRAIL_RE.sub("", _LEAD_RE.sub("", raw.strip()))
+        if not ln:
+            return
+        m = _LINE_RE.match(ln)
+        if m is None:
+            self.extra.append(ln)
+            return
+        label = m.group("label")
+        if label.isdigit():
+            idx = int(label) - 1
+            label = chr(ord("A") + idx) if 0 <= idx < 26 else ""
+        label = label.upper()
+        text = _TRAIL_RE.sub("", m.group("text").strip())
+        # 非所需代号、重复代号、空内容或与已有选项重复的行都不计入
+        if label not in self.letters or label in self._got or not text or text in self._got.values():
+            self.rejected += 1
+            return
+        self._got[label] = text[: self.max_len]
+
+    def get(self, label: str) -> Optional[str]:
+        return self._got.get(label)
+
+    def missing(self) -> List[str]:
+        return [c for c in self.letters if c not in self._got]
+
+    def merge(self, other: "OptionCollector") -> None:
+        for label in self.missing():
+            text = other.get(label)
+            if text and text not in self._got.values():
+                self._got[label] = text
+
+    def options(self, pad: str = "……") -> List[str]:
+        """按代号顺序输出“A. 内容”；仍缺的先用未识别行补，再用占位补齐。"""
+        extra = [t for t in self.extra if t not in self._got.values()]
+        out = []
+        for label in self.letters:
+            text = self._got.get(label)
+            if text is None:
+                text = extra.pop(0)[: self.max_len] if extra else pad
+            out.append(f"{label}. {text}")
+        return out
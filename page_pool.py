@@ -0,0 +1,314 @@
+"""常驻无头浏览器页面池（render_backend = "pool"，需要 playwright + chromium）。
+
+html_render 每次都要启动渲染、新建页面、解析整份 HTML 并重新解码内联的 base64 图片。
+这里常驻一个 Chromium 与 size 个预热页面：
+    - 页面预先载入静态样式外壳（render.html_css）与渲染脚本；
+    - 背景/头像/立绘按内容哈希注册一次（转为 blob URL 并预解码），之后只传键；
+    - 每次渲染只推送 CSS 变量、画面标记（名字/台词/选项）与素材键，然后截图。
+
+并发上限即页面数（空闲页面队列）；每页渲染 recycle_after 次后关闭重建以限制内存；
+取用页面时做健康检查（浏览器连接、页面状态，再以 2s 超时执行一次脚本探测），
+页面异常/卡死或浏览器断开时丢弃重建，浏览器重启加锁只进行一次；
+建页与渲染同样限时，出错/回收后的关闭与重建都在后台进行，不阻塞本次渲染返回。未安装 playwright 时 available() 为 False，由调用方回退 html_render。
+"""
+
+from typing import Any, Dict, List
+import asyncio
+import hashlib
+import time
+
+from astrbot.api import logger
+
+try:
+    from playwright.async_api import async_playwright
+except ImportError:  # 可选依赖
+    async_playwright = None
+
+# 页面内的渲染脚本：素材注册表（LRU，blob URL + 已解码的 Image 常驻）与 render(payload)
+_PAGE_JS = """
+window.__qqgal = (() => {
+  const assets = new Map();
+  const MAX = %(max_assets)d;
+  async function register(key, dataUrl) {
+    if (assets.has(key)) return;
+    const blob = await (await fetch(dataUrl)).blob();
+    const url = URL.createObjectURL(blob);
+    const img = new Image();
+    img.src = url;
+    try { await img.decode(); } catch (e) {}
+    assets.set(key, {url, img});
+    while (assets.size > MAX) {
+      const [k, v] = assets.entries().next().value;
+      URL.revokeObjectURL(v.url);
+      assets.delete(k);
+    }
+  }
+  function use(key) {
+    const a = assets.get(key);
+    assets.delete(key);
+    assets.set(key, a);
+    return a.url;
+  }
+  async function render(p) {
+    const missing = Object.values(p.assets).filter(k => k && !assets.has(k));
+    if (missing.length) return missing;
+    const css = document.getElementById('qqgal-css');
+    if (css.textContent !== p.css) css.textContent = p.css;
+    const root = document.documentElement.style;
+    for (const [k, v] of Object.entries(p.vars)) root.setProperty(k, v);
+    for (const [name, key] of Object.entries(p.assets)) {
+      if (name !== 'char') root.setProperty('--' + name, key ? `url('${use(key)}')` : 'none');
+    }
+    document.body.innerHTML = p.roots;
+    if (p.assets.char) {
+      const src = use(p.assets.char);
+      document.querySelectorAll('img.char').forEach(i => { i.src = src; });
+    }
+    await Promise.all([...document.images].map(i => i.decode().catch(() => {})));
+    return [];
+  }
+  return {register, render, size: () => assets.size};
+})();
+"""
+
+_SHELL = "<html><head><meta charset='utf-8'/><style id='qqgal-css'></style></head><body></body></html>"
+
+
+def available() -> bool:
+    return async_playwright is not None
+
+
+class _Slot:
+    __slots__ = ("page", "browser", "renders", "created")
+
+    def __init__(self, page: Any, browser: Any = None):
+        self.page = page
+        # 创建该页面的浏览器实例；浏览器重启后旧页面一律视为不健康
+        self.browser = browser
+        self.renders = 0
+        self.created = time.monotonic()
+
+
+class PagePool:
+    def __init__(self, size: int = 2, recycle_after: int = 200, width: int = 1280, height: int = 720, max_assets: int = 48):
+        self.size = max(1, int(size))
+        self.recycle_after = max(1, int(recycle_after))
+        self.width = int(width)
+        self.height = int(height)
+        self.max_assets = max(4, int(max_assets))
+        self._pw: Any = None
+        self._browser: Any = None
+        self._idle: asyncio.Queue | None = None
+        self._start_lock = asyncio.Lock()
+        self._launch_lock = asyncio.Lock()
+        # 取用页面时脚本探测的超时（秒）
+        self.probe_timeout = 2.0
+        # 后台任务（关闭页面/重建页面），持有引用防止被回收，close() 时取消
+        self._tasks: set = set()
+        # 启动失败（如未安装 chromium）后的冷却，期间直接失败由调用方回退
+        self._start_failed_at = 0.0
+        self.retry_after = 300.0
+        self.renders = 0
+        self.recycled = 0
+        self.failures = 0
+        self.unhealthy = 0
+        self.relaunched = 0
+        self.registered = 0
+
+    async def _launch(self) -> Any:
+        """返回可用的浏览器；断开时重启。并发取用共用一次重启，旧进程先关闭，避免泄漏。"""
+        async with self._launch_lock:
+            if self._pw is None:
+                self._pw = await async_playwright().start()
+            if self._browser is None or not self._browser.is_connected():
+                old, self._browser = self._browser, None
+                if old is not None:
+                    try:
+                        await old.close()
+                    except Exception:
+                        pass
+                    self.relaunched += 1
+                self._browser = await self._pw.chromium.launch(args=["--disable-dev-shm-usage"])
+                logger.info("[qqgal] renderer pool: chromium started (%d pages)", self.size)
+            return self._browser
+
+    async def _new_slot(self, timeout: float) -> _Slot:
+        """新建预热页面，整体限时 timeout（浏览器卡死时启动/建页也会卡住）；失败时半成品页面转入后台关闭。"""
+        pages: List[Any] = []
+
+        async def build() -> _Slot:
+            browser = await self._launch()
+            page = await browser.new_page(viewport={"width": self.width, "height": self.height})
+            pages.append(page)
+            await page.set_content(_SHELL)
+            await page.add_script_tag(content=_PAGE_JS % {"max_assets": self.max_assets})
+            return _Slot(page, browser)
+
+        try:
+            return await asyncio.wait_for(build(), timeout)
+        except BaseException:
+            for page in pages:
+                self._discard(_Slot(page))
+            raise
+
+    def _spawn(self, coro: Any) -> None:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _refill(self, idle: asyncio.Queue, timeout: float) -> None:
+        """后台重建一个页面放回空闲队列，失败则放回占位（取用时经健康检查再重建）。
+
+        空闲队列中的槽位总数始终为 size，并发上限不变；调用方不等待重建。
+        """
+        async def run() -> None:
+            try:
+                slot = await self._new_slot(timeout)
+            except Exception as e:
+                logger.warning("[qqgal] renderer pool: recreate page failed: %r", e)
+                slot = _Slot(_ClosedPage())
+            idle.put_nowait(slot)
+
+        self._spawn(run())
+
+    async def start(self, timeout: float = 30.0) -> None:
+        async with self._start_lock:
+            if self._idle is not None:
+                return
+            if async_playwright is None:
+                raise RuntimeError("playwright not installed")
+            if self._start_failed_at and time.monotonic() - self._start_failed_at < self.retry_after:
+                raise RuntimeError("renderer pool unavailable (recent start failure)")
+            idle: asyncio.Queue = asyncio.Queue()
+            try:
+                for _ in range(self.size):
+                    idle.put_nowait(await self._new_slot(timeout))
+            except Exception:
+                self._start_failed_at = time.monotonic()
+                while not idle.empty():
+                    self._discard(idle.get_nowait())
+                raise
+            self._start_failed_at = 0.0
+            self._idle = idle
+
+    def _discard(self, slot: _Slot) -> None:
+        """后台关闭页面（限时），调用方不等待：卡死的页面连关闭也可能卡住。"""
+        page = slot.page
+
+        async def close() -> None:
+            try:
+                await asyncio.wait_for(page.close(), self.probe_timeout)
+            except Exception:
+                pass
+
+        self._spawn(close())
+
+    async def _healthy(self, slot: _Slot) -> bool:
+        try:
+            if (
+                slot.browser is None or slot.browser is not self._browser
+                or not slot.browser.is_connected() or slot.page.is_closed()
+            ):
+                return False
+            # 卡死/崩溃的渲染进程在这里以短超时暴露，而不是等到正式渲染的 30s 超时
+            return bool(await asyncio.wait_for(slot.page.evaluate("() => !!window.__qqgal"), self.probe_timeout))
+        except Exception:
+            return False
+
+    @staticmethod
+    def _key(data_url: str) -> str:
+        """素材内容键。每次按内容计算（2MB 立绘约 3ms），不在 Python 侧按 data-url 字符串备忘，
+        以免在 asset_cache_mb 预算之外常驻大字符串；去重由页面内按键的素材 LRU 完成。"""
+        return hashlib.blake2b(data_url.encode("utf-8"), digest_size=12).hexdigest()
+
+    async def _draw(self, page: Any, payload: Dict[str, Any], out_path: str, quality: int) -> None:
+        keys = {name: (self._key(url) if url else "") for name, url in payload["assets"].items()}
+        keyed = dict(payload, assets=keys)
+        by_key = {keys[name]: url for name, url in payload["assets"].items() if url}
+        height = self.height * max(1, int(payload["pages"]))
+        if (page.viewport_size or {}).get("height") != height:
+            await page.set_viewport_size({"width": self.width, "height": height})
+        missing: List[str] = await page.evaluate("p => window.__qqgal.render(p)", keyed)
+        if missing:
+            # 本页面首次见到的素材：注册（传输 + 解码一次）后重试
+            for key in missing:
+                await page.evaluate("([k, u]) => window.__qqgal.register(k, u)", [key, by_key[key]])
+                self.registered += 1
+            missing = await page.evaluate("p => window.__qqgal.render(p)", keyed)
+            if missing:
+                raise RuntimeError(f"assets not registered: {missing}")
+        await page.screenshot(path=out_path, type="jpeg", quality=int(quality), full_page=True)
+
+    async def render(self, payload: Dict[str, Any], out_path: str, quality: int = 85, timeout: float = 30.0) -> str:
+        """渲染 render.pool_payload() 的输出并截图为 JPEG，返回 out_path。"""
+        await self.start(timeout)
+        idle = self._idle
+        slot = await idle.get()
+        ok = False
+        try:
+            if not await self._healthy(slot):
+                self.unhealthy += 1
+                self._discard(slot)
+                # 重建失败时由 finally 处理占位，不重复关闭旧页面
+                slot = _Slot(_ClosedPage())
+                slot = await self._new_slot(timeout)
+            await asyncio.wait_for(self._draw(slot.page, payload, out_path, quality), timeout)
+            slot.renders += 1
+            self.renders += 1
+            ok = True
+            return out_path
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            if ok and slot.renders < self.recycle_after:
+                idle.put_nowait(slot)
+            else:
+                # 出错或达到回收阈值：关闭并在后台重建（限制单页内存增长），本次渲染不等待
+                if ok:
+                    self.recycled += 1
+                self._discard(slot)
+                self._refill(idle, timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "started": self._idle is not None,
+            "renders": self.renders,
+            "recycled": self.recycled,
+            "failures": self.failures,
+            "unhealthy": self.unhealthy,
+            "relaunched": self.relaunched,
+            "assets_registered": self.registered,
+        }
+
+    async def close(self) -> None:
+        idle, self._idle = self._idle, None
+        for task in list(self._tasks):
+            task.cancel()
+        if idle is not None:
+            # 页面随浏览器一并关闭
+            while not idle.empty():
+                idle.get_nowait()
+        try:
+            if self._browser is not None:
+                await asyncio.wait_for(self._browser.close(), 10)
+        except Exception:
+            pass
+        try:
+            if self._pw is not None:
+                await self._pw.stop()
+        except Exception:
+            pass
+        self._browser = self._pw = None
+
+
+class _ClosedPage:
+    """页面重建失败时的占位，is_closed() 恒为 True，取用时触发重建。"""
+
+    def is_closed(self) -> bool:
+        return True
+
+    async def close(self) -> None:
+        pass
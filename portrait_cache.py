@@ -0,0 +1,162 @@
+"""立绘内容寻址缓存：manifest + 原图保留 + 按体积淘汰。
+
+charactert/ 目录结构：
+    <qq>-matte.png          当前使用的立绘（渲染热路径只读这个文件）
+    raw/<gen_key>.png       Gemini 原图，按生成输入寻址，可在不调 Gemini 的情况下重新抠图
+    manifest.json           qq -> 生成该立绘的输入摘要
+
+gen_key   = H(头像字节哈希, 提示词模板, 生图端点/模型, 背景色)
+matte_key = H(gen_key, 背景色, 容差, 标准画布尺寸)
+任一输入变化即可判定缓存过期：仅抠图参数变化时用保留的原图重抠，
+头像/提示词/模型变化时需要重新生图。
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+import time
+
+from astrbot.api import logger
+
+from .cache import atomic_write
+
+
+def digest(*parts: Any) -> str:
+    h = hashlib.sha1()
+    for p in parts:
+        h.update(str(p).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()[:16]
+
+
+def bytes_digest(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+class PortraitStore:
+    def __init__(self, dirp: str, max_bytes: int):
+        self.dirp = dirp
+        self.raw_dir = os.path.join(dirp, "raw")
+        self.max_bytes = max(0, int(max_bytes))
+        self._manifest_fp = os.path.join(dirp, "manifest.json")
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        try:
+            os.makedirs(self.raw_dir, exist_ok=True)
+        except Exception:
+            pass
+        self._load()
+
+    # -- manifest -----------------------------------------------------------
+
+    def _load(self) -> None:
+        try:
+            with open(self._manifest_fp, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self._entries = {str(k): v for k, v in data.items() if isinstance(v, dict)}
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.warning("[qqgal] portrait manifest unreadable, starting fresh", exc_info=True)
+
+    def _save(self) -> None:
+        try:
+            atomic_write(self._manifest_fp, json.dumps(self._entries, ensure_ascii=False).encode("utf-8"))
+        except Exception:
+            logger.error("[qqgal] save portrait manifest failed", exc_info=True)
+
+    def entry(self, qq: str) -> Dict[str, Any]:
+        return dict(self._entries.get(str(qq)) or {})
+
+    def update(self, qq: str, **fields: Any) -> None:
+        ent = self._entries.setdefault(str(qq), {})
+        ent.update(fields)
+        ent["updated"] = time.time()
+        self._save()
+
+    def remove(self, qq: str) -> None:
+        if self._entries.pop(str(qq), None) is not None:
+            self._save()
+
+    # -- 原图 ---------------------------------------------------------------
+
+    def raw_path(self, gen_key: str) -> str:
+        return os.path.join(self.raw_dir, f"{gen_key}.png")
+
+    def read_raw(self, gen_key: str) -> bytes:
+        if not gen_key:
+            return b""
+        try:
+            with open(self.raw_path(gen_key), "rb") as f:
+                return f.read()
+        except OSError:
+            return b""
+
+    def touch(self, fp: str, min_interval: float = 3600.0) -> None:
+        """记录一次读取（仅更新 atime，不改 mtime，避免内存 data-url 缓存失效）。"""
+        try:
+            st = os.stat(fp)
+            now = time.time()
+            if now - st.st_atime >= min_interval:
+                os.utime(fp, ns=(time.time_ns(), st.st_mtime_ns))
+        except OSError:
+            pass
+
+    # -- 淘汰 ---------------------------------------------------------------
+
+    def _files(self) -> List[Tuple[float, int, str]]:
+        out = []
+        for d in (self.dirp, self.raw_dir):
+            try:
+                names = os.listdir(d)
+            except OSError:
+                continue
+            for name in names:
+                if not name.endswith(".png"):
+                    continue
+                fp = os.path.join(d, name)
+                try:
+                    st = os.stat(fp)
+                except OSError:
+                    continue
+                out.append((max(st.st_atime, st.st_mtime), st.st_size, fp))
+        return out
+
+    def evict(self, keep: Optional[List[str]] = None) -> int:
+        """charactert/ 总体积超过上限时，按最近访问时间从旧到新删除，返回删除的文件数。"""
+        if self.max_bytes <= 0:
+            return 0
+        files = self._files()
+        total = sum(sz for _, sz, _ in files)
+        if total <= self.max_bytes:
+            return 0
+        keep_set = set(keep or [])
+        removed = 0
+        for _, sz, fp in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if fp in keep_set:
+                continue
+            try:
+                os.remove(fp)
+            except OSError:
+                continue
+            total -= sz
+            removed += 1
+            name = os.path.basename(fp)
+            if name.endswith("-matte.png"):
+                self._entries.pop(name[: -len("-matte.png")], None)
+        if removed:
+            self._save()
+            logger.info("[qqgal] portrait cache evicted %d files, now %d KB", removed, total // 1024)
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        files = self._files()
+        return {
+            "entries": len(self._entries),
+            "files": len(files),
+            "bytes": sum(sz for _, sz, _ in files),
+            "max_bytes": self.max_bytes,
+        }
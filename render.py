@@ -0,0 +1,364 @@
+"""场景渲染：HTML 模板（交给 html_render）与纯 Pillow 合成两种后端。
+
+两种后端共享同一份场景描述（scene dict）与布局计算，保证输出一致：
+    width/height, bg_url, bg_blur_url, bg_blur_filter, char_url, char_is_png,
+    char_x_offset, char_bottom_offset, char_scale, avatar, name, quote, options,
+    quality, font_path
+图片字段均为 data-url（Pillow 后端要求 avatar 也为 data-url）。
+"""
+
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+import base64
+import hashlib
+import html as html_lib
+
+from PIL import Image, ImageChops, ImageDraw, ImageFilter
+
+from .layout import OPTION_PAD_X, QUOTE_HEAD, QUOTE_PAD_TOP, layout_step, load_font
+
+
+def scene_digest(scene: Dict[str, Any], backend: str = "") -> str:
+    """场景（合成输入）的内容哈希，用作渲染结果缓存键；相同输入的两种后端输出确定。"""
+    h = hashlib.sha1(backend.encode("utf-8"))
+    for k in sorted(scene):
+        v = scene[k]
+        h.update(k.encode("utf-8"))
+        h.update(b"\x00")
+        h.update("\x01".join(map(str, v)).encode("utf-8") if isinstance(v, (list, tuple)) else str(v).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def paginate(scene: Dict[str, Any], steps: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """为每幅画面计算布局；选项一页放不下时拆成多页（章节标题加页码，选中项按页重映射）。
+
+    返回 [(画面, 布局)]，两种后端按此顺序纵向拼接。
+    """
+    width, height = int(scene["width"]), int(scene["height"])
+    font_path = str(scene.get("font_path") or "")
+    out = []
+    for step in steps:
+        options = tuple(step.get("options") or [])
+        pages = layout_step(width, height, font_path, step.get("quote") or "", options)
+        if len(pages) == 1:
+            out.append((step, pages[0]))
+            continue
+        chosen = step.get("chosen")
+        chapter = step.get("chapter") or "CHAPTER"
+        for p, lay in enumerate(pages):
+            off, cnt = lay["option_offset"], len(lay["options"])
+            page = dict(
+                step,
+                options=list(options[off:off + cnt]),
+                chosen=chosen - off if chosen is not None and off <= chosen < off + cnt else None,
+                chapter=f"{chapter} ({p + 1}/{len(pages)})",
+            )
+            out.append((page, lay))
+    return out
+
+
+def html_css(width: int, height: int) -> str:
+    """静态样式外壳：只依赖画布尺寸；素材与立绘参数经 CSS 变量注入（见 _html_vars）。"""
+    return f"""
+  body {{ margin:0; width:{width}px; height:calc({height}px * var(--pages, 1)); font-family: 'Microsoft Yahei', sans-serif; }}
+  .root {{ position:relative; width:{width}px; height:{height}px; background:#000; overflow:hidden; }}
+  /* 两层背景：底层模糊铺满，顶层等比完整展示，保证任意比例都好看 */
+  .bg-blur {{ position:absolute; inset:0; background-image:var(--bg-blur, none); background-size:cover; background-position:center; filter:var(--bg-filter, none); transform:scale(1.06); z-index:0; }}
+  .bg-main {{ position:absolute; inset:0; background-image:var(--bg, none); background-repeat:no-repeat; background-size:contain; background-position:center; z-index:0; }}
+  .topbar {{ position:absolute; left:24px; top:18px; color:#fff; font-weight:700; letter-spacing:1px; text-shadow:0 2px 6px rgba(0,0,0,.6); }}
+  /* 人物立绘：底部居中，宽度按比例缩放 */
+  .char {{ position:absolute; left:calc(50% + var(--char-x, 0px)); transform:translateX(-50%); bottom:var(--char-bottom, 0px); width:var(--char-w, {int(width * 0.42)}px); height:auto; object-fit:contain; mix-blend-mode:var(--char-blend, normal); filter: drop-shadow(0 8px 24px rgba(0,0,0,.45)); opacity:var(--char-opacity, 0); z-index: 1; pointer-events:none; }}
+  /* 引用内容容器：自身不加毛玻璃，由下方 .glass 提供延伸到底部的模糊背景；位置/字号由布局计算，逐行输出 */
+  .quote {{ position:absolute; left:50%; transform:translateX(-50%); padding:{QUOTE_PAD_TOP}px 22px 22px 22px; color:#fff; font-weight:800; border-radius:16px; background:transparent; text-align:center; z-index:3; }}
+  .glass {{ position:absolute; background:rgba(0,0,0,.25); backdrop-filter: blur(10px); border-radius:18px; box-shadow:0 10px 30px rgba(0,0,0,.35); z-index:2; }}
+  .q-avatar {{ position:absolute; left:16px; top:16px; width:56px; height:56px; border-radius:50%; border:2px solid rgba(255,255,255,.8); background-image:var(--avatar, none); background-size:cover; background-position:center; box-shadow:0 4px 12px rgba(0,0,0,.4); z-index:3; }}
+  .q-user {{ position:absolute; left:88px; top:22px; font-size:22px; font-weight:800; color:#fff; text-shadow:0 2px 6px rgba(0,0,0,.6); z-index:3; }}
+  .q-text {{ margin-top:{QUOTE_HEAD}px; font-weight:900; color:#fff; text-align:center; white-space:nowrap; z-index:3; position:relative; }}
+  /* 选项胶囊：位置/宽度/字号由布局计算（多列/缩放/分页），文本已按宽度折行 */
+  .option {{ position:absolute; box-sizing:border-box; padding-left:{OPTION_PAD_X}px; padding-right:{OPTION_PAD_X}px; background:rgba(0,0,0,.55); color:#f0f0f0; border-radius:28px; text-align:center; font-weight:800; letter-spacing:1px; white-space:nowrap; overflow:hidden; box-shadow:0 8px 20px rgba(0,0,0,.35); border:1px solid rgba(255,255,255,.15); z-index:3; }}
+  /* 连续剧情中被选中的分支 */
+  .option.chosen {{ background:rgba(255,255,255,.82); color:#222; border-color:rgba(255,255,255,.9); }}
+"""
+
+
+# 以 url() 形式注入的素材变量 -> scene 字段
+HTML_ASSET_VARS = (("--bg", "bg_url"), ("--bg-blur", "bg_blur_url"), ("--avatar", "avatar"))
+
+
+def _html_vars(scene: Dict[str, Any], pages: int) -> Dict[str, str]:
+    """除图片素材外的 CSS 变量（立绘位置/缩放/混合、页数）。"""
+    width = int(scene["width"])
+    return {
+        "--pages": str(pages),
+        "--bg-filter": str(scene.get("bg_blur_filter") or "none"),
+        "--char-x": f"{int(scene.get('char_x_offset', 0))}px",
+        "--char-bottom": f"{int(scene.get('char_bottom_offset', 0))}px",
+        "--char-w": f"{int(width * float(scene.get('char_scale', 0.42)))}px",
+        "--char-blend": "normal" if scene.get("char_is_png") else "multiply",
+        "--char-opacity": "1" if scene.get("char_url") else "0",
+    }
+
+
+def _html_root(scene: Dict[str, Any], step: Dict[str, Any], lay: Dict[str, Any], char_url: Optional[str] = None) -> str:
+    """一幅画面的标记；step 提供 quote/options/chosen/chapter，lay 为 layout_step 的一页布局。"""
+    char_url = (scene.get("char_url") or "") if char_url is None else char_url
+    # 对外部/用户内容进行 HTML 转义，避免注入
+    safe_name = html_lib.escape(scene.get("name") or "")
+    safe_quote = "<br/>".join(html_lib.escape(ln) for ln in lay["quote_lines"])
+    chosen = step.get("chosen")
+    chapter = html_lib.escape(step.get("chapter") or "CHAPTER")
+    size, line_h, pad_y = lay["option_size"], lay.get("option_line_h", 0), lay.get("option_pad_y", 0)
+    opts = []
+    for i, o in enumerate(lay["options"]):
+        text = "<br/>".join(html_lib.escape(ln) for ln in o["lines"])
+        opts.append(
+            f"<div class='option{' chosen' if i == chosen else ''}' style='left:{o['x']}px; top:{o['y']}px; "
+            f"width:{o['w']}px; height:{o['h']}px; padding-top:{pad_y}px; font-size:{size}px; line-height:{line_h}px;'>"
+            f"{text}</div>"
+        )
+    return f"""
+  <div class='root'>
+    <div class='bg-blur'></div>
+    <div class='bg-main'></div>
+    <div class='topbar'>{chapter}</div>
+    <img class='char' src='{char_url}' />
+    <div class='glass' style='left:{lay["glass_left"]}px; top:{lay["glass_top"]}px; width:{lay["glass_w"]}px; height:{lay["glass_h"]}px;'></div>
+    <div class='quote' style='top:{lay["quote_top"]}px; width:{lay["quote_w"]}px;'>
+      <div class='q-avatar'></div>
+      <div class='q-user'>{safe_name}</div>
+      <div class='q-text' style='font-size:{lay["quote_size"]}px; line-height:{lay["quote_line_h"]}px;'>{safe_quote}</div>
+    </div>
+    {''.join(opts)}
+  </div>"""
+
+
+def build_html(scene: Dict[str, Any]) -> str:
+    """构建交给 html_render 的 HTML 文档（选项过多时为分页长图）。"""
+    return build_storyboard_html(scene, [scene])
+
+
+def build_storyboard_html(scene: Dict[str, Any], steps: List[Dict[str, Any]]) -> str:
+    """连续剧情：多幅画面纵向拼接为一张长图。
+
+    各画面共用同一套背景/立绘/头像（样式只出现一次，浏览器对同一图片只解码一次），
+    只有台词与选项不同，一次 html_render 完成全部画面。
+    """
+    pages = paginate(scene, steps)
+    roots = "".join(_html_root(scene, step, lay) for step, lay in pages)
+    css_vars = dict(_html_vars(scene, len(pages)))
+    for var, field in HTML_ASSET_VARS:
+        css_vars[var] = f"url('{scene.get(field) or ''}')"
+    root_css = "; ".join(f"{k}: {v}" for k, v in css_vars.items())
+    return f"""
+<html>
+<head>
+<meta charset='utf-8'/>
+<style>{html_css(int(scene["width"]), int(scene["height"]))}
+  :root {{ {root_css}; }}
+</style>
+</head>
+<body>{roots}
+</body>
+</html>
+"""
+
+
+def pool_payload(scene: Dict[str, Any], steps: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """常驻页面池（page_pool）的渲染输入：只含动态部分。
+
+    图片素材（背景/模糊底图/头像/立绘）以 data-url 单独给出，由页面池按内容注册一次后复用，
+    标记中的立绘 src 留空，由页面脚本填入已注册的素材。
+    """
+    pages = paginate(scene, steps)
+    assets = {var[2:]: scene.get(field) or "" for var, field in HTML_ASSET_VARS}
+    assets["char"] = scene.get("char_url") or ""
+    return {
+        "css": html_css(int(scene["width"]), int(scene["height"])),
+        "vars": _html_vars(scene, len(pages)),
+        "assets": assets,
+        "roots": "".join(_html_root(scene, step, lay, char_url="") for step, lay in pages),
+        "pages": len(pages),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Pillow 合成后端
+# ---------------------------------------------------------------------------
+
+
+def _decode_data_url(url: Optional[str]) -> Optional[Image.Image]:
+    if not url or not url.startswith("data:") or "," not in url:
+        return None
+    try:
+        return Image.open(BytesIO(base64.b64decode(url.split(",", 1)[1])))
+    except Exception:
+        return None
+
+
+def _cover(img: Image.Image, w: int, h: int) -> Image.Image:
+    scale = max(w / img.width, h / img.height)
+    img = img.resize((max(w, round(img.width * scale)), max(h, round(img.height * scale))), Image.BILINEAR)
+    left = (img.width - w) // 2
+    top = (img.height - h) // 2
+    return img.crop((left, top, left + w, top + h))
+
+
+def _draw_text_center(draw: ImageDraw.ImageDraw, cx: float, top: float, text: str, font, fill, spacing: float = 0.0, shadow: bool = False):
+    w = font.getlength(text) + spacing * max(0, len(text) - 1)
+    x = cx - w / 2
+    _draw_text(draw, x, top, text, font, fill, spacing, shadow)
+
+
+def _draw_text(draw: ImageDraw.ImageDraw, x: float, top: float, text: str, font, fill, spacing: float = 0.0, shadow: bool = False):
+    if shadow:
+        _draw_text(draw, x, top + 2, text, font, (0, 0, 0, 150), spacing)
+    if not spacing:
+        draw.text((x, top), text, font=font, fill=fill)
+        return
+    for ch in text:
+        draw.text((x, top), ch, font=font, fill=fill)
+        x += font.getlength(ch) + spacing
+
+
+def _overlay(canvas: Image.Image, img: Image.Image, x: int, y: int) -> None:
+    """alpha 合成，允许 img 超出画布边界（alpha_composite 不接受负偏移）。"""
+    layer = Image.new("RGBA", canvas.size, (0, 0, 0, 0))
+    layer.paste(img, (x, y))
+    canvas.alpha_composite(layer)
+
+
+def _round_mask(size: Tuple[int, int], radius: int) -> Image.Image:
+    mask = Image.new("L", size, 0)
+    ImageDraw.Draw(mask).rounded_rectangle((0, 0, size[0] - 1, size[1] - 1), radius=radius, fill=255)
+    return mask
+
+
+def _compose_backdrop(scene: Dict[str, Any]) -> Image.Image:
+    """背景 + 立绘（与台词/选项无关的部分）。"""
+    width = int(scene["width"])
+    height = int(scene["height"])
+    canvas = Image.new("RGBA", (width, height), (0, 0, 0, 255))
+
+    # 背景：底层 cover + 模糊，顶层 contain 居中
+    blur_src = _decode_data_url(scene.get("bg_blur_url"))
+    if blur_src is not None:
+        bw, bh = int(width * 1.06), int(height * 1.06)
+        blur = _cover(blur_src.convert("RGB"), bw, bh)
+        if (scene.get("bg_blur_filter") or "none") != "none":
+            blur = blur.filter(ImageFilter.GaussianBlur(18))
+            blur = Image.eval(blur, lambda v: int(v * 0.7))
+        canvas.paste(blur, ((width - bw) // 2, (height - bh) // 2))
+    main_src = _decode_data_url(scene.get("bg_url"))
+    if main_src is not None:
+        main = main_src.convert("RGB")
+        scale = min(width / main.width, height / main.height)
+        main = main.resize((max(1, round(main.width * scale)), max(1, round(main.height * scale))), Image.BILINEAR)
+        canvas.paste(main, ((width - main.width) // 2, (height - main.height) // 2))
+
+    # 人物立绘：底部居中 + 水平偏移，宽度按比例缩放
+    char = _decode_data_url(scene.get("char_url"))
+    if char is not None:
+        char = char.convert("RGBA")
+        cw = max(1, int(width * float(scene.get("char_scale", 0.42))))
+        ch = max(1, round(char.height * cw / char.width))
+        char = char.resize((cw, ch), Image.BILINEAR)
+        cx = width / 2 + int(scene.get("char_x_offset", 0))
+        x = int(round(cx - cw / 2))
+        y = height - int(scene.get("char_bottom_offset", 0)) - ch
+        # drop-shadow(0 8px 24px rgba(0,0,0,.45))
+        shadow_alpha = char.getchannel("A").point(lambda v: int(v * 0.45)).filter(ImageFilter.GaussianBlur(12))
+        shadow = Image.new("RGBA", char.size, (0, 0, 0, 0))
+        shadow.putalpha(shadow_alpha)
+        _overlay(canvas, shadow, x, y + 8)
+        if scene.get("char_is_png", True):
+            _overlay(canvas, char, x, y)
+        else:
+            region = canvas.crop((x, y, x + cw, y + ch)).convert("RGB")
+            canvas.paste(ImageChops.multiply(region, char.convert("RGB")), (x, y))
+    return canvas
+
+
+def _compose_overlay(canvas: Image.Image, scene: Dict[str, Any], step: Dict[str, Any], lay: Dict[str, Any], avatar: Optional[Image.Image]) -> None:
+    """在 backdrop 上绘制章节标题、毛玻璃、引用块与选项；step 提供 chosen/chapter，文字与位置取自布局 lay。"""
+    width = int(scene["width"])
+    height = int(scene["height"])
+    font_path = str(scene.get("font_path") or "")
+    draw = ImageDraw.Draw(canvas)
+    _draw_text(draw, 24, 18, step.get("chapter") or "CHAPTER", load_font(font_path, 16), (255, 255, 255, 255), spacing=1, shadow=True)
+
+    # 毛玻璃：裁剪区域模糊 + 半透明黑
+    gl, gt, gw, gh = lay["glass_left"], lay["glass_top"], lay["glass_w"], lay["glass_h"]
+    gh_vis = max(0, min(gh, height - gt))
+    if gw > 0 and gh_vis > 0:
+        region = canvas.crop((gl, gt, gl + gw, gt + gh_vis)).filter(ImageFilter.GaussianBlur(10))
+        region = Image.alpha_composite(region, Image.new("RGBA", region.size, (0, 0, 0, 64)))
+        canvas.paste(region, (gl, gt), _round_mask((gw, gh), 18).crop((0, 0, gw, gh_vis)))
+
+    # 引用块：头像、昵称、正文
+    box_w = lay["quote_w"] + 44
+    box_l = (width - box_w) // 2
+    qt = lay["quote_top"]
+    if avatar is not None:
+        av = _cover(avatar.convert("RGB"), 56, 56)
+        ring = Image.new("RGBA", (60, 60), (0, 0, 0, 0))
+        ImageDraw.Draw(ring).ellipse((0, 0, 59, 59), fill=(255, 255, 255, 204))
+        canvas.alpha_composite(ring, (box_l + 16, qt + 16))
+        mask = Image.new("L", (56, 56), 0)
+        ImageDraw.Draw(mask).ellipse((0, 0, 55, 55), fill=255)
+        canvas.paste(av, (box_l + 18, qt + 18), mask)
+    draw = ImageDraw.Draw(canvas)
+    _draw_text(draw, box_l + 88, qt + 22, scene.get("name") or "", load_font(font_path, 22), (255, 255, 255, 255), shadow=True)
+    qsize, line_h = lay["quote_size"], lay["quote_line_h"]
+    qfont = load_font(font_path, qsize)
+    y = qt + QUOTE_PAD_TOP + QUOTE_HEAD
+    for ln in lay["quote_lines"]:
+        _draw_text_center(draw, width / 2, y + (line_h - qsize) / 2, ln, qfont, (255, 255, 255, 255))
+        y += line_h
+
+    # 选项胶囊
+    osize = lay["option_size"]
+    ofont = load_font(font_path, osize)
+    o_line_h, pad_y = lay.get("option_line_h", 0), lay.get("option_pad_y", 0)
+    chosen = step.get("chosen")
+    for i, o in enumerate(lay["options"]):
+        ow, oh = o["w"], o["h"]
+        pill = Image.new("RGBA", (ow, oh), (0, 0, 0, 0))
+        pd = ImageDraw.Draw(pill)
+        if i == chosen:
+            fill, outline, color = (255, 255, 255, 209), (255, 255, 255, 230), (34, 34, 34, 255)
+        else:
+            fill, outline, color = (0, 0, 0, 140), (255, 255, 255, 38), (240, 240, 240, 255)
+        pd.rounded_rectangle((0, 0, ow - 1, oh - 1), radius=min(28, oh // 2), fill=fill, outline=outline, width=1)
+        canvas.alpha_composite(pill, (o["x"], o["y"]))
+        draw = ImageDraw.Draw(canvas)
+        for j, ln in enumerate(o["lines"]):
+            top = o["y"] + pad_y + j * o_line_h + (o_line_h - osize) / 2
+            _draw_text_center(draw, o["x"] + ow / 2, top, ln, ofont, color, spacing=1)
+
+
+def composite_jpeg(scene: Dict[str, Any]) -> bytes:
+    """纯 Pillow 复刻 build_html 的版式，返回 JPEG 字节（选项过多时为分页长图）。可在进程池中执行。"""
+    return composite_storyboard_jpeg(scene, [scene])
+
+
+def composite_storyboard_jpeg(scene: Dict[str, Any], steps: List[Dict[str, Any]]) -> bytes:
+    """连续剧情长图：背景/立绘/头像只解码、合成一次，每幅画面只重绘台词与选项。"""
+    width = int(scene["width"])
+    height = int(scene["height"])
+    pages = paginate(scene, steps)
+    backdrop = _compose_backdrop(scene)
+    avatar = _decode_data_url(scene.get("avatar"))
+    if len(pages) == 1:
+        step, lay = pages[0]
+        _compose_overlay(backdrop, scene, step, lay, avatar)
+        sheet = backdrop.convert("RGB")
+    else:
+        sheet = Image.new("RGB", (width, height * len(pages)), (0, 0, 0))
+        for i, (step, lay) in enumerate(pages):
+            canvas = backdrop.copy()
+            _compose_overlay(canvas, scene, step, lay, avatar)
+            sheet.paste(canvas.convert("RGB"), (0, i * height))
+    buf = BytesIO()
+    sheet.save(buf, format="JPEG", quality=int(scene.get("quality", 85)))
+    return buf.getvalue()